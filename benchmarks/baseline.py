@@ -0,0 +1,47 @@
+# Baseline helpers shared by the benchmark scripts. 
+#
+# A baseline is a JSON file mapping each benchmark name to its result. Later runs 
+# are compared against it, and a benchmark regresses when it is worse than the 
+# baseline by more than the tolerance.
+
+import json
+
+
+def add_baseline_arguments(parser):
+
+    # Adds the --save, --compare and --tolerance options to an argument parser. 
+    parser.add_argument("--save", default=None, help="write the results to a baseline JSON file")
+    parser.add_argument("--compare", default=None, help="compare the results with a baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed change for the worse against the baseline, as a fraction")
+
+
+def compare_with_baseline(results, baseline, tolerance, lower_is_better=()):
+
+    # Compares results against a baseline, returning the names of regressed benchmarks. 
+    # Results are higher-is-better unless their name is in `lower_is_better`.
+    regressions = []
+    for name, value in results.items():
+        if not baseline.get(name):
+            continue
+        change = value / baseline[name] - 1
+        print(f"{name:<40} {change:>+8.1%} against baseline")
+        if (change > tolerance) if name in lower_is_better else (change < -tolerance):
+            regressions.append(name)
+    return regressions
+
+
+def check_baseline(results, args, lower_is_better=()):
+
+    # Saves and compares results as requested on the command line, returning the exit code. 
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r") as file:
+            regressions = compare_with_baseline(results, json.load(file), args.tolerance, lower_is_better)
+        if regressions:
+            print(f"Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            return 1
+
+    return 0
@@ -0,0 +1,214 @@
+# Offline end-to-end benchmark for the browser engine. 
+#
+# Runs standard procedure workloads against a local HTTP fixture site, by default 
+# with an in-process fake WebDriver so that the engine's own overhead is measured 
+# without a browser. Reports steps (stages) per second, per-command latency 
+# percentiles and peak Python memory for each workload, and compares the results 
+# with a saved baseline.
+#
+# Usage:
+#   python benchmarks/bench_engine.py
+#   python benchmarks/bench_engine.py --workloads lookup variables --save engine_baseline.json
+#   python benchmarks/bench_engine.py --compare engine_baseline.json
+#   python benchmarks/bench_engine.py --driver Chrome --repeat 1
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import browser_engine
+from baseline import add_baseline_arguments, check_baseline
+from fake_webdriver import FakeWebDriver
+from fixture_site import start_fixture_server
+
+
+def navigation_workload(base_url, browser):
+
+    # Many page loads, each followed by a readiness check. 
+    lines = [f"start {browser}"]
+    for number in range(50):
+        lines += [f'goto "{base_url}/page/{number}"', "waitfor ready", 'waitfor title "Fixture page"']
+    return lines + ["quit"]
+
+
+def fetch_workload(base_url, browser):
+
+    # The pages of the navigation workload read with fetch instead of a browser navigation. 
+    lines = [f"start {browser}", f'goto "{base_url}/page/0"']
+    for number in range(50):
+        lines += [f'fetch [var]page "{base_url}/page/{number}"', "var last_page [var]page"]
+    return lines + ["quit"]
+
+
+def extract_workload(base_url, browser):
+
+    # The table rows of 20 pages, 1,000 rows in all, read with extract and following the next link. 
+    lines = [f"start {browser}", f'goto "{base_url}/page/1"']
+    lines += [f'extract ".row" "{os.devnull}" name=".name" price=".price" link=".link@href" next="#next" pages=20']
+    return lines + ["quit"]
+
+
+def lookup_workload(base_url, browser):
+
+    # Runs of element lookups followed by actions on the elements found. 
+    lines = [f"start {browser}", f'goto "{base_url}/page/1"']
+    for _ in range(50):
+        lines += [
+            'gi [var]search_input "search_input"',
+            'gn [var]search_name "q"',
+            'gc [var]first_row "row"',
+            'gs [var]next_link "#next"',
+            "gx [var]search_button '//*[@id=\"search_button\"]'",
+            'type [var]search_input "Lorem ipsum"',
+        ]
+    return lines + ["quit"]
+
+
+def variable_workload(base_url, browser):
+
+    # Variable assignments and references, with little browser traffic. 
+    lines = [f'var base_uri "{base_url}/page/1"', f"start {browser}"]
+    for number in range(200):
+        lines += [f'var value_{number % 20} "value {number}"', f"var copy_{number % 20} [var]value_{number % 20}", "var target_uri [var]base_uri"]
+    return lines + ["goto [var]target_uri", "quit"]
+
+
+def long_file_workload(base_url, browser):
+
+    # A long procedure mixing every kind of step, with comments and blank lines. 
+    lines = [f"start {browser}", f'goto "{base_url}/page/1"']
+    for number in range(2500):
+        lines += [
+            f"// Step {number}.",
+            f'var query "query {number}"',
+            'gi [var]search_input "search_input"',
+            "type [var]search_input [var]query",
+            "",
+        ]
+    return lines + ["quit"]
+
+
+# Standard workloads, by name. 
+WORKLOADS = {
+    "navigation": navigation_workload,
+    "fetch": fetch_workload,
+    "extract": extract_workload,
+    "lookup": lookup_workload,
+    "variables": variable_workload,
+    "long_file": long_file_workload,
+}
+
+
+def percentile(values, fraction):
+
+    # Returns the nearest-rank percentile of a list of values. 
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_quietly(file_path):
+
+    # Executes a procedure file. Stage records are switched off in `main`, as in production runs. 
+    browser_engine.variable_dictionary.clear()
+    browser_engine.exec_proc_from_file(file_path)
+
+
+def bench_workload(file_path, repeat, directory):
+
+    # Measures one workload: throughput, per-command latencies and peak memory. 
+
+    # Warms the compiled procedure cache, so only execution is measured. 
+    steps = len(browser_engine.compile_proc_file(file_path))
+    run_quietly(file_path)
+
+    # Throughput, best of `repeat` runs. 
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        run_quietly(file_path)
+        timings.append(time.perf_counter() - start_time)
+
+    # Per-command latencies, from a traced run. 
+    trace_path = os.path.join(directory, "trace.jsonl")
+    browser_engine.start_trace(trace_path, "jsonl")
+    try:
+        run_quietly(file_path)
+    finally:
+        browser_engine.stop_trace()
+    latencies = {}
+    with open(trace_path, "r") as file:
+        for line in file:
+            event = json.loads(line)
+            latencies.setdefault(f"{event['type']}:{event['name']}", []).append(event["duration"] * 1000)
+
+    # Peak Python memory, from a separate run as tracing memory slows execution. 
+    tracemalloc.start()
+    try:
+        run_quietly(file_path)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "steps": steps,
+        "steps_per_sec": steps / min(timings),
+        "peak_memory_kb": peak_memory / 1024,
+        "latency_ms": {name: {"count": len(values), "p50": percentile(values, 0.5), "p90": percentile(values, 0.9), "p99": percentile(values, 0.99)}
+                       for name, values in sorted(latencies.items())},
+    }
+
+
+def print_report(name, report):
+
+    # Prints the results of one workload. 
+    print(f"{name}: {report['steps']} steps, {report['steps_per_sec']:,.0f} steps/sec, peak memory {report['peak_memory_kb']:,.0f} KB")
+    for command, latency in report["latency_ms"].items():
+        print(f"    {command:<28} n={latency['count']:<6} p50={latency['p50']:.3f} ms  p90={latency['p90']:.3f} ms  p99={latency['p99']:.3f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs offline end-to-end benchmarks of the browser engine.")
+    parser.add_argument("--workloads", nargs="+", choices=sorted(WORKLOADS), default=list(WORKLOADS), help="workloads to run")
+    parser.add_argument("--driver", default="Fake", help="browser to run against, Fake for the in-process fake driver (default)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per workload, the fastest is reported")
+    parser.add_argument("--stage-log", action="store_true", help="measure with the record of each executed stage switched on")
+    parser.add_argument("--metrics", action="store_true", help="measure with the metrics registry switched on")
+    add_baseline_arguments(parser)
+    args = parser.parse_args(argv)
+
+    browser_engine.configure_logging("info" if args.stage_log else "warning", output=os.devnull, stages=args.stage_log)
+    if args.metrics:
+        browser_engine.configure_metrics()
+    browser_engine.register_web_driver("Fake", FakeWebDriver)
+    server, base_url = start_fixture_server()
+    results = {}
+    lower_is_better = []
+
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            browser_engine.proc_cache_directory = directory
+            for name in args.workloads:
+                file_path = os.path.join(directory, f"{name}.proc")
+                with open(file_path, "w") as file:
+                    file.write("\n".join(WORKLOADS[name](base_url, args.driver)) + "\n")
+
+                report = bench_workload(file_path, args.repeat, directory)
+                print_report(name, report)
+
+                results[f"{name}.steps_per_sec"] = report["steps_per_sec"]
+                results[f"{name}.peak_memory_kb"] = report["peak_memory_kb"]
+                lower_is_better.append(f"{name}.peak_memory_kb")
+    finally:
+        server.shutdown()
+
+    return check_baseline(results, args, lower_is_better)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
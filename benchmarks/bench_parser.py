@@ -0,0 +1,108 @@
+# Parser throughput benchmark for the browser engine. 
+#
+# Measures lines per second for parse_proc_line and parse_proc_file on synthetic 
+# procedures from 1K to 1M lines. Results can be saved as a baseline and later 
+# runs compared against it, failing if throughput drops by more than the tolerance.
+#
+# Usage:
+#   python benchmarks/bench_parser.py
+#   python benchmarks/bench_parser.py --sizes 1000 10000 --save parser_baseline.json
+#   python benchmarks/bench_parser.py --compare parser_baseline.json --tolerance 0.2
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import browser_engine
+from baseline import add_baseline_arguments, check_baseline
+
+# Default procedure sizes, in lines. 
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+
+# Representative lines, cycled to build the synthetic procedures. 
+SYNTHETIC_LINES = [
+    "// Synthetic procedure line.",
+    'var target_uri "https://lorem.ipsum/dolor?page=1"',
+    "start Chrome",
+    "goto [var]target_uri",
+    "waitfor visible css \".content > p:nth-child(56) > strong\" 5",
+    'gi [var]search_box "searchbox_input"',
+    "gx [var]search_button '//*[@id=\"searchbox_homepage\"]/div/div/div/button'",
+    'type [var]search_box "Lorem \\"ipsum\\" dolor sit amet"',
+    "click [var]search_button",
+    "wait 0.5",
+    "",
+    "quit",
+]
+
+
+def synthetic_lines(count):
+
+    # Returns a list of `count` procedure lines built from SYNTHETIC_LINES. 
+    return [SYNTHETIC_LINES[index % len(SYNTHETIC_LINES)] for index in range(count)]
+
+
+def best_time(function, repeat):
+
+    # Returns the fastest of `repeat` timed calls of a function. 
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start_time)
+    return min(timings)
+
+
+def bench_parse_proc_line(size, repeat):
+
+    # Measures lines per second for parse_proc_line over an in-memory procedure. 
+    lines = [line for line in synthetic_lines(size) if line and not line.startswith("//")]
+
+    def run():
+        for line in lines:
+            browser_engine.parse_proc_line(line)
+
+    return len(lines) / best_time(run, repeat)
+
+
+def bench_parse_proc_file(size, repeat):
+
+    # Measures lines per second for parse_proc_file over a procedure file. 
+    with tempfile.NamedTemporaryFile("w", suffix=".proc", delete=False) as file:
+        file.write("\n".join(synthetic_lines(size)) + "\n")
+    try:
+        return size / best_time(lambda: browser_engine.parse_proc_file(file.name), repeat)
+    finally:
+        os.remove(file.name)
+
+
+def run_benchmarks(sizes, repeat):
+
+    # Runs every benchmark at every size, printing each result as it completes. 
+    results = {}
+    for name, benchmark in (("parse_proc_line", bench_parse_proc_line), ("parse_proc_file", bench_parse_proc_file)):
+        for size in sizes:
+            # Larger procedures are timed once, their run time is already long enough to be stable. 
+            lines_per_second = benchmark(size, repeat if size <= 100000 else 1)
+            results[f"{name}[{size}]"] = lines_per_second
+            print(f"{name:<16} {size:>9} lines  {lines_per_second:>12,.0f} lines/sec")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measures parser throughput of the browser engine.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="procedure sizes in lines")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark, the fastest is reported")
+    add_baseline_arguments(parser)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.sizes, args.repeat)
+    return check_baseline(results, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
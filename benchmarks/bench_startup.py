@@ -0,0 +1,116 @@
+# Process startup benchmark for the browser engine.
+#
+# Measures the wall time of short command line invocations which never start a
+# browser: `--help`, `check` and `compile`, each run in a fresh process with
+# `python -m browser_engine`. The time of a bare interpreter is measured too, and
+# each command is also reported as its overhead above it. Fails if Selenium is
+# imported by a command which does not start a browser.
+#
+# Usage:
+#   python benchmarks/bench_startup.py
+#   python benchmarks/bench_startup.py --repeat 20 --save startup_baseline.json
+#   python benchmarks/bench_startup.py --compare startup_baseline.json --tolerance 0.3
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from baseline import add_baseline_arguments, check_baseline
+
+SOURCE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+# Procedure used by the check and compile commands.
+STARTUP_PROCEDURE = "\n".join([
+    'var target_uri "https://lorem.ipsum/dolor?page=1"',
+    "start Chrome",
+    "goto [var]target_uri",
+    'gi [var]search_box "searchbox_input"',
+    'type [var]search_box "Lorem ipsum"',
+    "quit",
+]) + "\n"
+
+# Prints whether Selenium was imported by a command, run in place of `python -m browser_engine`.
+SELENIUM_PROBE = (
+    "import runpy, sys\n"
+    "sys.argv = ['browser_engine'] + sys.argv[1:]\n"
+    "try:\n"
+    "    runpy.run_module('browser_engine', run_name='__main__')\n"
+    "except SystemExit:\n"
+    "    pass\n"
+    "print('selenium' in sys.modules, file=sys.stderr)\n"
+)
+
+
+def median_time(command, repeat, environment):
+
+    # Returns the median wall time of `repeat` runs of a command, in milliseconds.
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        subprocess.run(command, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        timings.append((time.perf_counter() - start_time) * 1000)
+    return statistics.median(timings)
+
+
+def imports_selenium(arguments, environment):
+
+    # Returns whether running the engine with the given arguments imports Selenium.
+    result = subprocess.run([sys.executable, "-c", SELENIUM_PROBE] + arguments, env=environment,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=False)
+    return result.stderr.strip().splitlines()[-1:] == ["True"]
+
+
+def run_benchmarks(repeat):
+
+    # Runs every command, printing each result as it completes.
+    environment = dict(os.environ, PYTHONPATH=SOURCE_DIRECTORY)
+    environment.pop("PYTHONDONTWRITEBYTECODE", None)
+
+    with tempfile.NamedTemporaryFile("w", suffix=".proc", delete=False) as file:
+        file.write(STARTUP_PROCEDURE)
+
+    try:
+        commands = {
+            "help": ["--help"],
+            "check": ["check", file.name],
+            "compile": ["compile", file.name],
+        }
+
+        # Compiles the engine once, so every timed run loads its cached bytecode.
+        subprocess.run([sys.executable, "-m", "browser_engine", "--help"], env=environment, stdout=subprocess.DEVNULL, check=False)
+
+        results = {"interpreter": median_time([sys.executable, "-c", "pass"], repeat, environment)}
+        print(f"{'interpreter':<12} {results['interpreter']:>8.1f} ms")
+
+        selenium_commands = []
+        for name, arguments in commands.items():
+            elapsed = median_time([sys.executable, "-m", "browser_engine"] + arguments, repeat, environment)
+            results[name] = elapsed
+            print(f"{name:<12} {elapsed:>8.1f} ms  {elapsed - results['interpreter']:>+8.1f} ms over the interpreter")
+            if imports_selenium(arguments, environment):
+                selenium_commands.append(name)
+    finally:
+        os.remove(file.name)
+
+    return results, selenium_commands
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measures process startup of the browser engine's command line.")
+    parser.add_argument("--repeat", type=int, default=10, help="timed runs per command, the median is reported")
+    add_baseline_arguments(parser)
+    args = parser.parse_args(argv)
+
+    results, selenium_commands = run_benchmarks(args.repeat)
+    if selenium_commands:
+        print(f"Selenium imported by: {', '.join(selenium_commands)}")
+        return 1
+    return check_baseline(results, args, lower_is_better=set(results))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+# In-process fake WebDriver for the benchmark scripts. 
+#
+# Implements the part of the Selenium WebDriver interface used by the browser 
+# engine. Pages are fetched over HTTP and indexed, so lookups succeed or fail 
+# as they would in a browser, but nothing is rendered and no browser is started. 
+# This lets the engine's own overhead be measured.
+
+import re
+import urllib.request
+from html.parser import HTMLParser
+
+from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.common.by import By
+
+import browser_engine
+
+
+# Elements which have no end tag. 
+VOID_ELEMENTS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+
+class FakeWebElement:
+
+    # An element of a fake page. 
+
+    def __init__(self, driver, tag, attributes, text="", parent=None):
+        self.driver = driver
+        self.tag_name = tag
+        self.attributes = attributes
+        self.text = text
+        self.parent = parent
+
+    def is_inside(self, ancestor):
+        parent = self.parent
+        while parent is not None:
+            if parent is ancestor:
+                return True
+            parent = parent.parent
+        return False
+
+    def get_attribute(self, name):
+        return self.attributes.get(name)
+
+    def send_keys(self, *values):
+        self.attributes["value"] = self.attributes.get("value", "") + "".join(str(value) for value in values)
+
+    def click(self):
+        if self.attributes.get("href"):
+            self.driver.get(urllib.request.urljoin(self.driver.current_url, self.attributes["href"]))
+
+    def is_displayed(self):
+        return True
+
+    def is_enabled(self):
+        return True
+
+
+class PageIndex(HTMLParser):
+
+    # Collects the elements of a page by tag, id, name and class, with their parents. 
+
+    def __init__(self, driver):
+        super().__init__()
+        self.driver = driver
+        self.elements = []
+        self.open_elements = []
+        self.title = ""
+        self.in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        element = FakeWebElement(self.driver, tag, dict(attrs), parent=self.open_elements[-1] if self.open_elements else None)
+        self.elements.append(element)
+        if tag not in VOID_ELEMENTS:
+            self.open_elements.append(element)
+        self.in_title = tag == "title"
+
+    def handle_endtag(self, tag):
+        self.in_title = False
+        for index in range(len(self.open_elements) - 1, -1, -1):
+            if self.open_elements[index].tag_name == tag:
+                del self.open_elements[index:]
+                break
+
+    def handle_data(self, data):
+        if self.in_title:
+            self.title += data
+        elif self.elements:
+            self.elements[-1].text += data.strip()
+
+
+class FakeSwitchTo:
+
+    # Window switching for a fake driver with a single window. 
+
+    def window(self, handle):
+        pass
+
+
+class FakeWebDriver:
+
+    # A fake driver which fetches pages over HTTP without rendering them. 
+
+    def __init__(self):
+        self.current_url = "about:blank"
+        self.title = ""
+        self.elements = []
+        self.cookies = {}
+        self.window_handles = ["main"]
+        self.switch_to = FakeSwitchTo()
+
+    def get(self, url):
+        self.current_url = url
+        self.elements = []
+        self.title = ""
+        if url.startswith("http"):
+            with urllib.request.urlopen(url) as response:
+                index = PageIndex(self)
+                index.feed(response.read().decode())
+            self.elements = index.elements
+            self.title = index.title
+
+    def matches(self, element, by, value):
+        attributes = element.attributes
+        if by == By.ID:
+            return attributes.get("id") == value
+        if by == By.NAME:
+            return attributes.get("name") == value
+        if by == By.CLASS_NAME:
+            return value in (attributes.get("class") or "").split()
+        if by == By.CSS_SELECTOR:
+            # Supports the simple selectors used by the workloads: #id, .class and tag. 
+            if value.startswith("#"):
+                return attributes.get("id") == value[1:]
+            if value.startswith("."):
+                return value[1:] in (attributes.get("class") or "").split()
+            return element.tag_name == value
+        if by == By.XPATH:
+            identifier = re.search(r"@id=[\"']([^\"']+)[\"']", value)
+            return identifier is None or attributes.get("id") == identifier.group(1)
+        return False
+
+    def find_elements(self, by=By.ID, value=None):
+        return [element for element in self.elements if self.matches(element, by, value)]
+
+    def find_element(self, by=By.ID, value=None):
+        elements = self.find_elements(by, value)
+        if not elements:
+            raise NoSuchElementException(f"No element matching {by} {value!r}")
+        return elements[0]
+
+    def execute_script(self, script, *args):
+        if script == browser_engine.BATCH_LOOKUP_SCRIPT:
+            by = {"id": By.ID, "name": By.NAME, "class": By.CLASS_NAME, "css": By.CSS_SELECTOR, "xpath": By.XPATH}
+            return [next(iter(self.find_elements(by[strategy], value)), None) for strategy, value in args[0]]
+        if "document.readyState" in script:
+            return "complete"
+        if "navigator.userAgent" in script:
+            return "FakeWebDriver/1.0"
+        if script == browser_engine.EXTRACT_SCRIPT:
+            return self.extract(*args)
+        if script == browser_engine.EXTRACT_WAIT_SCRIPT:
+            # Pages are loaded synchronously, so the next page is always ready. 
+            return True
+        return None
+
+    def extract(self, row_selector, fields, next_selector):
+        rows = []
+        for row in self.find_elements(By.CSS_SELECTOR, row_selector):
+            record = []
+            for selector, attribute in fields:
+                element = row if not selector else next((element for element in self.elements 
+                                                         if element.is_inside(row) and self.matches(element, By.CSS_SELECTOR, selector)), None)
+                if element is None:
+                    record.append(None)
+                else:
+                    record.append(element.get_attribute(attribute) if attribute else element.text)
+            rows.append(record)
+        next_link = next(iter(self.find_elements(By.CSS_SELECTOR, next_selector)), None) if next_selector else None
+        if next_link is not None:
+            next_link.click()
+        return {"rows": rows, "next": next_link is not None}
+
+    def implicitly_wait(self, duration):
+        pass
+
+    def delete_all_cookies(self):
+        self.cookies.clear()
+
+    def get_cookies(self):
+        return [{"name": name, "value": value} for name, value in self.cookies.items()]
+
+    def close(self):
+        pass
+
+    def quit(self):
+        pass
@@ -0,0 +1,119 @@
+# Local HTTP fixture site for the benchmark scripts. 
+#
+# Serves generated pages on 127.0.0.1 so that workloads run without touching 
+# the network. Every page has the same layout: a search form, a table of rows 
+# and a link to the next page.
+#
+#   /page/<n>        HTML page number n
+#   /data/<n>.json   JSON document number n
+#   /headers         JSON object of the request headers
+#   /redirect        Redirects to the path given as ?to=, with the ?status= given (302)
+#   /loop            Redirects to itself
+#
+# Any GET takes ?delay=<seconds> to answer slowly, and ?gzip=1 to answer gzip compressed.
+
+import gzip
+import json
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Number of table rows on each fixture page. 
+FIXTURE_ROWS = 50
+
+
+def fixture_page(number):
+
+    # Returns the HTML of fixture page `number`. 
+    rows = "\n".join(
+        f'<tr class="row"><td class="name">Item {number}-{index}</td><td class="price">{index}.99</td>'
+        f'<td><a class="link" href="/page/{index}">Open</a></td></tr>'
+        for index in range(FIXTURE_ROWS)
+    )
+    return f"""<!DOCTYPE html>
+<html>
+<head><title>Fixture page {number}</title></head>
+<body>
+<form id="search_form" action="/page/{number + 1}">
+<input id="search_input" name="q" class="search-box" type="text">
+<button id="search_button" class="button" type="submit">Search</button>
+</form>
+<div class="content"><p id="intro">Fixture page {number}.</p></div>
+<table id="items">
+{rows}
+</table>
+<a id="next" class="next" href="/page/{number + 1}">Next</a>
+</body>
+</html>
+"""
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+
+    # Serves the fixture pages and JSON documents. 
+
+    protocol_version = "HTTP/1.1"
+
+    # Sends each response without waiting on delayed acknowledgements, as a keep-alive 
+    # production server would. 
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        path, _, query = self.path.partition("?")
+        options = dict(urllib.parse.parse_qsl(query))
+        time.sleep(float(options.get("delay", 0)))
+
+        page = re.fullmatch(r"/page/(\d+)", path)
+        data = re.fullmatch(r"/data/(\d+)\.json", path)
+        if page:
+            self.send_body(fixture_page(int(page.group(1))).encode(), "text/html; charset=utf-8", options)
+        elif data:
+            self.send_body(json.dumps({"id": int(data.group(1)), "items": list(range(FIXTURE_ROWS))}).encode(), "application/json", options)
+        elif path == "/headers":
+            self.send_body(json.dumps(dict(self.headers.items())).encode(), "application/json", options)
+        elif path in ("/redirect", "/loop"):
+            self.send_redirect(options.get("to", "/page/1") if path == "/redirect" else "/loop", int(options.get("status", 302)))
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        path, _, query = self.path.partition("?")
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        if path == "/redirect":
+            options = dict(urllib.parse.parse_qsl(query))
+            self.send_redirect(options.get("to", "/page/1"), int(options.get("status", 302)))
+        else:
+            self.send_body(body, self.headers.get("Content-Type") or "application/octet-stream")
+
+    def send_body(self, body, content_type, options=None):
+        compressed = bool(options and options.get("gzip"))
+        if compressed:
+            body = gzip.compress(body)
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        if compressed:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_redirect(self, location, status):
+        self.send_response(status)
+        self.send_header("Location", location)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fixture_server():
+
+    # Starts the fixture site on a free local port, returning the server and its base URL. 
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
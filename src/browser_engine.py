@@ -1,18 +1,487 @@
 
-from selenium import webdriver
-from selenium.webdriver.common.by import By 
 import time 
 import re 
+import os
+import sys
+import hashlib
+import marshal
+import types
+import ast
+import builtins
+import csv
+import json
+import signal
+import argparse
+import threading
+import queue
+import atexit
+import heapq
+import bisect
+import zlib
+import urllib.parse
+
+# Engine version, part of the compiled procedure cache key. 
+ENGINE_VERSION = "1.9.0"
+
+# The engine fingerprint, see get_engine_fingerprint. 
+engine_fingerprint = {}
+
+# Directory used to store compiled procedure files. 
+proc_cache_directory = os.environ.get("PROCBOT_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "procbot")
 
 variable_dictionary = {}
 
+# Additional driver factories, keyed by browser name, see register_web_driver. 
+driver_factories = {}
+
+# Drivers handed out to procedures which have not yet been stopped or released. 
+active_browsers = []
+
+# Browser pool settings, see configure_browser_pool. 
+browser_pool_settings = {"enabled": False, "warm": {}, "options": None, "max_jobs": 50, "max_memory": None}
+
+# Serialises access to the idle pooled drivers. 
+browser_pool_lock = threading.Lock()
+
+# Idle pooled drivers, keyed by browser name and start options. 
+browser_pool_idle = {}
+
+# Usage of each pooled driver, keyed by driver. 
+browser_pool_entries = {}
+
+# Number of seconds the pool waits for a browser being launched when it is closed. 
+BROWSER_LAUNCH_TIMEOUT = 60
+
+# Threads launching browsers to refill the pool, see refill_browser_pool. 
+browser_pool_fillers = []
+
+# The origins each driver has loaded pages from, cleared when it is reset. 
+browser_origins = {}
+
+# Default number of seconds the waitfor command waits before timing out. 
+DEFAULT_WAIT_TIMEOUT = 10
+
+# Number of seconds between checks of a waitfor condition. 
+WAIT_POLL_INTERVAL = 0.1
+
+# Locator strategies accepted by the waitfor command, mapped to the values of Selenium's `By`. 
+# Selenium is only imported once a browser starts, so the values are spelt out here. 
+LOCATOR_STRATEGIES = {"id": "id", "name": "name", "class": "class name", "css": "css selector", "xpath": "xpath"}
+
+# Element conditions accepted by the waitfor command, mapped to Selenium's expected conditions. 
+ELEMENT_CONDITIONS = {
+    "present": "presence_of_element_located", 
+    "visible": "visibility_of_element_located", 
+    "clickable": "element_to_be_clickable", 
+}
+
+# The WebDriver key codes of Enter and Return, see Selenium's `Keys`. 
+ENTER_KEYS = ("\n", "\ue007", "\ue006")
+
+# The CachedWebElement class, defined once Selenium has been imported. 
+cached_element_class = {}
+
+# Element lookup commands, mapped to their locator strategy and element getter. 
+LOOKUP_COMMANDS = {
+    "gi": ("id", "get_element_by_id"), 
+    "gn": ("name", "get_element_by_name"), 
+    "gc": ("class", "get_element_by_class_name"), 
+    "gs": ("css", "get_element_by_css_selector"), 
+    "gx": ("xpath", "get_element_by_xpath"), 
+}
+
+# Resolves a list of [strategy, value] locators in the page, returning the first 
+# matching element for each, or null where nothing matches. 
+BATCH_LOOKUP_SCRIPT = """
+var locators = arguments[0], results = [];
+for (var i = 0; i < locators.length; i++) {
+    var strategy = locators[i][0], value = locators[i][1], element = null;
+    try {
+        switch (strategy) {
+            case "id": element = document.getElementById(value); break;
+            case "name": element = document.getElementsByName(value)[0] || null; break;
+            case "class": element = document.getElementsByClassName(value)[0] || null; break;
+            case "css": element = document.querySelector(value); break;
+            case "xpath": element = document.evaluate(value, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue; break;
+        }
+    } catch (e) {
+        element = null;
+    }
+    results.push(element instanceof Element ? element : null);
+}
+return results;
+"""
+
+# Reads the fields of every row matching a selector in one call, and clicks the next page 
+# link, if any, marking the page so the next page can be told apart from it. 
+EXTRACT_SCRIPT = """
+var rows = document.querySelectorAll(arguments[0]), fields = arguments[1], nextSelector = arguments[2], values = [];
+for (var i = 0; i < rows.length; i++) {
+    var record = [];
+    for (var j = 0; j < fields.length; j++) {
+        var element = fields[j][0] ? rows[i].querySelector(fields[j][0]) : rows[i], attribute = fields[j][1], value = null;
+        if (element && attribute) {
+            value = typeof element[attribute] === "string" ? element[attribute] : element.getAttribute(attribute);
+        } else if (element) {
+            value = element.textContent.replace(/\\s+/g, " ").trim();
+        }
+        record.push(value);
+    }
+    values.push(record);
+}
+var next = nextSelector ? document.querySelector(nextSelector) : null;
+if (next) {
+    window.__procbotExtract = {first: rows[0] || null, text: rows[0] ? rows[0].textContent : null};
+    next.click();
+}
+return {rows: values, next: !!next};
+"""
+
+# Checks whether the page has moved on from the page last extracted, either by loading 
+# a new document or by replacing its rows. 
+EXTRACT_WAIT_SCRIPT = """
+var marker = window.__procbotExtract;
+if (!marker) {
+    return document.readyState !== "loading";
+}
+var first = document.querySelector(arguments[0]);
+return first !== marker.first || (first !== null && first.textContent !== marker.text);
+"""
+
+# Matches the attribute part of an extract field, e.g. "@href" in "a.link@href". 
+EXTRACT_ATTRIBUTE_PATTERN = re.compile(r"@([\w:-]+)$")
+
+# Trace recording settings, see start_trace. 
+trace_settings = {"output": None, "format": None, "events": 0, "clock_offset": 0.0, "original_execute": None}
+
+# The stage currently executing in each thread, attached to WebDriver trace events. 
+trace_context = threading.local()
+
+# Serialises writes to the trace file. 
+trace_lock = threading.Lock()
+
+# The upper bounds, in seconds, of the latency histogram buckets. 
+METRIC_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Engine functions timed while metrics are on, see configure_metrics. 
+METERED_FUNCTIONS = ("get_web_driver", "browser_load", "get_element_by_id", "get_element_by_name", 
+                     "get_element_by_class_name", "get_element_by_css_selector", "get_element_by_xpath", 
+                     "get_elements_batch", "process_wait", "exec_proc_from_file", "exec_proc_stage")
+
+# The type and description of each metric, in Prometheus terms. 
+METRIC_DESCRIPTIONS = {
+    "procbot_call_duration_seconds": ("histogram", "Duration of engine function calls."),
+    "procbot_call_errors_total": ("counter", "Engine function calls which raised an error, or failed to start a browser."),
+    "procbot_element_lookups_total": ("counter", "Element lookups, by whether the element was found."),
+    "procbot_stage_duration_seconds": ("histogram", "Duration of procedure stages, by command."),
+    "procbot_stage_errors_total": ("counter", "Procedure stages which raised an error, by command."),
+    "procbot_browsers_live": ("gauge", "Browsers currently running."),
+    "procbot_element_cache_total": ("counter", "Element cache events, see configure_element_cache."),
+}
+
+# Metrics settings, see configure_metrics. The original engine functions are kept to 
+# restore them when metrics are switched off. 
+metrics_settings = {"enabled": False, "server": None, "output": None, "originals": {}}
+
+# Counters, gauges and histograms, keyed by (name, labels) with labels as a tuple of 
+# (name, value) pairs. A histogram holds the count of each bucket, then its sum and count. 
+metric_counters = {}
+metric_gauges = {}
+metric_histograms = {}
+
+# Serialises updates to the metrics. 
+metrics_lock = threading.Lock()
+
+# Element cache settings and counters, see configure_element_cache. 
+element_cache_settings = {"enabled": False}
+element_cache_stats = {"hits": 0, "misses": 0, "stale": 0, "invalidations": 0}
+
+# Cached elements for the current page of each driver, keyed by driver then (by, value). 
+element_cache = {}
+
+# Named performance profiles for the start command. 
+BROWSER_PROFILES = {
+    "fast": {"headless": True, "page_load_strategy": "eager", "block": ["images", "fonts", "media"]},
+}
+
+# Page load strategies accepted by the start command. 
+PAGE_LOAD_STRATEGIES = ("normal", "eager", "none")
+
+# URL patterns blocked for each resource type. 
+RESOURCE_BLOCK_PATTERNS = {
+    "images": ["*.png*", "*.jpg*", "*.jpeg*", "*.gif*", "*.webp*", "*.avif*", "*.svg*", "*.ico*"],
+    "fonts": ["*.woff*", "*.woff2*", "*.ttf*", "*.otf*", "*.eot*"],
+    "media": ["*.mp4*", "*.webm*", "*.mp3*", "*.ogg*", "*.wav*", "*.m4a*", "*.m3u8*"],
+}
+
+# Default number of seconds a fetch waits for a response. 
+FETCH_TIMEOUT = 30
+
+# The most requests a run of fetches sends at the same time. 
+FETCH_MAX_WORKERS = 8
+
+# The most idle keep-alive connections held for each host. 
+FETCH_MAX_IDLE = 8
+
+# The most redirects a fetch follows. 
+FETCH_MAX_REDIRECTS = 5
+
+# Idle keep-alive fetch connections, keyed by (scheme, host, port). 
+fetch_connections = {}
+
+# Serialises access to the fetch connection pool. 
+fetch_lock = threading.Lock()
+
+# The user agent of each driver, sent with its fetches. 
+fetch_user_agents = {}
+
+# Hop-by-hop headers, which the network archive proxy neither forwards nor records. 
+HOP_BY_HOP_HEADERS = {"connection", "keep-alive", "proxy-connection", "proxy-authenticate", "proxy-authorization", 
+                      "te", "trailer", "transfer-encoding", "upgrade"}
+
+# Network archive settings, see start_network_archive. The index maps each 
+# (method, URL, request body digest) to its archived response. 
+network_archive = {"mode": None, "path": None, "index": {}, "lock": threading.Lock(), "server": None, 
+                   "port": None, "tls": None}
+
+# Network archive counters. 
+network_archive_stats = {"recorded": 0, "replayed": 0, "missed": 0, "tunnelled": 0}
+
+# Compiled procedures held in memory, keyed by content hash and file path. 
+compiled_programs = {}
+
+# The default localhost port of the daemon. 
+DAEMON_PORT = 8765
+
+# The default number of jobs the daemon holds in its queue before refusing new ones. 
+DAEMON_MAX_QUEUE = 1000
+
+# The number of finished jobs the daemon keeps the results of. 
+DAEMON_MAX_FINISHED = 10000
+
+# Number of seconds between a worker's checks that its parent is still running. 
+PARENT_POLL_INTERVAL = 1.0
+
+# HTTP request handler classes of the daemon and the network archive proxy, defined when 
+# they are first needed. 
+server_classes = {}
+
+# Preflight check results held in memory, keyed by content hash and the names of the 
+# variables defined before the procedure starts. 
+checked_programs = {}
+
+# The most preflight check results held in memory. 
+CHECK_CACHE_SIZE = 1000
+
+# Builtins which procedures may not use, as they reach past the engine to run code, 
+# import modules or touch files. Dunder names and modules are refused as well. 
+UNSAFE_BUILTINS = frozenset({"__import__", "eval", "exec", "compile", "open", "getattr", "setattr", 
+                             "delattr", "globals", "locals", "vars", "breakpoint", "help", "exit", "quit"})
+
+# The Host headers the daemon answers, so that a web page cannot reach it by rebinding 
+# its own domain name to the loopback address. 
+DAEMON_HOSTS = ("127.0.0.1", "localhost", "[::1]")
+
+# The number of arguments each command takes, as (minimum, maximum), where None is no maximum. 
+COMMAND_ARGUMENTS = {
+    "var": (2, 2), "start": (1, None), "quit": (0, 0), "session": (1, 1), "stop": (0, 0), 
+    "confirm": (1, 1), "goto": (1, 1), "wait": (1, 1), "implicitwait": (1, 1), "waitfor": (1, 4), 
+    "gi": (2, 2), "gn": (2, 2), "gc": (2, 2), "gs": (2, 2), "gx": (2, 2), "type": (2, 2), "click": (1, 1), 
+    "fetch": (2, None), "extract": (3, None), "foreach": (3, 4), "parallel": (0, 0), 
+}
+
+# Default number of seconds between checkpoints of a running procedure. 
+CHECKPOINT_INTERVAL = 5.0
+
+# Checkpoint settings and the state being recorded, see exec_proc_with_checkpoint. 
+checkpoint_settings = {"path": None, "interval": CHECKPOINT_INTERVAL, "written": 0.0, "state": None, "row_prefix": ""}
+
+# Matches one token of a procedure line: a run of quoted strings (single or double 
+# quoted, with backslash escapes) and unquoted characters, up to the next whitespace. 
+TOKEN_PATTERN = re.compile(r"""\s*((?:"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|[^\s"'])+)""")
+
+# Matches dictionary queries generated by proc_var. 
+VAR_QUERY_PATTERN = re.compile(r"variable_dictionary\['([a-zA-Z0-9_.]+)'\]")
+
+# Log levels, in order of severity. 
+LOG_LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+# The maximum number of log records waiting to be written. 
+LOG_QUEUE_SIZE = 10000
+
+# Logging settings, see configure_logging. The run id is shared with worker processes 
+# through the environment. 
+log_settings = {"level": "info", "threshold": LOG_LEVELS["info"], "format": "text", "output": None, "stages": True, 
+                "run_id": os.environ.setdefault("PROCBOT_RUN_ID", os.urandom(6).hex()), 
+                "queue": None, "thread": None, "pid": None, "dropped": 0}
+
+# The job being run by each thread, attached to its log records. 
+log_context = threading.local()
+
 # Logging functionality. 
-def log_entry(type, message):
-    print(f"[{type}] {message}")
+def log_entry(type, message, **fields):
+
+    # Queues a log record, to be written by the background log writer. 
+    #
+    # Records below the configured level are discarded before any work is done. If the 
+    # queue is full, debug and info records are dropped and counted rather than 
+    # blocking execution; warnings and errors wait for space.
+    #
+    # Parameters:
+    #    type (str): The level of the record, "debug", "info", "warning" or "error".
+    #    message (str): The message.
+    #    fields: Further values for the record, e.g. file, line, command and duration.
+    #
+    # Returns:
+    #    This function does not return a value. 
+
+    level = LOG_LEVELS.get(type, LOG_LEVELS["error"])
+    if level < log_settings["threshold"]:
+        return
+
+    if log_settings["pid"] != os.getpid():
+        start_log_writer()
+
+    record = (time.time(), type, message, getattr(log_context, "job", None), fields)
+    try:
+        log_settings["queue"].put_nowait(record)
+    except queue.Full:
+        if level < LOG_LEVELS["warning"]:
+            log_settings["dropped"] += 1
+        else:
+            log_settings["queue"].put(record)
+
+
+def configure_logging(level="info", format="text", output=None, stages=True, run_id=None):
+
+    # The configure_logging function sets how log records are filtered and written. 
+    #
+    # Records are written by a background thread, so a slow terminal or log collector 
+    # never holds up a procedure. In the "text" format each record is a line such as 
+    # "[error] message". In the "json" format each record is a JSON object on its own line, 
+    # with its time, level, run id, job, message and any further fields.
+    #
+    # Parameters:
+    # level (str): The lowest level written, "debug", "info", "warning" or "error".
+    # format (str): "text" or "json".
+    # output (str): The file to append records to. Defaults to stdout.
+    # stages (bool): If False, the record of each executed stage is switched off entirely.
+    # run_id (str): The id attached to every record. Defaults to the current run id.
+    #
+    # Returns:
+    # None: The function doesn't return a value. 
+
+    if level not in LOG_LEVELS:
+        raise ValueError(f"Unknown log level: {level}")
+    if format not in ("text", "json"):
+        raise ValueError(f"Unknown log format: {format}")
+
+    stop_log_writer()
+    log_settings.update({"level": level, "threshold": LOG_LEVELS[level], "format": format, 
+                         "output": output, "stages": stages})
+    if run_id is not None:
+        log_settings["run_id"] = os.environ["PROCBOT_RUN_ID"] = run_id
+
+
+def get_logging_config():
+
+    # Returns the logging settings as keyword arguments for `configure_logging`, 
+    # so that worker processes log in the same way. 
+    return {key: log_settings[key] for key in ("level", "format", "output", "stages", "run_id")}
+
+
+def start_log_writer():
+
+    # Starts the background thread which writes queued log records. 
+    #
+    # The writer is started on the first record, and again in a forked process, 
+    # which does not inherit the thread of its parent.
+    #
+    # Parameters:
+    #    None: The function does not take a parameter. 
+    #
+    # Returns:
+    #    This function does not return a value. 
+
+    log_settings.update({"queue": queue.Queue(LOG_QUEUE_SIZE), "pid": os.getpid(), "dropped": 0})
+    log_settings["thread"] = threading.Thread(target=write_log_records, args=(log_settings["queue"],), 
+                                              name="procbot-log", daemon=True)
+    log_settings["thread"].start()
+
+
+def stop_log_writer():
+
+    # Writes any queued log records and stops the background log writer. 
+    #
+    # Parameters:
+    #    None: The function does not take a parameter. 
+    #
+    # Returns:
+    #    This function does not return a value. 
+
+    if log_settings["pid"] != os.getpid():
+        return
+    try:
+        log_settings["queue"].put(None, timeout=5)
+    except queue.Full:
+        pass
+    log_settings["thread"].join(5)
+    log_settings.update({"queue": None, "thread": None, "pid": None})
+
+
+def write_log_records(records):
+
+    # The main loop of the background log writer. Records are formatted and written 
+    # as they arrive, and the output is flushed whenever the queue is empty, so a 
+    # burst of records costs one flush. 
+    #
+    # Parameters:
+    #    records (Queue): The queue of records, ending with None.
+    #
+    # Returns:
+    #    This function does not return a value. 
+
+    output_path = log_settings["output"]
+    output = open(output_path, "a") if output_path else sys.stdout
+    json_format = log_settings["format"] == "json"
+    run_id = log_settings["run_id"]
+
+    while True:
+        record = records.get()
+        if record is None:
+            break
+
+        try:
+            if log_settings["dropped"]:
+                dropped, log_settings["dropped"] = log_settings["dropped"], 0
+                output.write(f"[warning] {dropped} log records were dropped as the log queue was full\n")
+
+            created, level, message, job, fields = record
+            if json_format:
+                entry = {"time": round(created, 6), "level": level, "run": run_id}
+                if job is not None:
+                    entry["job"] = job
+                entry["message"] = message
+                entry.update(fields)
+                output.write(json.dumps(entry, default=str) + "\n")
+            else:
+                output.write(f"[{level}] {message}\n")
+
+            if records.empty():
+                output.flush()
+        except Exception as e:
+            sys.stderr.write(f"[error] Log writer error: {e}\n")
+
+    output.flush()
+    if output is not sys.stdout:
+        output.close()
+
+
+atexit.register(stop_log_writer)
 
 
 # Returns a driver object based on the browser requested. 
-def get_web_driver(browser):
+def get_web_driver(browser, options=None, track=True):
 
     # The get_web_driver function initialises and returns the appropriate Selenium WebDriver
     # based on the provided browser choice ('Chrome', 'Edge', or 'Firefox').
@@ -22,28 +491,155 @@ def get_web_driver(browser):
     #   - "Chrome" for Chrome WebDriver
     #   - "Edge" for Edge WebDriver
     #   - "Firefox" for Firefox WebDriver
-    #   - Any other value will default to initialising the Edge WebDriver.
+    #   - Any name added with `register_web_driver`
+    #   - Any other value will default to initialising the Chrome WebDriver.
+    # options (dict): Optional start options, see `parse_start_options`. Options a browser 
+    #   does not support are skipped with a warning.
+    # track (bool): Whether the driver is added to the browsers in use. Browsers launched 
+    #   into the pool are not in use until they are acquired.
     #
     # Returns:
     # driver (WebDriver or None): Returns the initialised WebDriver instance for the specified browser.
     #   If an error occurs during WebDriver initialisation, it prints an error message and returns None.
 
     try:
+        from selenium import webdriver
+
+        factory = driver_factories.get(browser)
         match browser:
+            case _ if factory is not None:
+                driver = factory()
             case "Chrome":
-                driver = webdriver.Chrome()
+                driver = webdriver.Chrome(options=get_browser_options("Chrome", options))
             case "Edge":
-                driver = webdriver.Edge()
+                driver = webdriver.Edge(options=get_browser_options("Edge", options))
             case "Firefox":
-                driver = webdriver.Firefox()
+                driver = webdriver.Firefox(options=get_browser_options("Firefox", options))
             case _:
-                driver = webdriver.Chrome() 
+                driver = webdriver.Chrome(options=get_browser_options("Chrome", options)) 
+        if options:
+            apply_browser_blocking(driver, options)
+        if track:
+            active_browsers.append(driver)
         return driver 
     except Exception as e:
         log_entry("error", f"Browser driver invokation error: {e}")
         return None
 
 
+def get_browser_options(browser, options):
+
+    # Builds the Selenium options object for a browser from the start options. 
+    #
+    # Chrome and Edge take every option. Firefox takes every option except URL 
+    # pattern blocking, which is applied by `apply_browser_blocking` on Chromium only; 
+    # its image, font and media blocking use preferences instead. While the network 
+    # archive is on, every browser is set to use its proxy, see `start_network_archive`.
+    #
+    # Parameters:
+    #    browser (str): "Chrome", "Edge" or "Firefox".
+    #    options (dict): The start options, or None.
+    #
+    # Returns:
+    #    Options or None: The options object, or None if there are no options.
+
+    proxy_port = network_archive["port"]
+    if not options and proxy_port is None:
+        return None
+
+    from selenium import webdriver
+
+    options = options or {}
+
+    if browser == "Firefox":
+        browser_options = webdriver.FirefoxOptions()
+        if options.get("headless"):
+            browser_options.add_argument("-headless")
+        if options.get("window_size"):
+            width, height = options["window_size"]
+            browser_options.add_argument(f"--width={width}")
+            browser_options.add_argument(f"--height={height}")
+        block = options.get("block", [])
+        if "images" in block:
+            browser_options.set_preference("permissions.default.image", 2)
+        if "fonts" in block:
+            browser_options.set_preference("gfx.downloadable_fonts.enabled", False)
+        if "media" in block:
+            browser_options.set_preference("media.autoplay.default", 5)
+            browser_options.set_preference("media.preload.default", 0)
+    else:
+        browser_options = webdriver.EdgeOptions() if browser == "Edge" else webdriver.ChromeOptions()
+        if options.get("headless"):
+            browser_options.add_argument("--headless=new")
+        if options.get("window_size"):
+            width, height = options["window_size"]
+            browser_options.add_argument(f"--window-size={width},{height}")
+        if "images" in options.get("block", []):
+            browser_options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+
+    if options.get("page_load_strategy"):
+        browser_options.page_load_strategy = options["page_load_strategy"]
+
+    # Sends every request through the network archive proxy, which reads HTTPS with its 
+    # own certificate. 
+    if proxy_port is not None:
+        if browser == "Firefox":
+            for scheme in ("http", "ssl"):
+                browser_options.set_preference(f"network.proxy.{scheme}", "127.0.0.1")
+                browser_options.set_preference(f"network.proxy.{scheme}_port", proxy_port)
+            browser_options.set_preference("network.proxy.type", 1)
+        else:
+            browser_options.add_argument(f"--proxy-server=127.0.0.1:{proxy_port}")
+        browser_options.accept_insecure_certs = True
+
+    return browser_options
+
+
+def apply_browser_blocking(driver, options):
+
+    # Blocks requests by resource type, URL pattern and host in a running browser. 
+    #
+    # This uses the Chrome DevTools Protocol, so it applies to Chrome and Edge. 
+    # Firefox blocks images, fonts and media through its preferences instead, 
+    # and URL pattern and host blocking are skipped with a warning.
+    #
+    # Parameters:
+    #    driver (WebDriver): The browser to configure.
+    #    options (dict): The start options.
+    #
+    # Returns:
+    #    This function does not return a value. 
+
+    patterns = [pattern for resource in options.get("block", []) for pattern in RESOURCE_BLOCK_PATTERNS[resource]]
+    patterns += options.get("block_urls", [])
+    patterns += [f"*://{host}/*" for host in options.get("block_hosts", [])] + [f"*://*.{host}/*" for host in options.get("block_hosts", [])]
+    if not patterns:
+        return
+
+    if not hasattr(driver, "execute_cdp_cmd"):
+        if options.get("block_urls") or options.get("block_hosts"):
+            log_entry("warning", "URL and host blocking is only supported on Chrome and Edge, skipping.")
+        return
+
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+
+
+def register_web_driver(browser, factory):
+
+    # Adds a browser name that `start` can use, e.g. a remote grid session or an 
+    # in-process fake driver for benchmarks. 
+    #
+    # Parameters:
+    #    browser (str): The browser name used by the `start` command.
+    #    factory (callable): A function taking no arguments which returns a new driver.
+    #
+    # Returns:
+    #    This function does not return a value. 
+
+    driver_factories[browser] = factory
+
+
 def browser_load(driver, url):
 
     # The browser_load function retrieves the HTML content from a specified URL 
@@ -56,12 +652,33 @@ def browser_load(driver, url):
     # Returns:
     # None: The function doesn't return a value. It simply uses the driver to navigate to a page. 
 
+    invalidate_element_cache(driver)
+    origin = get_url_origin(url)
+    if origin is not None:
+        browser_origins.setdefault(driver, set()).add(origin)
     try:
         driver.get(url)
     except Exception as e:
         log_entry("error", f"Browser load error: {e}")
 
 
+def get_url_origin(url):
+
+    # Returns the origin of a web page URL, e.g. "https://lorem.ipsum:8443", or None 
+    # for pages without one, such as about:blank.
+    #
+    # Parameters:
+    #    url (str): The URL of the page.
+    #
+    # Returns:
+    #    str or None: The scheme, host and any port of the URL.
+
+    parts = urllib.parse.urlsplit(str(url))
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        return None
+    return f"{parts.scheme}://{parts.netloc.rsplit('@', 1)[-1].lower()}"
+
+
 
 def process_wait(seconds):
 
@@ -99,459 +716,4854 @@ def browser_wait(driver, duration):
         log_entry("error", f"Implicit wait error: {e}")
 
 
-def browser_stop(driver):
-    
-    # The browser_stop function terminates the WebDriver session and closes the browser window.
+def browser_wait_until(driver, condition, description, timeout=DEFAULT_WAIT_TIMEOUT):
+
+    # The browser_wait_until function polls a condition until it is met, so that a 
+    # procedure only waits as long as the page actually needs.
     #
     # Parameters:
-    # driver (WebDriver): The Selenium WebDriver instance to be stopped and the browser to be closed.
+    # driver (WebDriver): The Selenium WebDriver instance the condition is checked against.
+    # condition (callable): A function taking the driver, returning a truthy value once met.
+    # description (str): A description of the condition, used in the timeout error.
+    # timeout (int or float): The number of seconds to wait before timing out.
     #
     # Returns:
-    # None: The function doesn't return a value. It simply stops the WebDriver and closes the browser.
-    
+    # The truthy value returned by the condition. 
+    #   Raises a TimeoutError if the condition is not met within the timeout.
+
+    from selenium.webdriver.support.ui import WebDriverWait
+
     try:
-        driver.quit()
+        return WebDriverWait(driver, float(timeout), poll_frequency=WAIT_POLL_INTERVAL).until(condition)
     except Exception as e:
-        log_entry("error", f"Browser quit error: {e}")
+        message = f"Timed out after {timeout} seconds waiting for {description}"
+        log_entry("error", message)
+        raise TimeoutError(message) from e
 
 
-def get_element_by_id(driver, id):
+def wait_for_element(driver, condition, strategy, value, timeout=DEFAULT_WAIT_TIMEOUT):
 
-    # The get_element_by_id function locates an element on the web page using its ID.
+    # Waits until an element is present, visible or clickable. 
     #
     # Parameters:
-    # driver (WebDriver): The Selenium WebDriver instance used to locate the element.
-    # id (str): The ID attribute of the element to be located on the page.
+    #    driver (WebDriver): The Selenium WebDriver instance used to interact with the page.
+    #    condition (str): One of "present", "visible" or "clickable".
+    #    strategy (str): One of "id", "name", "class", "css" or "xpath".
+    #    value (str): The value used to locate the element.
+    #    timeout (int or float): The number of seconds to wait before timing out.
     #
     # Returns:
-    # element (WebElement or None): Returns the WebElement if the element is found. 
-    #   If an error occurs or the element is not found, it prints an error message and returns None.
+    #    WebElement: The element once the condition is met.
 
-    try:
-        element = driver.find_element(by=By.ID, value=id)
-        return element 
-    except Exception as e:
-        log_entry("error", f"Get element by Id error: {e}")
-        return None 
-    
+    from selenium.webdriver.support import expected_conditions
 
-def get_element_by_name(driver, name):
+    locator = (LOCATOR_STRATEGIES[strategy], value)
+    return browser_wait_until(driver, getattr(expected_conditions, ELEMENT_CONDITIONS[condition])(locator), f"{strategy} {value!r} to be {condition}", timeout)
 
-    # Attempts to find a web element by its 'name' attribute.
-    #
-    # This function uses the provided WebDriver instance to locate an element 
-    # on the webpage using the 'name' attribute. If successful, it returns 
-    # the located element. In the event of an error (e.g. element not found), 
-    # an error message is logged and the function returns None.
+
+def wait_for_url(driver, text, timeout=DEFAULT_WAIT_TIMEOUT):
+
+    # Waits until the current URL contains the given text. As this follows a navigation, 
+    # the element cache of the driver is cleared.
     #
     # Parameters:
     #    driver (WebDriver): The Selenium WebDriver instance used to interact with the page.
-    #    name (str): The 'name' attribute of the element to be located.
+    #    text (str): The text the URL should contain.
+    #    timeout (int or float): The number of seconds to wait before timing out.
     #
     # Returns:
-    #    WebElement or None: The located web element if found, otherwise None.
+    #    This function does not return a value. 
 
-    try:
-        element = driver.find_element(by=By.NAME, value=name)
-        return element
-    except Exception as e:
-        log_entry("error", f"Get element by name error: {e}")
-        return None 
-    
+    from selenium.webdriver.support import expected_conditions
+    browser_wait_until(driver, expected_conditions.url_contains(text), f"the URL to contain {text!r}", timeout)
+    invalidate_element_cache(driver)
 
-def get_element_by_class_name(driver, class_name):
 
-    # Attempts to find a web element by its 'class' attribute.
-    #
-    # This function uses the provided WebDriver instance to locate an element 
-    # on the page by its 'class' attribute. If the element is found, it is 
-    # returned. If an error occurs (such as the element not being found), 
-    # an error message is logged and None is returned.
+def wait_for_title(driver, text, timeout=DEFAULT_WAIT_TIMEOUT):
+
+    # Waits until the page title contains the given text. As this follows a navigation, 
+    # the element cache of the driver is cleared.
     #
     # Parameters:
     #    driver (WebDriver): The Selenium WebDriver instance used to interact with the page.
-    #    class_name (str): The 'class' attribute of the element to be located.
+    #    text (str): The text the title should contain.
+    #    timeout (int or float): The number of seconds to wait before timing out.
     #
     # Returns:
-    # 
+    #    This function does not return a value. 
 
-    try:
-        element = driver.find_element(by=By.CLASS_NAME, value=class_name)
-        return element 
-    except Exception as e:
-        log_entry("error", f"Get element by class name error: {e}")
-        return None 
+    from selenium.webdriver.support import expected_conditions
+    browser_wait_until(driver, expected_conditions.title_contains(text), f"the title to contain {text!r}", timeout)
+    invalidate_element_cache(driver)
 
 
-def get_element_by_css_selector(driver, selector):
+def wait_for_page_ready(driver, timeout=DEFAULT_WAIT_TIMEOUT):
 
-    # Attempts to find a web element using a CSS selector.
-    #
-    # This function uses the provided WebDriver instance to locate an element 
-    # on the page via a CSS selector. If the element is located successfully, 
-    # it is returned. If an error occurs, an error message is logged and None 
-    # is returned.
+    # Waits until `document.readyState` is complete. As this follows a navigation, 
+    # the element cache of the driver is cleared.
     #
     # Parameters:
     #    driver (WebDriver): The Selenium WebDriver instance used to interact with the page.
-    #    selector (str): The CSS selector used to identify the element.
+    #    timeout (int or float): The number of seconds to wait before timing out.
     #
     # Returns:
-    #    WebElement or None: The located web element if found, otherwise None.
+    #    This function does not return a value. 
 
-    try:
-        element = driver.find_element(by=By.CSS_SELECTOR, value=selector)
-        return element 
-    except Exception as e:
-        log_entry("error", f"Get element by CSS selector error: {e}")
-        return None 
-    
+    def page_ready(driver):
+        return driver.execute_script("return document.readyState;") == "complete"
 
-def get_element_by_xpath(driver, xpath):
+    browser_wait_until(driver, page_ready, "the page to finish loading", timeout)
+    invalidate_element_cache(driver)
 
-    # Attempts to find a web element using an XPath expression.
-    #
-    # This function uses the provided WebDriver instance to locate an element 
-    # on the page via an XPath expression. If the element is found, it is 
-    # returned. If an error occurs (e.g. element not found), an error message 
-    # is logged and None is returned.
+
+def browser_stop(driver):
+    
+    # The browser_stop function terminates the WebDriver session and closes the browser window.
     #
     # Parameters:
-    #    driver (WebDriver): The Selenium WebDriver instance used to interact with the page.
-    #    xpath (str): The XPath expression used to locate the element.
+    # driver (WebDriver): The Selenium WebDriver instance to be stopped and the browser to be closed.
     #
     # Returns:
-    #    WebElement or None: The located web element if found, otherwise None.
+    # None: The function doesn't return a value. It simply stops the WebDriver and closes the browser.
+    
+    if driver in active_browsers:
+        active_browsers.remove(driver)
+    element_cache.pop(driver, None)
+    fetch_user_agents.pop(driver, None)
+    browser_origins.pop(driver, None)
 
     try:
-        element = driver.find_element(by=By.XPATH, value=xpath)
-        return element
+        driver.quit()
     except Exception as e:
-        log_entry("error", f"Get element by xpath error: {e}")
-        return None 
+        log_entry("error", f"Browser quit error: {e}")
 
 
-def browser_stop_with_confirmation(driver):
+def release_active_browsers():
 
-    # Attempts to quit the current Selenium session.
+    # Stops, or returns to the browser pool, every browser handed out by this 
+    # process that is still in use. 
     #
-    # This function uses the provided WebDriver to quit all concurrent processes. 
+    # This is used to clean up after a procedure that failed, or finished 
+    # without a `quit` line, so that long-running workers do not leak browsers.
     #
     # Parameters:
-    #    driver (WebDriver): The Selenium WebDriver instance used to interact with the page.
+    #    None: The function does not take a parameter. 
     #
     # Returns:
     #    This function does not return a value. 
 
-    # User prompt.
-    print(f"Press enter to close the browser process...")
-    input()
-
-    # Quits the browser session. 
-    print(f"Closing the browser.")
-    browser_stop(driver)
+    for driver in list(active_browsers):
+        release_web_driver(driver)
 
 
-def start_test_harness():
+def configure_browser_pool(warm=None, max_jobs=50, max_memory=None, options=None):
 
-    # The start_test_harness function runs through a test harness process to ensure the engine is working correctly.
+    # The configure_browser_pool function enables the browser pool, which keeps 
+    # browsers running between procedures so that `start` does not have to launch one. 
     #
     # Parameters:
-    # None: The function does not take a parameter. 
+    # warm (dict): The number of idle browsers to keep ready for each browser name, 
+    #   e.g. {"Chrome": 2}. These are launched immediately.
+    # max_jobs (int): The number of procedures a browser is used for before it is recycled.
+    # max_memory (int or float): The memory use, in megabytes, above which a browser is 
+    #   recycled. None disables the memory check.
+    # options (dict): The start options of the warm browsers, e.g. BROWSER_PROFILES["fast"]. 
+    #   Only `start` lines with the same options take a warm browser.
     #
     # Returns:
     # None: The function doesn't return a value. 
 
-    # Defines the test URL.
-    test_url = "https://duckduckgo.com/"
+    browser_pool_settings.update({"enabled": True, "warm": dict(warm or {}), "options": options or None, "max_jobs": max_jobs, "max_memory": max_memory})
+    for browser in browser_pool_settings["warm"]:
+        fill_browser_pool(browser, browser_pool_settings["options"])
 
-    # Gets the browser driver. 
-    print(f"Fetching browser driver.")
-    browser = get_web_driver("Chrome")
-    if browser is None:
-        print("Unable to get the browser driver.")
-        return False 
-    print(browser)
 
-    # Loads the browser and navigates to the test URL.
-    print(f"Loading browser and navigating to test URL: {test_url}")
-    browser_load(browser, test_url)
+def get_browser_pool_key(browser, options):
 
-    # Runs test search
-    search_box = get_element_by_id(browser, "searchbox_input")
-    search_button = get_element_by_xpath(browser, '//*[@id="searchbox_homepage"]/div/div/div/button')
-    search_box.send_keys("Lorem ipsum")
-    process_wait(2)
-    search_button.click()
-    process_wait(2)
+    # Returns the key idle browsers are pooled under, as only browsers started 
+    # with the same options can be swapped for one another. 
+    return f"{browser} {json.dumps(options or {}, sort_keys=True)}"
 
-    # Graceful browser stop with confirmation. 
-    browser_stop_with_confirmation(browser)
 
-    return True 
+def fill_browser_pool(browser, options=None):
 
+    # Launches browsers until the pool holds the configured number of idle browsers. 
+    #
+    # Parameters:
+    #    browser (str): The name of the browser, as passed to `get_web_driver`.
+    #    options (dict): The start options of the browsers.
+    #
+    # Returns:
+    #    This function does not return a value. 
 
-# Function to replace each dictionary query with its value from the dictionary
-def parse_var(candidate_exec_line, variable_dictionary):
+    if (options or None) != browser_pool_settings["options"]:
+        return
 
-        # This function processes a line of code (candidate_exec_line) and replaces any 
-    # occurrences of variables within the `variable_dictionary` pattern with 
-    # their corresponding values from the provided dictionary.
+    idle = browser_pool_idle.setdefault(get_browser_pool_key(browser, options), [])
+    while True:
+        with browser_pool_lock:
+            if not browser_pool_settings["enabled"] or len(idle) >= browser_pool_settings["warm"].get(browser, 0):
+                return
+        driver = get_web_driver(browser, options, track=False)
+        if driver is None:
+            return
+        browser_pool_entries[driver] = {"browser": browser, "options": options, "jobs": 0}
+        with browser_pool_lock:
+            if browser_pool_settings["enabled"]:
+                idle.append(driver)
+                continue
+        browser_stop(driver)
+        return
 
-    # The function uses regular expressions to identify the variables written 
-    # in the form of `variable_dictionary['key']`, where 'key' is a string that 
-    # matches a key in the provided `variable_dictionary`.
 
+def refill_browser_pool(browser, options=None):
+
+    # Replaces a recycled browser in the background, so the procedure releasing it 
+    # does not wait for a new browser to launch. Only one refill of each browser runs 
+    # at a time.
+    #
     # Parameters:
-    # candidate_exec_line (str): A string representing the line of code to be parsed. 
-    # variable_dictionary (dict): A dictionary where keys represent variable names 
-    # and values represent their corresponding values.
+    #    browser (str): The name of the browser, as passed to `get_web_driver`.
+    #    options (dict): The start options of the browsers.
+    #
+    # Returns:
+    #    This function does not return a value. 
+
+    name = f"procbot-pool {get_browser_pool_key(browser, options)}"
+    with browser_pool_lock:
+        browser_pool_fillers[:] = [thread for thread in browser_pool_fillers if thread.is_alive()]
+        if any(thread.name == name for thread in browser_pool_fillers):
+            return
+        thread = threading.Thread(target=fill_browser_pool, args=(browser, options), name=name, daemon=True)
+        browser_pool_fillers.append(thread)
+    thread.start()
+
+
+def close_browser_pool():
 
+    # Stops every idle pooled browser and disables the pool. 
+    #
+    # Browsers still in use are stopped when they are released, and browsers still 
+    # being launched to refill the pool are stopped once they start.
+    #
+    # Parameters:
+    #    None: The function does not take a parameter. 
+    #
     # Returns:
-    # str: The modified `candidate_exec_line` where all recognised variables are 
-    # replaced with their respective values from `variable_dictionary`.
+    #    This function does not return a value. 
 
-    # The function works as follows:
-    # 1. A regular expression pattern is used to find occurrences of the form 
-    #    `variable_dictionary['key']` in the input line.
-    # 2. For each match, the function checks if the variable (`key`) exists in 
-    #    the `variable_dictionary`.
-    # 3. If a match is found in the dictionary, it replaces the `variable_dictionary['key']` 
-    #    with the actual value of the key in the dictionary.
-    # 4. The modified line is returned after all replacements have been made.
+    with browser_pool_lock:
+        browser_pool_settings["enabled"] = False
+        fillers = list(browser_pool_fillers)
+        browser_pool_fillers.clear()
 
-    # Regular expression to match the left side of the assignment
-    regex = r"variable_dictionary\['([a-zA-Z0-9_]+)'\]"
+    # Waits for browsers being launched, which are stopped once they start. 
+    for thread in fillers:
+        thread.join(BROWSER_LAUNCH_TIMEOUT)
 
-    # Find all matches for variable_dictionary[...] pattern
-    matches = re.findall(regex, candidate_exec_line)
-    
-    # Iterates over the matches. 
-    for match in matches:
+    for idle in browser_pool_idle.values():
+        while idle:
+            browser_stop(idle.pop())
 
-        # Check if the key exists in the dictionary.
-        if match in variable_dictionary:
 
-            # Create the replacement string
-            replacement = str(variable_dictionary[match])
+def acquire_web_driver(browser, options=None):
 
-            # Replace the matched key with the corresponding value
-            candidate_exec_line = re.sub(r"variable_dictionary\['" + re.escape(match) + r"'\]", replacement, candidate_exec_line)
-    
-    return candidate_exec_line
+    # The acquire_web_driver function returns a browser for the `start` command. 
+    #
+    # When the pool is enabled, a healthy idle browser is reused if one is available, 
+    # otherwise a new browser is launched and joins the pool when it is released. 
+    # When the pool is disabled this is the same as `get_web_driver`.
+    #
+    # Parameters:
+    # browser (str): The name of the browser, as passed to `get_web_driver`.
+    # options (dict): Optional start options, see `parse_start_options`.
+    #
+    # Returns:
+    # driver (WebDriver or None): The browser, or None if one could not be started.
 
+    if not browser_pool_settings["enabled"]:
+        return get_web_driver(browser, options)
 
-def preserve_quote_string(text):
+    while True:
+        with browser_pool_lock:
+            idle = browser_pool_idle.setdefault(get_browser_pool_key(browser, options), [])
+            if not idle:
+                break
+            driver = idle.pop()
+        if is_web_driver_healthy(driver):
+            active_browsers.append(driver)
+            return driver
+        log_entry("warning", f"Discarding unhealthy pooled {browser} browser.")
+        browser_stop(driver)
 
-    # This function processes a given string (`text`) by identifying any quoted 
-    # strings and replacing them with placeholders, then splitting the text 
-    # into components (words) while preserving the quoted strings.
+    driver = get_web_driver(browser, options)
+    if driver is not None:
+        browser_pool_entries[driver] = {"browser": browser, "options": options, "jobs": 0}
+    return driver
 
-    # The function works as follows:
-    # 1. It identifies all quoted strings (enclosed in double quotes).
-    # 2. It replaces the quoted strings in the text with placeholders.
-    # 3. It splits the modified text into individual components (words).
-    # 4. It then replaces the placeholders back with the original quoted strings 
-    #    to restore them in their original positions.
 
-    # Parameters:
-    # text (str): A string which may contain quoted substrings that need to be 
-    # preserved while splitting the text into components.
+def release_web_driver(driver):
 
+    # The release_web_driver function is called when a procedure has finished with 
+    # a browser, e.g. by the `quit` command. 
+    #
+    # Pooled browsers are reset and returned to the pool, unless they have reached 
+    # the job or memory limit, cannot be fully reset or fail the health check, in which 
+    # case they are stopped and replaced in the background. Browsers outside the pool 
+    # are stopped.
+    #
+    # Parameters:
+    # driver (WebDriver): The browser to release.
+    #
     # Returns:
-    # list: A list of components (words) from the input string, with the 
-    # quoted substrings restored to their original positions.
+    # None: The function doesn't return a value. 
 
-    # Regex finds quotation. 
-    quote_strings = re.findall(r'"(.*?)"', text)
+    entry = browser_pool_entries.get(driver)
+    if entry is None or not browser_pool_settings["enabled"]:
+        browser_stop(driver)
+        return
 
-    # Replace the quoted strings with placeholder values. 
-    for i, quote in enumerate(quote_strings):
-        placeholder = f"{{{i}}}"
-        text = text.replace(f'"{quote}"', placeholder)
+    if driver in active_browsers:
+        active_browsers.remove(driver)
+    entry["jobs"] += 1
 
-    # Split the text by spaces. 
-    components = text.split()
+    # Decides whether the browser can be reused. 
+    recycle_reason = None
+    if entry["jobs"] >= browser_pool_settings["max_jobs"]:
+        recycle_reason = f"reached {entry['jobs']} jobs"
+    elif not reset_web_driver(driver):
+        recycle_reason = "could not be fully reset"
+    elif not is_web_driver_healthy(driver):
+        recycle_reason = "failed its health check"
+    elif browser_pool_settings["max_memory"] is not None:
+        memory = get_web_driver_memory(driver)
+        if memory is not None and memory > browser_pool_settings["max_memory"]:
+            recycle_reason = f"is using {memory:.0f} MB"
 
-    # Replaces the placeholders with the original quote strings. 
-    for i, quote in enumerate(quote_strings):
-        components = [item.replace(f"{{{i}}}", f'"{quote}"') for item in components]
+    if recycle_reason is None:
+        with browser_pool_lock:
+            browser_pool_idle.setdefault(get_browser_pool_key(entry["browser"], entry["options"]), []).append(driver)
+        return
 
-    return components
+    log_entry("info", f"Recycling pooled {entry['browser']} browser, it {recycle_reason}.")
+    browser_stop(driver)
+    refill_browser_pool(entry["browser"], entry["options"])
 
 
-def proc_var(statement):
+def reset_web_driver(driver):
 
-    # This function processes a given statement to check if it is a variable 
-    # in the form of "[var]" and, if so, converts it into a dictionary query 
-    # string that accesses the variable's value from `variable_dictionary`.
+    # Clears the state a procedure left in a browser so that it can be reused. 
+    #
+    # Extra windows are closed, cookies and web storage are cleared, the implicit 
+    # wait is reset and the remaining window is navigated to about:blank.
+    #
+    # On Chrome and Edge, every cookie is cleared, along with the storage, caches and 
+    # service workers of each origin the browser loaded a page from. Other browsers 
+    # can only clear the cookies and storage of the current page, so they are only 
+    # reset if every page they loaded was on the current origin; otherwise the browser 
+    # has to be recycled.
+    #
+    # Parameters:
+    #    driver (WebDriver): The browser to reset.
+    #
+    # Returns:
+    #    bool: True if the browser was fully reset, otherwise False.
 
-    # The function works as follows:
-    # 1. It checks if the statement starts with the "[var]" identifier.
-    # 2. If the statement is a variable (starts with "[var]"), it removes the 
-    #    "[var]" identifier and constructs a string that queries the 
-    #    `variable_dictionary` for the variable's value.
-    # 3. If the statement does not start with "[var]", it returns the 
-    #    statement as-is without modification.
+    try:
+        # Closes every window but the first. 
+        handles = driver.window_handles
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(handles[0])
 
-    # Parameters:
-    # statement (str): A string representing the statement to be processed. 
-    # It is expected to be in the form of "[var]variable_name" for variables.
+        origins = browser_origins.pop(driver, set())
+        current_origin = get_url_origin(driver.current_url)
+        if current_origin is not None:
+            origins.add(current_origin)
 
-    # Returns:
-    # str: A string which either represents a dictionary query for a variable 
-    # or the original statement if it is not a variable.
+        if hasattr(driver, "execute_cdp_cmd"):
+            driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            for origin in sorted(origins):
+                driver.execute_cdp_cmd("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+        elif origins - {current_origin}:
+            return False
+        else:
+            driver.execute_script("try { window.localStorage.clear(); window.sessionStorage.clear(); } catch (e) {}")
+            driver.delete_all_cookies()
 
-    # Variables should start with [var].
-    var_identifier = "[var]"
+        driver.implicitly_wait(0)
+        invalidate_element_cache(driver)
+        driver.get("about:blank")
+        return True
+    except Exception as e:
+        log_entry("warning", f"Browser reset error: {e}")
+        return False
 
-    # If this statement is a variable
-    if statement.startswith(var_identifier):
 
-        # Remove the identifier and return the dictionary query string. 
-        clean_var = statement.replace(var_identifier, "")
-        return f"variable_dictionary[{repr(clean_var)}]"
-    else:
-        return statement
+def is_web_driver_healthy(driver):
 
+    # Checks that a browser session still responds to commands. 
+    #
+    # Parameters:
+    #    driver (WebDriver): The browser to check.
+    #
+    # Returns:
+    #    bool: True if the session responded, otherwise False.
 
-def parse_proc_line(line):
+    try:
+        driver.current_url
+        return True
+    except Exception:
+        return False
 
-    # This function processes a single line of code (line) representing a command 
-    # and translates it into an executable Python statement. 
 
-    # The function works as follows:
-    # 1. It strips any leading or trailing whitespace from the line.
-    # 2. It splits the stripped line into components (elements), preserving quoted strings.
-    # 3. It checks the first element (command) and constructs the corresponding executable code.
-    # 4. It returns the constructed executable line of code, or `None` if the command is unrecognised.
+def get_web_driver_memory(driver):
 
+    # Measures the memory used by a browser, in megabytes. 
+    #
+    # When psutil is installed, this is the resident memory of every process 
+    # started by the driver service. Otherwise the JavaScript heap size reported 
+    # by the page is used where the browser exposes it (Chrome and Edge).
+    #
     # Parameters:
-    # line (str): A string representing a command that is to be processed and converted 
-    # into executable code.
-
+    #    driver (WebDriver): The browser to measure.
+    #
     # Returns:
-    # str or None: The corresponding executable Python code based on the command, 
-    # or `None` if the command is not recognised.
+    #    float or None: The memory use in megabytes, or None if it cannot be measured.
 
-    # Strips out the line. 
-    strip_line = line.strip()
+    try:
+        import psutil
+        service_process = psutil.Process(driver.service.process.pid)
+        processes = [service_process] + service_process.children(recursive=True)
+        return sum(process.memory_info().rss for process in processes) / (1024 * 1024)
+    except Exception:
+        pass
 
-    # Splits the stripped line into an array of its elements. 
-    # strip_array = strip_line.split()
-    strip_array = preserve_quote_string(strip_line)
+    try:
+        heap_size = driver.execute_script("return window.performance.memory ? window.performance.memory.usedJSHeapSize : null;")
+        return heap_size / (1024 * 1024) if heap_size is not None else None
+    except Exception:
+        return None
 
-    # Gets the command element. 
-    command = strip_array[0]
 
-    # Process determination. 
-    exec_line = ""
-    match command:
-        case "var": 
-            exec_line = f"variable_dictionary['{proc_var(strip_array[1])}'] = {proc_var(strip_array[2])}"
-        case "start":
-            exec_line = f"browser = get_web_driver('{proc_var(strip_array[1])}')"
-        case "quit":
-            exec_line = f"browser.quit()"
-        case "stop":
-            exec_line = f"browser_stop_with_confirmation(browser)"
-        case "confirm":
-            exec_line = f"input({proc_var(strip_array[1])})"
-        case "goto":
-            exec_line = f"browser_load(browser, {proc_var(strip_array[1])})"
-        case "wait":
-            exec_line = f"process_wait({proc_var(strip_array[1])})"
-        case "gi":
-            exec_line = f"{proc_var(strip_array[1])} = get_element_by_id(browser, {proc_var(strip_array[2])})"
-        case "gn":
-            exec_line = f"{proc_var(strip_array[1])} = get_element_by_name(browser, {proc_var(strip_array[2])})"
-        case "gc":
-            exec_line = f"{proc_var(strip_array[1])} = get_element_by_class_name(browser, {proc_var(strip_array[2])})"
-        case "gs":
-            exec_line = f"{proc_var(strip_array[1])} = get_element_by_css_selector(browser, {proc_var(strip_array[2])})"
-        case "gx":
-            exec_line = f"{proc_var(strip_array[1])} = get_element_by_xpath(browser, {proc_var(strip_array[2])})"
-        case "type":
-            exec_line = f"{proc_var(strip_array[1])}.send_keys({proc_var(strip_array[2])})"
-        case "click":
-            exec_line = f"{proc_var(strip_array[1])}.click()"
-        case _:
-            print(f"ERROR: Execution command parse eval is None: {command}")
-            print(f"ERROR: Execution line parse: {line}")
-            exec_line = None 
+def get_cached_element_class():
 
-    return exec_line 
+    # Returns the CachedWebElement class, a web element held in the element cache. 
+    #
+    # If a command fails because the element has gone stale, for example after the 
+    # page re-rendered it, the element is located again with its original locator 
+    # and the command is retried once. The other cached elements of the driver are 
+    # likely stale too, so the cache of the driver is cleared. Clicking, or typing an 
+    # Enter key, may navigate away from the page, so both invalidate the element cache 
+    # of the driver. 
+    #
+    # The class extends Selenium's WebElement, so it is only defined once Selenium 
+    # has been imported.
 
+    if "class" in cached_element_class:
+        return cached_element_class["class"]
 
-def parse_proc_file(file_path):
+    from selenium.webdriver.remote.webelement import WebElement
+    from selenium.common.exceptions import StaleElementReferenceException
 
-    # This function reads a file containing procedure instructions and 
-    # processes each line to convert it into executable code. 
+    class CachedWebElement(WebElement):
 
-    # The function works as follows:
-    # 1. It opens the specified file and reads each line sequentially.
-    # 2. For each line, it checks if the line is blank or a comment (starting with "//").
-    # 3. It processes valid lines into executable code using `parse_proc_line`.
-    # 4. It appends the resulting executable code to a list.
-    # 5. It returns the list of executable code.
+        def __init__(self, element, by, value):
+            super().__init__(element.parent, element.id)
+            self.locator = (by, value)
 
-    # Parameters:
-    # file_path (str): The path to the procedure file to be processed.
+        def _execute(self, command, params=None):
+            try:
+                return super()._execute(command, params)
+            except StaleElementReferenceException:
+                element_cache_stats["stale"] += 1
+                invalidate_element_cache(self._parent)
+                self._id = self._parent.find_element(*self.locator).id
+                return super()._execute(command, params)
 
-    # Returns:
-    # list: A list of executable code lines derived from the procedure file.
+        def click(self):
+            super().click()
+            invalidate_element_cache(self._parent)
 
-    # Array to store executable code. 
-    execution_code = []
+        def send_keys(self, *value):
+            super().send_keys(*value)
+            if any(key in str(text) for text in value for key in ENTER_KEYS):
+                invalidate_element_cache(self._parent)
 
-    # Opens the file and reads each line sequentially. 
-    with open(file_path, "r") as file: 
-        for line in file: 
-
-            # If the line is blank, skip. 
-            if len(line.strip()) == 0:
-                 continue 
-            
-            # If the line is a comment line. 
-            if line.startswith("//"):
-                continue
+    cached_element_class["class"] = CachedWebElement
+    return CachedWebElement
 
-            # Add the line as execution code. 
-            parse_exec_line = parse_proc_line(line)
-            execution_code.append(parse_exec_line) 
 
-    return execution_code
+def configure_element_cache(enabled=True):
 
+    # The configure_element_cache function turns the element cache on or off. 
+    #
+    # With the cache enabled, repeated lookups of the same locator on the same page 
+    # return the element found the first time, saving a WebDriver round trip each. 
+    # The cache of a driver is cleared by `goto` (browser_load), by clicks, by typing 
+    # an Enter key and by the `waitfor url`, `waitfor title` and `waitfor ready` 
+    # commands, which follow a navigation. Elements which have gone stale are located 
+    # again transparently. Counters are kept in `element_cache_stats`.
+    #
+    # A hit is served without checking the current URL, as that check would cost 
+    # the round trip the cache saves. A page loaded some other way, e.g. by a script 
+    # or a redirect, leaves the cached elements of the old page stale, so they are 
+    # located again on the new page the first time they are used.
+    #
+    # Parameters:
+    # enabled (bool): Whether lookups should use the cache.
+    #
+    # Returns:
+    # None: The function doesn't return a value. 
 
-def exec_proc_from_file(file_path):
+    element_cache_settings["enabled"] = enabled
+    element_cache.clear()
 
-    # This function executes a procedure file by parsing and executing 
-    # each line in the file sequentially. 
 
-    # The function works as follows:
-    # 1. It reads the procedure file and determines the execution stages.
-    # 2. For each stage, it parses the variables in the stage using `parse_var`.
-    # 3. It then prints the parsed stage for debugging or logging purposes.
-    # 4. Finally, it executes the code of each stage using the `exec` function 
-    #    with the provided global and variable context.
+def get_cached_element(driver, by, value, count_miss=True):
 
+    # Returns an element from the element cache. 
+    #
     # Parameters:
-    # file_path (str): The path to the procedure file that contains the instructions 
-    # to be executed.
+    #    driver (WebDriver): The driver the element belongs to.
+    #    by (str): The Selenium locator strategy, e.g. "id".
+    #    value (str): The locator value.
+    #    count_miss (bool): Whether a miss is counted, False where the caller counts it.
+    #
+    # Returns:
+    #    WebElement or None: The cached element, or None on a miss or when the cache is disabled.
+
+    if not element_cache_settings["enabled"]:
+        return None
+
+    element = element_cache.get(driver, {}).get((by, value))
+    if element is not None:
+        element_cache_stats["hits"] += 1
+    elif count_miss:
+        element_cache_stats["misses"] += 1
+    return element
 
+
+def cache_element(driver, by, value, element):
+
+    # Stores a located element in the element cache. 
+    #
+    # Parameters:
+    #    driver (WebDriver): The driver the element belongs to.
+    #    by (str): The Selenium locator strategy, e.g. "id".
+    #    value (str): The locator value.
+    #    element (WebElement): The located element.
+    #
     # Returns:
-    # None: This function does not return anything but executes code dynamically 
-    # as it processes each stage in the procedure file.
+    #    WebElement: The element to hand to the procedure, which re-locates itself 
+    #       if it goes stale when it is a Selenium web element.
+
+    if not element_cache_settings["enabled"]:
+        return element
 
-    # Determines execution stages. 
-    execution_stages = parse_proc_file(file_path)
+    # An element can only be a Selenium web element once Selenium has been imported. 
+    if "selenium" in sys.modules:
+        from selenium.webdriver.remote.webelement import WebElement
+        CachedWebElement = get_cached_element_class()
+        if isinstance(element, WebElement) and not isinstance(element, CachedWebElement):
+            element = CachedWebElement(element, by, value)
+    element_cache.setdefault(driver, {})[(by, value)] = element
+    return element
+
+
+def invalidate_element_cache(driver):
+
+    # Clears the cached elements of a driver, e.g. when it navigates to a new page. 
+    #
+    # Parameters:
+    #    driver (WebDriver): The driver whose cache is cleared.
+    #
+    # Returns:
+    #    This function does not return a value. 
+
+    if element_cache.pop(driver, None):
+        element_cache_stats["invalidations"] += 1
+
+
+def get_element_by_id(driver, id):
+
+    # The get_element_by_id function locates an element on the web page using its ID.
+    #
+    # Parameters:
+    # driver (WebDriver): The Selenium WebDriver instance used to locate the element.
+    # id (str): The ID attribute of the element to be located on the page.
+    #
+    # Returns:
+    # element (WebElement or None): Returns the WebElement if the element is found. 
+    #   If an error occurs or the element is not found, it prints an error message and returns None.
+
+    # Returns the cached element, if the element cache is enabled and holds it. 
+    element = get_cached_element(driver, LOCATOR_STRATEGIES["id"], id)
+    if element is not None:
+        return element
+
+    try:
+        element = cache_element(driver, LOCATOR_STRATEGIES["id"], id, driver.find_element(by=LOCATOR_STRATEGIES["id"], value=id))
+        return element 
+    except Exception as e:
+        log_entry("error", f"Get element by Id error: {e}")
+        return None 
+    
+
+def get_element_by_name(driver, name):
+
+    # Attempts to find a web element by its 'name' attribute.
+    #
+    # This function uses the provided WebDriver instance to locate an element 
+    # on the webpage using the 'name' attribute. If successful, it returns 
+    # the located element. In the event of an error (e.g. element not found), 
+    # an error message is logged and the function returns None.
+    #
+    # Parameters:
+    #    driver (WebDriver): The Selenium WebDriver instance used to interact with the page.
+    #    name (str): The 'name' attribute of the element to be located.
+    #
+    # Returns:
+    #    WebElement or None: The located web element if found, otherwise None.
+
+    # Returns the cached element, if the element cache is enabled and holds it. 
+    element = get_cached_element(driver, LOCATOR_STRATEGIES["name"], name)
+    if element is not None:
+        return element
+
+    try:
+        element = cache_element(driver, LOCATOR_STRATEGIES["name"], name, driver.find_element(by=LOCATOR_STRATEGIES["name"], value=name))
+        return element
+    except Exception as e:
+        log_entry("error", f"Get element by name error: {e}")
+        return None 
+    
+
+def get_element_by_class_name(driver, class_name):
+
+    # Attempts to find a web element by its 'class' attribute.
+    #
+    # This function uses the provided WebDriver instance to locate an element 
+    # on the page by its 'class' attribute. If the element is found, it is 
+    # returned. If an error occurs (such as the element not being found), 
+    # an error message is logged and None is returned.
+    #
+    # Parameters:
+    #    driver (WebDriver): The Selenium WebDriver instance used to interact with the page.
+    #    class_name (str): The 'class' attribute of the element to be located.
+    #
+    # Returns:
+    # 
+
+    # Returns the cached element, if the element cache is enabled and holds it. 
+    element = get_cached_element(driver, LOCATOR_STRATEGIES["class"], class_name)
+    if element is not None:
+        return element
+
+    try:
+        element = cache_element(driver, LOCATOR_STRATEGIES["class"], class_name, driver.find_element(by=LOCATOR_STRATEGIES["class"], value=class_name))
+        return element 
+    except Exception as e:
+        log_entry("error", f"Get element by class name error: {e}")
+        return None 
+
+
+def get_element_by_css_selector(driver, selector):
+
+    # Attempts to find a web element using a CSS selector.
+    #
+    # This function uses the provided WebDriver instance to locate an element 
+    # on the page via a CSS selector. If the element is located successfully, 
+    # it is returned. If an error occurs, an error message is logged and None 
+    # is returned.
+    #
+    # Parameters:
+    #    driver (WebDriver): The Selenium WebDriver instance used to interact with the page.
+    #    selector (str): The CSS selector used to identify the element.
+    #
+    # Returns:
+    #    WebElement or None: The located web element if found, otherwise None.
+
+    # Returns the cached element, if the element cache is enabled and holds it. 
+    element = get_cached_element(driver, LOCATOR_STRATEGIES["css"], selector)
+    if element is not None:
+        return element
+
+    try:
+        element = cache_element(driver, LOCATOR_STRATEGIES["css"], selector, driver.find_element(by=LOCATOR_STRATEGIES["css"], value=selector))
+        return element 
+    except Exception as e:
+        log_entry("error", f"Get element by CSS selector error: {e}")
+        return None 
+    
+
+def get_element_by_xpath(driver, xpath):
+
+    # Attempts to find a web element using an XPath expression.
+    #
+    # This function uses the provided WebDriver instance to locate an element 
+    # on the page via an XPath expression. If the element is found, it is 
+    # returned. If an error occurs (e.g. element not found), an error message 
+    # is logged and None is returned.
+    #
+    # Parameters:
+    #    driver (WebDriver): The Selenium WebDriver instance used to interact with the page.
+    #    xpath (str): The XPath expression used to locate the element.
+    #
+    # Returns:
+    #    WebElement or None: The located web element if found, otherwise None.
+
+    # Returns the cached element, if the element cache is enabled and holds it. 
+    element = get_cached_element(driver, LOCATOR_STRATEGIES["xpath"], xpath)
+    if element is not None:
+        return element
+
+    try:
+        element = cache_element(driver, LOCATOR_STRATEGIES["xpath"], xpath, driver.find_element(by=LOCATOR_STRATEGIES["xpath"], value=xpath))
+        return element
+    except Exception as e:
+        log_entry("error", f"Get element by xpath error: {e}")
+        return None 
+
+
+def get_elements_batch(driver, locators):
+
+    # Locates several elements with a single WebDriver round trip. 
+    #
+    # Elements held in the element cache are taken from it, and only the rest are 
+    # looked up.
+    #
+    # Every locator is resolved by one `execute_script` call. Any locator which 
+    # does not match, or the whole batch if the script fails, falls back to the 
+    # matching get_element_by_* function, so missing elements still honour the 
+    # implicit wait and are reported in the same way as individual lookups.
+    #
+    # Parameters:
+    #    driver (WebDriver): The Selenium WebDriver instance used to interact with the page.
+    #    locators (tuple): (command, value) pairs, where command is one of the 
+    #       lookup commands "gi", "gn", "gc", "gs" or "gx".
+    #
+    # Returns:
+    #    list: The located web elements in locator order, with None for any not found.
+
+    # Takes any elements held in the element cache, and looks up the rest. A miss is 
+    # counted once, here if the batch finds the element, otherwise by the fallback lookup. 
+    elements = [get_cached_element(driver, LOCATOR_STRATEGIES[LOOKUP_COMMANDS[command][0]], value, count_miss=False) 
+                for command, value in locators]
+    pending = [index for index, element in enumerate(elements) if element is None]
+
+    try:
+        if pending:
+            found = driver.execute_script(BATCH_LOOKUP_SCRIPT, [[LOOKUP_COMMANDS[locators[index][0]][0], locators[index][1]] for index in pending])
+            if not isinstance(found, list) or len(found) != len(pending):
+                raise ValueError(f"unexpected script result {found!r}")
+            for index, element in zip(pending, found):
+                if element is not None:
+                    command, value = locators[index]
+                    elements[index] = cache_element(driver, LOCATOR_STRATEGIES[LOOKUP_COMMANDS[command][0]], value, element)
+                    if element_cache_settings["enabled"]:
+                        element_cache_stats["misses"] += 1
+    except Exception as e:
+        log_entry("warning", f"Batch element lookup error, falling back to individual lookups: {e}")
+
+    for index, (command, value) in enumerate(locators):
+        if elements[index] is None:
+            elements[index] = globals()[LOOKUP_COMMANDS[command][1]](driver, value)
+
+    return elements
+
+
+def fetch_url(driver, url, method="GET", body=None, content_type=None, timeout=FETCH_TIMEOUT):
+
+    # The fetch_url function requests a URL over plain HTTP, without loading it in the browser, 
+    # and returns the response body. See `fetch_urls`.
+    #
+    # Parameters:
+    # driver (WebDriver): The browser session whose cookies and user agent are sent, or None.
+    # url (str): The URL to request.
+    # method (str): The HTTP method, "GET" or "POST".
+    # body (str): The request body, or None.
+    # content_type (str): The content type of the request body.
+    # timeout (int or float): The number of seconds to wait for a response.
+    #
+    # Returns:
+    # str or None: The response body, or None if the request failed.
+
+    return fetch_urls(driver, ((url, method, body, content_type, timeout),))[0]
+
+
+def fetch_urls(driver, requests):
+
+    # The fetch_urls function sends several HTTP requests at the same time, with the cookies 
+    # and user agent of a browser session, so pages which do not need JavaScript can be read 
+    # without a browser navigation. 
+
+    # The function works as follows:
+    # 1. The cookies and user agent of the session are read once for every request. 
+    # 2. The requests are sent from a thread pool over pooled keep-alive connections, 
+    #    see `send_fetch_request`.
+    # 3. The response bodies are returned in request order.
+
+    # Parameters:
+    # driver (WebDriver): The browser session whose cookies and user agent are sent, or None.
+    # requests (tuple): (url, method, body, content_type, timeout) tuples.
+
+    # Returns:
+    # list: The response bodies, with None for any request which failed.
+
+    user_agent, cookies = get_fetch_session(driver)
+
+    if len(requests) == 1:
+        return [send_fetch_request(*requests[0], user_agent, cookies)]
+
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=min(FETCH_MAX_WORKERS, len(requests))) as executor:
+        return list(executor.map(lambda request: send_fetch_request(*request, user_agent, cookies), requests))
+
+
+def get_fetch_session(driver):
+
+    # Reads the user agent and cookies of a browser session, to be sent with fetches. 
+    #
+    # Parameters:
+    #    driver (WebDriver): The browser session, or None.
+    #
+    # Returns:
+    #    tuple: (user_agent, cookies), or (None, []) if there is no session or it cannot be read.
+
+    if driver is None:
+        return None, []
+
+    try:
+        user_agent = fetch_user_agents.get(driver)
+        if user_agent is None:
+            user_agent = fetch_user_agents[driver] = driver.execute_script("return navigator.userAgent;")
+        return user_agent, driver.get_cookies()
+    except Exception as e:
+        log_entry("warning", f"Unable to read the browser session for fetch: {e}")
+        return None, []
+
+
+def cookie_matches_url(cookie, parts):
+
+    # Checks whether a browser cookie would be sent to a URL, by its domain, path and secure flag. 
+    #
+    # Parameters:
+    #    cookie (dict): A cookie, as returned by `get_cookies`.
+    #    parts (SplitResult): The URL, split with `urllib.parse.urlsplit`.
+    #
+    # Returns:
+    #    bool: True if the cookie applies to the URL.
+
+    host = (parts.hostname or "").lower()
+    domain = (cookie.get("domain") or host).lower().lstrip(".")
+    if host != domain and not host.endswith("." + domain):
+        return False
+
+    path = cookie.get("path") or "/"
+    request_path = parts.path or "/"
+    if request_path != path and not request_path.startswith(path.rstrip("/") + "/"):
+        return False
+
+    return not cookie.get("secure") or parts.scheme == "https"
+
+
+def send_fetch_request(url, method, body, content_type, timeout, user_agent, cookies):
+
+    # The send_fetch_request function sends a single HTTP request and reads its response. 
+
+    # The function works as follows:
+    # 1. The request is sent with the user agent and the cookies which apply to the URL, 
+    #    using `send_http_request`, or `exchange_network_archive` when the network archive is on. 
+    # 2. Redirects are followed, up to FETCH_MAX_REDIRECTS. A 303, or a 301 or 302 in 
+    #    answer to a POST, is followed with a GET.
+    # 3. The body is decompressed and decoded with the charset of the response.
+
+    # Parameters:
+    # url (str): The URL to request.
+    # method (str): The HTTP method.
+    # body (str): The request body, or None.
+    # content_type (str): The content type of the request body.
+    # timeout (int or float): The number of seconds to wait for a response.
+    # user_agent (str): The user agent to send, or None.
+    # cookies (list): The browser cookies, of which those matching the URL are sent.
+
+    # Returns:
+    # str or None: The response body, or None if the request failed.
+
+    import http.client
+
+    method = method.upper()
+    for _ in range(FETCH_MAX_REDIRECTS + 1):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            log_entry("error", f"Fetch error: unsupported URL {url}")
+            return None
+
+        headers = {"Accept-Encoding": "gzip, deflate"}
+        if user_agent:
+            headers["User-Agent"] = user_agent
+        cookie_header = "; ".join(f"{cookie['name']}={cookie['value']}" for cookie in cookies if cookie_matches_url(cookie, parts))
+        if cookie_header:
+            headers["Cookie"] = cookie_header
+        payload = None
+        if body is not None:
+            payload = body if isinstance(body, bytes) else str(body).encode("utf-8")
+            headers["Content-Type"] = content_type or "application/x-www-form-urlencoded"
+
+        if network_archive["mode"] is not None:
+            exchange = exchange_network_archive(method, url, headers, payload, timeout)
+        else:
+            exchange = send_http_request(method, url, headers, payload, timeout)
+        if exchange is None:
+            return None
+
+        status, response_headers, data = exchange
+        response = http.client.HTTPMessage()
+        for name, value in response_headers:
+            response[name] = value
+
+        # Follows redirects. 
+        location = response.get("Location")
+        if status in (301, 302, 303, 307, 308) and location:
+            url = urllib.parse.urljoin(url, location)
+            if status == 303 or (status in (301, 302) and method == "POST"):
+                method, body = "GET", None
+            continue
+
+        if status >= 400:
+            log_entry("warning", f"Fetch {method} {url} returned HTTP {status}")
+
+        encoding = (response.get("Content-Encoding") or "").lower()
+        if encoding in ("gzip", "deflate"):
+            try:
+                data = zlib.decompress(data, 47)
+            except zlib.error:
+                data = zlib.decompress(data, -15)
+        return data.decode(response.get_content_charset() or "utf-8", errors="replace")
+
+    log_entry("error", f"Fetch error: {url}: more than {FETCH_MAX_REDIRECTS} redirects")
+    return None
+
+
+def send_http_request(method, url, headers, payload, timeout):
+
+    # Sends a single HTTP request on a pooled keep-alive connection and reads its response. 
+    #
+    # A keep-alive connection to the host is taken from the pool, or opened, and returned 
+    # to the pool once the response has been read. If a pooled connection has been closed 
+    # by the server, the request is sent again on a new connection. Redirects are not followed.
+    #
+    # Parameters:
+    #    method (str): The HTTP method.
+    #    url (str): The absolute URL to request.
+    #    headers (dict): The request headers.
+    #    payload (bytes): The request body, or None.
+    #    timeout (int or float): The number of seconds to wait for a response.
+    #
+    # Returns:
+    #    tuple or None: (status, headers, body), with the headers as a list of (name, value) 
+    #       pairs and the body as raw bytes, or None if the request failed.
+
+    import http.client
+
+    parts = urllib.parse.urlsplit(url)
+    path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+    key = (parts.scheme, parts.hostname, parts.port)
+
+    # Sends the request, once more on a new connection if a pooled one had been closed. 
+    for attempt in range(2):
+        connection, reused = acquire_fetch_connection(key, timeout)
+        try:
+            connection.request(method, path, body=payload, headers=headers)
+            response = connection.getresponse()
+            data = response.read()
+            break
+        except Exception as e:
+            connection.close()
+            if reused and attempt == 0 and isinstance(e, (ConnectionError, http.client.BadStatusLine)):
+                continue
+            log_entry("error", f"Fetch error: {method} {url}: {e}")
+            return None
+
+    if response.will_close:
+        connection.close()
+    else:
+        release_fetch_connection(key, connection)
+
+    return response.status, response.getheaders(), data
+
+
+def acquire_fetch_connection(key, timeout):
+
+    # Takes an idle keep-alive connection from the fetch pool, or opens a new one. 
+    #
+    # Parameters:
+    #    key (tuple): The (scheme, host, port) of the connection.
+    #    timeout (int or float): The socket timeout, in seconds.
+    #
+    # Returns:
+    #    tuple: (connection, reused), where reused is True for a pooled connection.
+
+    with fetch_lock:
+        idle = fetch_connections.get(key)
+        connection = idle.pop() if idle else None
+
+    if connection is not None:
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+        return connection, True
+
+    import http.client
+
+    scheme, host, port = key
+    connection_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+    return connection_class(host, port, timeout=timeout), False
+
+
+def release_fetch_connection(key, connection):
+
+    # Returns a connection to the fetch pool, or closes it if the pool for its host is full. 
+    #
+    # Parameters:
+    #    key (tuple): The (scheme, host, port) of the connection.
+    #    connection (HTTPConnection): The connection, with its last response fully read.
+    #
+    # Returns:
+    #    This function does not return a value. 
+
+    with fetch_lock:
+        idle = fetch_connections.setdefault(key, [])
+        if len(idle) < FETCH_MAX_IDLE:
+            idle.append(connection)
+            return
+    connection.close()
+
+
+def close_fetch_connections():
+
+    # Closes every idle connection in the fetch pool. 
+    #
+    # Parameters:
+    #    None: The function does not take a parameter. 
+    #
+    # Returns:
+    #    This function does not return a value. 
+
+    with fetch_lock:
+        connections = [connection for idle in fetch_connections.values() for connection in idle]
+        fetch_connections.clear()
+    for connection in connections:
+        connection.close()
+
+
+def start_network_archive(archive_path, mode="replay", port=0):
+
+    # The start_network_archive function starts a local proxy which records the responses 
+    # of every page a browser loads to a network archive, or replays them from it, so that 
+    # procedures can be re-run quickly, offline, and with the same result every time. 
+
+    # The function works as follows:
+    # 1. It loads the index of the archive and starts the proxy on a localhost port.
+    # 2. Browsers started from then on with `get_web_driver` are set to use the proxy, 
+    #    and `fetch` uses the archive directly.
+    # 3. In "record" mode every request is sent to the network, and its response is saved 
+    #    in the archive before it is returned. A request recorded again replaces the 
+    #    earlier response.
+    # 4. In "replay" mode every response comes from the archive, and nothing is sent to the 
+    #    network. A request which is not in the archive fails with HTTP 502.
+
+    # The archive is a directory holding "index.jsonl", a JSON line for each recorded 
+    # request, and the response bodies in "bodies", named by their SHA-256 hash so that 
+    # each distinct body is stored once. Requests are matched by method, URL and body.
+
+    # HTTPS requests are read with a self-signed certificate, which the browsers are set 
+    # to accept. It is made with the openssl command, when it is installed; otherwise HTTPS 
+    # is passed through unrecorded in "record" mode, and fails in "replay" mode.
+
+    # Parameters:
+    # archive_path (str): The directory of the archive. It is created if it does not exist.
+    # mode (str): "record" or "replay".
+    # port (int): The localhost port of the proxy, or 0 for any free port.
+
+    # Returns:
+    # int: The port of the proxy. 
+
+    if mode not in ("record", "replay"):
+        raise ValueError(f"Unknown network archive mode: {mode}")
+
+    import ssl
+    from http.server import ThreadingHTTPServer
+
+    stop_network_archive()
+    os.makedirs(os.path.join(archive_path, "bodies"), exist_ok=True)
+
+    tls = None
+    certificate = get_network_archive_certificate()
+    if certificate is not None:
+        tls = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        tls.load_cert_chain(*certificate)
+        tls.set_alpn_protocols(["http/1.1"])
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), get_network_archive_handler())
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="procbot-archive", daemon=True).start()
+
+    network_archive.update({"mode": mode, "path": archive_path, "index": load_network_archive_index(archive_path), 
+                            "server": server, "port": server.server_address[1], "tls": tls})
+    network_archive_stats.update({key: 0 for key in network_archive_stats})
+    log_entry("info", f"Network archive {archive_path} in {mode} mode, proxy on port {network_archive['port']}")
+    return network_archive["port"]
+
+
+def stop_network_archive():
+
+    # Stops the network archive proxy, see `start_network_archive`. 
+    #
+    # Parameters:
+    #    None: The function does not take a parameter. 
+    #
+    # Returns:
+    #    dict or None: The archive counters, or None if the archive was not on.
+
+    server = network_archive["server"]
+    if server is None:
+        return None
+
+    server.shutdown()
+    server.server_close()
+    network_archive.update({"mode": None, "path": None, "index": {}, "server": None, "port": None, "tls": None})
+    log_entry("info", f"Network archive: {network_archive_stats}")
+    return dict(network_archive_stats)
+
+
+def load_network_archive_index(archive_path):
+
+    # Reads the index of a network archive, later entries replacing earlier ones. 
+    #
+    # Parameters:
+    #    archive_path (str): The directory of the archive.
+    #
+    # Returns:
+    #    dict: The archived responses, keyed by (method, URL, request body digest).
+
+    index = {}
+    try:
+        with open(os.path.join(archive_path, "index.jsonl"), "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                    index[(entry["method"], entry["url"], entry["request"])] = entry
+                except (ValueError, KeyError, TypeError):
+                    continue
+    except FileNotFoundError:
+        pass
+    return index
+
+
+def get_network_archive_certificate():
+
+    # Returns the self-signed certificate the network archive proxy reads HTTPS with, 
+    # making it with the openssl command the first time. 
+    #
+    # Parameters:
+    #    None: The function does not take a parameter. 
+    #
+    # Returns:
+    #    tuple or None: The (certificate, key) file paths, or None if openssl is not installed.
+
+    certificate = os.path.join(proc_cache_directory, "archive-proxy.pem")
+    key = os.path.join(proc_cache_directory, "archive-proxy.key")
+    if os.path.exists(certificate) and os.path.exists(key):
+        return certificate, key
+
+    import shutil
+    import subprocess
+
+    openssl = shutil.which("openssl")
+    if openssl is None:
+        log_entry("warning", "openssl is not installed, so HTTPS is not archived")
+        return None
+
+    try:
+        os.makedirs(proc_cache_directory, exist_ok=True)
+        subprocess.run([openssl, "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "3650", 
+                        "-subj", "/CN=ProcBot network archive", "-keyout", key, "-out", certificate], 
+                       check=True, capture_output=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        log_entry("warning", f"Unable to make the network archive certificate, so HTTPS is not archived: {e}")
+        return None
+    return certificate, key
+
+
+def exchange_network_archive(method, url, headers, payload, timeout):
+
+    # Sends a request through the network archive: in "record" mode the request is sent 
+    # with `send_http_request` and its response saved, in "replay" mode the response is 
+    # read from the archive. 
+    #
+    # Parameters:
+    #    method (str): The HTTP method.
+    #    url (str): The absolute URL to request.
+    #    headers (dict): The request headers.
+    #    payload (bytes): The request body, or None.
+    #    timeout (int or float): The number of seconds to wait for a response.
+    #
+    # Returns:
+    #    tuple or None: (status, headers, body), see `send_http_request`, or None if the 
+    #       request failed or is not in the archive.
+
+    key = (method.upper(), url, hashlib.sha256(payload).hexdigest() if payload else None)
+    archive_path = network_archive["path"]
+
+    if network_archive["mode"] == "replay":
+        entry = network_archive["index"].get(key)
+        try:
+            if entry is not None:
+                with open(os.path.join(archive_path, "bodies", entry["body"][:2], entry["body"]), "rb") as file:
+                    data = file.read()
+                network_archive_stats["replayed"] += 1
+                return entry["status"], [tuple(header) for header in entry["headers"]], data
+        except OSError as e:
+            log_entry("error", f"Network archive error: {method} {url}: {e}")
+        network_archive_stats["missed"] += 1
+        log_entry("warning", f"Not in the network archive: {method} {url}")
+        return None
+
+    exchange = send_http_request(method, url, headers, payload, timeout)
+    if exchange is None:
+        return None
+
+    # Stores the body under its hash, once, then appends the response to the index. 
+    status, response_headers, data = exchange
+    digest = hashlib.sha256(data).hexdigest()
+    body_path = os.path.join(archive_path, "bodies", digest[:2], digest)
+    if not os.path.exists(body_path):
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+        temporary_path = f"{body_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary_path, "wb") as file:
+            file.write(data)
+        os.replace(temporary_path, body_path)
+
+    headers = [(name, value) for name, value in response_headers if name.lower() not in HOP_BY_HOP_HEADERS]
+    entry = {"method": key[0], "url": url, "request": key[2], "status": status, "headers": headers, "body": digest}
+    with network_archive["lock"]:
+        with open(os.path.join(archive_path, "index.jsonl"), "a", encoding="utf-8") as file:
+            file.write(json.dumps(entry) + "\n")
+        network_archive["index"][key] = entry
+        network_archive_stats["recorded"] += 1
+    return exchange
+
+
+def get_network_archive_handler():
+
+    # Returns the request handler class of the network archive proxy, see `start_network_archive`. 
+    #
+    # The proxy answers plain HTTP requests, and CONNECT requests for HTTPS, which it reads 
+    # with the archive certificate. The class is defined on first use, so that the HTTP 
+    # server modules are only imported when the archive is on.
+
+    if "archive" in server_classes:
+        return server_classes["archive"]
+
+    import select
+    import socket
+    from http.server import BaseHTTPRequestHandler
+
+    class NetworkArchiveHandler(BaseHTTPRequestHandler):
+
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+        origin = None
+
+        def do_GET(self):
+            url = f"https://{self.origin}{self.path}" if self.origin else self.path
+            if not url.startswith(("http://", "https://")):
+                return self.send_error(400, "Not a proxy request")
+
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = self.rfile.read(length) if length else None
+            headers = {name: value for name, value in self.headers.items() if name.lower() not in HOP_BY_HOP_HEADERS}
+            exchange = exchange_network_archive(self.command, url, headers, payload, FETCH_TIMEOUT)
+            if exchange is None:
+                return self.send_error(502, "Not in the network archive" if network_archive["mode"] == "replay" else "Request failed")
+
+            status, response_headers, data = exchange
+            self.send_response_only(status)
+            for name, value in response_headers:
+                if name.lower() not in HOP_BY_HOP_HEADERS and (name.lower() != "content-length" or self.command == "HEAD"):
+                    self.send_header(name, value)
+            if self.command != "HEAD":
+                self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(data)
+
+        do_HEAD = do_POST = do_PUT = do_PATCH = do_DELETE = do_OPTIONS = do_GET
+
+        def do_CONNECT(self):
+            host, _, port = self.path.rpartition(":")
+            tls = network_archive["tls"]
+            if tls is None:
+                if network_archive["mode"] == "replay":
+                    return self.send_error(502, "HTTPS cannot be replayed without openssl")
+                return self.relay_tunnel(host, int(port))
+
+            self.send_response_only(200, "Connection Established")
+            self.end_headers()
+
+            # Reads the requests inside the tunnel as HTTPS requests to the host. 
+            try:
+                self.connection = tls.wrap_socket(self.connection, server_side=True)
+            except (OSError, ValueError) as e:
+                log_entry("debug", f"Network archive TLS error for {host}: {e}")
+                self.close_connection = True
+                return
+            self.rfile = self.connection.makefile("rb")
+            self.wfile = self.connection.makefile("wb")
+            self.origin = host if port == "443" else self.path
+            self.close_connection = False
+            while not self.close_connection:
+                self.handle_one_request()
+            self.close_connection = True
+
+        def relay_tunnel(self, host, port):
+            try:
+                upstream = socket.create_connection((host, port), timeout=FETCH_TIMEOUT)
+            except OSError as e:
+                return self.send_error(502, str(e))
+            network_archive_stats["tunnelled"] += 1
+            self.send_response_only(200, "Connection Established")
+            self.end_headers()
+
+            # Copies bytes both ways until either side closes. 
+            sockets = [self.connection, upstream]
+            try:
+                while True:
+                    readable, _, _ = select.select(sockets, [], [], FETCH_TIMEOUT)
+                    if not readable:
+                        break
+                    for source in readable:
+                        data = source.recv(65536)
+                        if not data:
+                            return
+                        (upstream if source is self.connection else self.connection).sendall(data)
+            except OSError:
+                pass
+            finally:
+                upstream.close()
+                self.close_connection = True
+
+        def log_message(self, format, *args):
+            log_entry("debug", f"Network archive request: {format % args}")
+
+    server_classes["archive"] = NetworkArchiveHandler
+    return NetworkArchiveHandler
+
+
+def extract_rows(driver, row_selector, sink, fields, next_selector=None, pages=None, timeout=DEFAULT_WAIT_TIMEOUT):
+
+    # The extract_rows function reads many rows of a page, e.g. a table or a list of results, 
+    # and writes them to a CSV or JSON lines file. 
+
+    # The function works as follows:
+    # 1. Every row matching the row selector is read with one `execute_script` call, taking 
+    #    each field from the first element in the row matching its selector. A field is the 
+    #    text of the element, or one of its attributes when the field ends with "@<attribute>". 
+    #    A field selector of "" or "." is the row itself.
+    # 2. The rows are written to the file straight away, as CSV with a header row, or as 
+    #    JSON lines for files ending in .jsonl, .ndjson or .json.
+    # 3. If a next page selector is given and matches, the same call clicks it. The function 
+    #    waits for the next page, or for the rows to be replaced, and reads it in the same way. 
+    #    This carries on until there is no next page, or `pages` pages have been read.
+
+    # Parameters:
+    # driver (WebDriver): The Selenium WebDriver instance used to interact with the page.
+    # row_selector (str): The CSS selector of the rows.
+    # sink (str): The path of the CSV or JSON lines file to write.
+    # fields (tuple): (name, selector) pairs, where selector is a CSS selector within the 
+    #   row, optionally followed by "@<attribute>".
+    # next_selector (str): The CSS selector of the next page link or button, or None.
+    # pages (int): The most pages to read, or None for no limit.
+    # timeout (int or float): The number of seconds to wait for each next page.
+
+    # Returns:
+    # int: The number of rows written.
+
+    names = [name for name, _ in fields]
+    specs = []
+    for _, selector in fields:
+        match = EXTRACT_ATTRIBUTE_PATTERN.search(selector)
+        attribute = match.group(1) if match else None
+        selector = selector[:match.start()] if match else selector
+        specs.append([selector.strip() if selector.strip() != "." else "", attribute])
+
+    pages = int(pages) if pages is not None else None
+    json_lines = sink.lower().endswith((".jsonl", ".ndjson", ".json"))
+    count = 0
+    page = 0
+
+    with open(sink, "w", newline="") as file:
+        writer = None if json_lines else csv.writer(file)
+        if writer is not None:
+            writer.writerow(names)
+
+        while True:
+            page += 1
+            more = next_selector is not None and (pages is None or page < pages)
+            result = driver.execute_script(EXTRACT_SCRIPT, row_selector, specs, next_selector if more else None)
+
+            # Writes the page. 
+            for record in result["rows"]:
+                if writer is not None:
+                    writer.writerow(["" if value is None else value for value in record])
+                else:
+                    file.write(json.dumps(dict(zip(names, record))) + "\n")
+            count += len(result["rows"])
+            file.flush()
+
+            if not result["next"]:
+                break
+
+            # Waits for the next page. 
+            invalidate_element_cache(driver)
+            def next_page(driver):
+                return driver.execute_script(EXTRACT_WAIT_SCRIPT, row_selector)
+            try:
+                browser_wait_until(driver, next_page, f"the next page after page {page}", timeout)
+            except TimeoutError:
+                log_entry("warning", f"Extract stopped after page {page}, the next page did not load")
+                break
+
+    log_entry("info", f"Extracted {count} rows from {page} pages to {sink}")
+    return count
+
+
+def browser_stop_with_confirmation(driver):
+
+    # Attempts to quit the current Selenium session.
+    #
+    # This function uses the provided WebDriver to quit all concurrent processes. 
+    #
+    # Parameters:
+    #    driver (WebDriver): The Selenium WebDriver instance used to interact with the page.
+    #
+    # Returns:
+    #    This function does not return a value. 
+
+    # User prompt.
+    print(f"Press enter to close the browser process...")
+    input()
+
+    # Quits the browser session. 
+    print(f"Closing the browser.")
+    release_web_driver(driver)
+
+
+def start_test_harness():
+
+    # The start_test_harness function runs through a test harness process to ensure the engine is working correctly.
+    #
+    # Parameters:
+    # None: The function does not take a parameter. 
+    #
+    # Returns:
+    # None: The function doesn't return a value. 
+
+    # Defines the test URL.
+    test_url = "https://duckduckgo.com/"
+
+    # Gets the browser driver. 
+    print(f"Fetching browser driver.")
+    browser = get_web_driver("Chrome")
+    if browser is None:
+        print("Unable to get the browser driver.")
+        return False 
+    print(browser)
+
+    # Loads the browser and navigates to the test URL.
+    print(f"Loading browser and navigating to test URL: {test_url}")
+    browser_load(browser, test_url)
+
+    # Runs test search
+    search_box = get_element_by_id(browser, "searchbox_input")
+    search_button = get_element_by_xpath(browser, '//*[@id="searchbox_homepage"]/div/div/div/button')
+    search_box.send_keys("Lorem ipsum")
+    process_wait(2)
+    search_button.click()
+    process_wait(2)
+
+    # Graceful browser stop with confirmation. 
+    browser_stop_with_confirmation(browser)
+
+    return True 
+
+
+# Function to replace each dictionary query with its value from the dictionary
+def parse_var(candidate_exec_line, variable_dictionary):
+
+        # This function processes a line of code (candidate_exec_line) and replaces any 
+    # occurrences of variables within the `variable_dictionary` pattern with 
+    # their corresponding values from the provided dictionary.
+
+    # The function uses regular expressions to identify the variables written 
+    # in the form of `variable_dictionary['key']`, where 'key' is a string that 
+    # matches a key in the provided `variable_dictionary`.
+
+    # Parameters:
+    # candidate_exec_line (str): A string representing the line of code to be parsed. 
+    # variable_dictionary (dict): A dictionary where keys represent variable names 
+    # and values represent their corresponding values.
+
+    # Returns:
+    # str: The modified `candidate_exec_line` where all recognised variables are 
+    # replaced with their respective values from `variable_dictionary`.
+
+    # The function works as follows:
+    # 1. The precompiled `VAR_QUERY_PATTERN` finds occurrences of the form 
+    #    `variable_dictionary['key']` in the input line.
+    # 2. For each match, the function checks if the variable (`key`) exists in 
+    #    the `variable_dictionary`.
+    # 3. If a match is found in the dictionary, it replaces the `variable_dictionary['key']` 
+    #    with the actual value of the key in the dictionary.
+    # 4. The modified line is returned after all replacements have been made in one pass.
+
+    # Replaces every recognised dictionary query in a single pass. 
+    def replace_query(match):
+        key = match.group(1)
+        if key in variable_dictionary:
+            return str(variable_dictionary[key])
+        return match.group(0)
+
+    return VAR_QUERY_PATTERN.sub(replace_query, candidate_exec_line)
+
+
+def tokenise_proc_line(line, line_number=None, file_path="<proc>"):
+
+    # This function splits a line of a procedure into tokens in a single pass, 
+    # keeping quoted strings together with their quotes.
+
+    # The function works as follows:
+    # 1. The precompiled `TOKEN_PATTERN` is matched at the current position, skipping 
+    #    leading whitespace and consuming one token.
+    # 2. A token continues until unquoted whitespace, so a quoted string may contain 
+    #    spaces, the other kind of quote, or an escaped quote (e.g. "a \"b\" c").
+    # 3. Each token is recorded with its (1-based) column, and scanning carries on 
+    #    from the end of the token.
+
+    # Parameters:
+    # line (str): A line of a procedure.
+    # line_number (int): The line number, used in error messages.
+    # file_path (str): The name of the procedure, used in error messages.
+
+    # Returns:
+    # list: A list of (text, line_number, column) tuples. 
+    #   Raises a SyntaxError, with the line and column, if a quoted string is not closed.
+
+    tokens = []
+    position = 0
+    end = len(line.rstrip())
+
+    while position < end:
+        match = TOKEN_PATTERN.match(line, position)
+        if match is None:
+            column = len(line) - len(line[position:].lstrip()) + 1
+            raise SyntaxError("Unterminated quoted string", (file_path, line_number, column, line))
+        tokens.append((match.group(1), line_number, match.start(1) + 1))
+        position = match.end()
+
+    return tokens
+
+
+def preserve_quote_string(text):
+
+    # This function splits a given string (`text`) into components (words) while 
+    # preserving quoted strings, using `tokenise_proc_line`.
+
+    # Parameters:
+    # text (str): A string which may contain quoted substrings that need to be 
+    # preserved while splitting the text into components.
+
+    # Returns:
+    # list: A list of components (words) from the input string, with the 
+    # quoted substrings in their original positions.
+
+    return [token[0] for token in tokenise_proc_line(text)]
+
+
+def proc_var(statement):
+
+    # This function processes a given statement to check if it is a variable 
+    # in the form of "[var]" and, if so, converts it into a dictionary query 
+    # string that accesses the variable's value from `variable_dictionary`.
+
+    # The function works as follows:
+    # 1. It checks if the statement starts with the "[var]" identifier.
+    # 2. If the statement is a variable (starts with "[var]"), it removes the 
+    #    "[var]" identifier and constructs a string that queries the 
+    #    `variable_dictionary` for the variable's value.
+    # 3. If the statement does not start with "[var]", it returns the 
+    #    statement as-is without modification.
+
+    # Parameters:
+    # statement (str): A string representing the statement to be processed. 
+    # It is expected to be in the form of "[var]variable_name" for variables.
+
+    # Returns:
+    # str: A string which either represents a dictionary query for a variable 
+    # or the original statement if it is not a variable.
+
+    # Variables should start with [var].
+    var_identifier = "[var]"
+
+    # If this statement is a variable
+    if statement.startswith(var_identifier):
+
+        # Remove the identifier and return the dictionary query string. 
+        clean_var = statement.replace(var_identifier, "")
+        return f"variable_dictionary[{repr(clean_var)}]"
+    else:
+        return statement
+
+
+def parse_proc_line(line):
+
+    # This function processes a single line of code (line) representing a command 
+    # and translates it into an executable Python statement. 
+
+    # The function works as follows:
+    # 1. It strips any leading or trailing whitespace from the line.
+    # 2. It splits the stripped line into components (elements), preserving quoted strings.
+    # 3. It checks the first element (command) and constructs the corresponding executable code.
+    # 4. It returns the constructed executable line of code, or `None` if the command is unrecognised.
+
+    # Parameters:
+    # line (str): A string representing a command that is to be processed and converted 
+    # into executable code.
+
+    # Returns:
+    # str or None: The corresponding executable Python code based on the command, 
+    # or `None` if the command is not recognised.
+
+    # Strips out the line. 
+    strip_line = line.strip()
+
+    # Splits the stripped line into an array of its elements. 
+    strip_array = preserve_quote_string(strip_line)
+
+    return parse_proc_components(strip_array, line)
+
+
+def parse_proc_components(strip_array, line):
+
+    # This function translates the components of a line, as returned by 
+    # `preserve_quote_string`, into an executable Python statement. 
+    # See `parse_proc_line`.
+
+    # Parameters:
+    # strip_array (list): The components of the line.
+    # line (str): The original line, used in error messages.
+
+    # Returns:
+    # str or None: The corresponding executable Python code based on the command, 
+    # or `None` if the command is not recognised or its arguments are not valid.
+
+    try:
+        exec_line = translate_proc_components(strip_array)
+    except ValueError as e:
+        log_entry("error", str(e))
+        exec_line = None
+    except IndexError:
+        exec_line = None
+
+    if exec_line is None:
+        log_entry("error", f"Execution command parse eval is None: {strip_array[0]}")
+        log_entry("error", f"Execution line parse: {line.strip()}")
+
+    return exec_line 
+
+
+def translate_proc_components(strip_array):
+
+    # Translates the components of a line into an executable Python statement, without 
+    # reporting a line which cannot be translated. See `parse_proc_components`.
+    #
+    # Parameters:
+    #    strip_array (list): The components of the line.
+    #
+    # Returns:
+    #    str or None: The executable Python code, or `None` if the command is not recognised.
+    #       Raises a ValueError naming the argument if an argument is not recognised, and 
+    #       an IndexError if the line has too few arguments for its command.
+
+    # Gets the command element. 
+    command = strip_array[0]
+
+    # Process determination. 
+    exec_line = ""
+    match command:
+        case "var": 
+            exec_line = f"variable_dictionary['{proc_var(strip_array[1])}'] = {proc_var(strip_array[2])}"
+        case "start":
+            options = parse_start_options(strip_array[2:])
+            if options:
+                exec_line = f"browser = acquire_web_driver('{proc_var(strip_array[1])}', {options!r})"
+            else:
+                exec_line = f"browser = acquire_web_driver('{proc_var(strip_array[1])}')"
+        case "quit":
+            exec_line = f"release_web_driver(browser)"
+        case "session":
+            exec_line = f"browser = variable_dictionary[{repr(strip_array[1] + '.browser')}]"
+        case "stop":
+            exec_line = f"browser_stop_with_confirmation(browser)"
+        case "confirm":
+            exec_line = f"input({proc_var(strip_array[1])})"
+        case "goto":
+            exec_line = f"browser_load(browser, {proc_var(strip_array[1])})"
+        case "wait":
+            exec_line = f"process_wait({proc_var(strip_array[1])})"
+        case "implicitwait":
+            exec_line = f"browser_wait(browser, {proc_var(strip_array[1])})"
+        case "waitfor":
+            exec_line = parse_waitfor(strip_array)
+        case "gi":
+            exec_line = f"{proc_var(strip_array[1])} = get_element_by_id(browser, {proc_var(strip_array[2])})"
+        case "gn":
+            exec_line = f"{proc_var(strip_array[1])} = get_element_by_name(browser, {proc_var(strip_array[2])})"
+        case "gc":
+            exec_line = f"{proc_var(strip_array[1])} = get_element_by_class_name(browser, {proc_var(strip_array[2])})"
+        case "gs":
+            exec_line = f"{proc_var(strip_array[1])} = get_element_by_css_selector(browser, {proc_var(strip_array[2])})"
+        case "gx":
+            exec_line = f"{proc_var(strip_array[1])} = get_element_by_xpath(browser, {proc_var(strip_array[2])})"
+        case "type":
+            exec_line = f"{proc_var(strip_array[1])}.send_keys({proc_var(strip_array[2])})"
+        case "click":
+            exec_line = f"{proc_var(strip_array[1])}.click()"
+        case "extract":
+            exec_line = parse_extract(strip_array)
+        case "fetch":
+            fetch = parse_fetch(strip_array)
+            exec_line = f"{fetch[1]} = fetch_url(browser, *{fetch[2]})" if fetch is not None else None
+        case _:
+            exec_line = None 
+
+    return exec_line 
+
+
+def parse_start_options(components):
+
+    # This function reads the performance options given after the browser name 
+    # of a `start` line.
+
+    # The supported options are:
+    #   <profile>                  A named profile from BROWSER_PROFILES, e.g. fast
+    #   headless                   Runs the browser without a window
+    #   load=normal|eager|none     The page load strategy
+    #   block=images,fonts,media   Blocks resource types
+    #   blockurl=<pattern>         Blocks URLs matching a pattern, e.g. "*ads*"
+    #   blockhost=<host>,...       Blocks requests to hosts and their subdomains
+    #   window=<width>x<height>    The window size
+
+    # Parameters:
+    # components (list): The components of the line after the browser name.
+
+    # Returns:
+    # dict: The options. Raises a ValueError if an option is not recognised.
+
+    options = {}
+    for component in components:
+        name, _, value = component.partition("=")
+        if value[:1] in ("'", '"'):
+            try:
+                value = ast.literal_eval(value)
+            except (ValueError, SyntaxError):
+                raise ValueError(f"Unrecognised start option: {component}") from None
+
+        if not value and name in BROWSER_PROFILES:
+            options.update(BROWSER_PROFILES[name])
+        elif not value and name == "headless":
+            options["headless"] = True
+        elif name == "load" and value in PAGE_LOAD_STRATEGIES:
+            options["page_load_strategy"] = value
+        elif name == "block" and value and all(resource in RESOURCE_BLOCK_PATTERNS for resource in value.split(",")):
+            options["block"] = sorted(set(options.get("block", [])) | set(value.split(",")))
+        elif name == "blockurl" and value:
+            options["block_urls"] = options.get("block_urls", []) + [value]
+        elif name == "blockhost" and value:
+            options["block_hosts"] = options.get("block_hosts", []) + value.split(",")
+        elif name == "window" and re.fullmatch(r"\d+x\d+", value):
+            options["window_size"] = [int(size) for size in value.split("x")]
+        else:
+            raise ValueError(f"Unrecognised start option: {component}")
+
+    return options
+
+
+def parse_waitfor(strip_array):
+
+    # This function translates the components of a `waitfor` line into an 
+    # executable Python statement.
+
+    # The supported forms are:
+    #   waitfor ready [timeout]
+    #   waitfor url <text> [timeout]
+    #   waitfor title <text> [timeout]
+    #   waitfor present|visible|clickable id|name|class|css|xpath <value> [timeout]
+
+    # Parameters:
+    # strip_array (list): The components of the line, as returned by `preserve_quote_string`.
+
+    # Returns:
+    # str or None: The corresponding executable Python code, or `None` if the 
+    # condition or locator strategy is not recognised, or the line has too few 
+    # or too many components for its condition.
+
+    condition = strip_array[1] if len(strip_array) > 1 else None
+    if condition == "ready" and len(strip_array) <= 3:
+        arguments = ["browser"]
+        function = "wait_for_page_ready"
+        remainder = strip_array[2:]
+    elif condition in ("url", "title") and 3 <= len(strip_array) <= 4:
+        arguments = ["browser", proc_var(strip_array[2])]
+        function = f"wait_for_{condition}"
+        remainder = strip_array[3:]
+    elif condition in ELEMENT_CONDITIONS and 4 <= len(strip_array) <= 5 and strip_array[2] in LOCATOR_STRATEGIES:
+        arguments = ["browser", repr(condition), repr(strip_array[2]), proc_var(strip_array[3])]
+        function = "wait_for_element"
+        remainder = strip_array[4:]
+    else:
+        return None
+
+    # Adds the optional timeout. 
+    if remainder:
+        arguments.append(proc_var(remainder[0]))
+
+    return f"{function}({', '.join(arguments)})"
+
+
+def parse_fetch(strip_array):
+
+    # Splits a `fetch` line into its parts. 
+
+    # The line is written as:
+    #   fetch <variable> <url> [post=<body>] [json=<body>] [timeout=<seconds>]
+
+    # Parameters:
+    # strip_array (list): The components of the line, as returned by `preserve_quote_string`.
+
+    # Returns:
+    # tuple or None: ("fetch", target, request) as Python expressions, where request is a 
+    # (url, method, body, content_type, timeout) tuple, or None if the line is not a valid fetch.
+
+    if strip_array[0] != "fetch" or len(strip_array) < 3:
+        return None
+
+    method, body, content_type, timeout = "GET", "None", None, FETCH_TIMEOUT
+    for component in strip_array[3:]:
+        name, _, value = component.partition("=")
+        if name in ("post", "json") and value:
+            method, body = "POST", proc_var(value)
+            content_type = "application/json" if name == "json" else "application/x-www-form-urlencoded"
+        elif name == "timeout" and value:
+            timeout = proc_var(value)
+        else:
+            return None
+
+    return "fetch", proc_var(strip_array[1]), f"({proc_var(strip_array[2])}, {method!r}, {body}, {content_type!r}, {timeout})"
+
+
+def parse_extract(strip_array):
+
+    # Translates the components of an `extract` line into an executable Python statement. 
+
+    # The line is written as:
+    #   extract <row_selector> <file> <field>=<selector>[@<attribute>] ... [next=<selector>] [pages=<n>]
+
+    # Parameters:
+    # strip_array (list): The components of the line, as returned by `preserve_quote_string`.
+
+    # Returns:
+    # str or None: The corresponding executable Python code, or `None` if the line has 
+    # no fields or a field is not written as <field>=<selector>.
+
+    if len(strip_array) < 4:
+        return None
+
+    fields = []
+    options = {"next": "None", "pages": "None"}
+    for component in strip_array[3:]:
+        name, _, value = component.partition("=")
+        if not name.isidentifier() or not value:
+            return None
+        if name in options:
+            options[name] = proc_var(value)
+        else:
+            fields.append(f"({name!r}, {proc_var(value)})")
+    if not fields:
+        return None
+
+    return (f"extract_rows(browser, {proc_var(strip_array[1])}, {proc_var(strip_array[2])}, "
+            f"({', '.join(fields)},), {options['next']}, {options['pages']})")
+
+
+def iter_proc_lines(lines):
+
+    # This function filters the raw lines of a procedure down to the lines 
+    # that contain commands, keeping track of their line numbers. 
+
+    # Parameters:
+    # lines (iterable): The raw lines of a procedure file. 
+
+    # Returns:
+    # generator: Yields (line_number, line) tuples for every command line. 
+    #   Blank lines and comment lines (starting with "//") are skipped.
+
+    for line_number, line in enumerate(lines, start=1):
+
+        # If the line is blank, skip. 
+        if len(line.strip()) == 0:
+            continue 
+
+        # If the line is a comment line. 
+        if line.lstrip().startswith("//"):
+            continue
+
+        yield line_number, line
+
+
+def parse_proc_file(file_path):
+
+    # This function reads a file containing procedure instructions and 
+    # processes each line to convert it into executable code. 
+
+    # The function works as follows:
+    # 1. It opens the specified file and reads each line sequentially.
+    # 2. For each line, it checks if the line is blank or a comment (starting with "//").
+    # 3. It processes valid lines into executable code using `parse_proc_line`.
+    # 4. It appends the resulting executable code to a list.
+    # 5. It returns the list of executable code.
+
+    # Parameters:
+    # file_path (str): The path to the procedure file to be processed.
+
+    # Returns:
+    # list: A list of executable code lines derived from the procedure file.
+
+    # Array to store executable code. 
+    execution_code = []
+
+    # Opens the file and reads each line sequentially. 
+    with open(file_path, "r") as file: 
+        for line_number, line in iter_proc_lines(file): 
+
+            # Add the line as execution code. 
+            parse_exec_line = parse_proc_line(line)
+            execution_code.append(parse_exec_line) 
+
+    return execution_code
+
+
+def compile_proc_source(source, file_path="<proc>"):
+
+    # This function compiles the text of a procedure into a program of 
+    # precompiled stages, so the Python compiler runs once per procedure 
+    # rather than once per line on every execution. 
+
+    # Parameters:
+    # source (str): The full text of the procedure.
+    # file_path (str): The name of the procedure, used in error messages and tracebacks.
+
+    # Returns:
+    # tuple: The compiled stages of the procedure, see `iter_proc_stages`. 
+    #   Raises a ValueError if a line contains an unrecognised command.
+
+    return tuple(iter_proc_stages(source.splitlines(), file_path))
+
+
+def iter_proc_stages(lines, file_path="<proc>"):
+
+    # This function lexes, parses and compiles procedure lines as they arrive, 
+    # yielding each stage as soon as it is ready. Only the current run of element 
+    # lookups is held in memory, so the input can be of any length.
+
+    # The function works as follows:
+    # 1. Each command line is split into components using `tokenise_proc_line`, and 
+    #    translated into Python using `parse_proc_components`.
+    # 2. Runs of consecutive element lookups, or of consecutive fetches, are combined into 
+    #    a single stage, see `compile_lookup_run` and `compile_fetch_run`. A run is yielded 
+    #    when the next command arrives or the input ends.
+    # 3. The translated line is compiled into a code object, with its line number 
+    #    set to the line of the procedure file so tracebacks point at the .proc line.
+    # 4. Each stage is yielded as a (line_number, command, exec_line, code) tuple.
+
+    # Parameters:
+    # lines (iterable): The lines of the procedure, e.g. an open file or sys.stdin.
+    # file_path (str): The name of the procedure, used in error messages and tracebacks.
+
+    # Returns:
+    # generator: Yields the compiled stages of the procedure. 
+    #   Raises a ValueError when it reaches a line with an unrecognised command.
+
+    yield from iter_block_stages(iter_proc_tokens(lines, file_path), file_path)
+
+
+def iter_proc_tokens(lines, file_path="<proc>"):
+
+    # Splits each command line of a procedure into its components. 
+    #
+    # Parameters:
+    #    lines (iterable): The lines of the procedure.
+    #    file_path (str): The name of the procedure, used in error messages.
+    #
+    # Returns:
+    #    generator: Yields (line_number, line, strip_array) tuples.
+
+    for line_number, line in iter_proc_lines(lines):
+        yield line_number, line, [token[0] for token in tokenise_proc_line(line, line_number, file_path)]
+
+
+def iter_block_stages(tokens, file_path, terminators=()):
+
+    # Compiles tokenised lines into stages until one of the terminating commands, 
+    # such as the `end` of a block, or the end of the input. 
+    #
+    # Parameters:
+    #    tokens (iterator): The (line_number, line, strip_array) tuples of the procedure, 
+    #       shared with any enclosing block.
+    #    file_path (str): The name of the procedure.
+    #    terminators (tuple): The commands which end the current block.
+    #
+    # Returns:
+    #    generator: Yields the compiled stages, and returns the (line_number, strip_array) 
+    #       of the terminating line, or None at the end of the input.
+
+    run = []
+
+    for line_number, line, strip_array in tokens:
+
+        # Ends the current block. 
+        if strip_array[0] in terminators:
+            yield from compile_batched_run(run, file_path)
+            return line_number, strip_array
+
+        # Collects runs of consecutive element lookups, or of consecutive fetches, 
+        # which do not depend on one another. 
+        batched = parse_lookup(strip_array) or parse_fetch(strip_array)
+        if (batched is not None and run and (batched[0] == "fetch") == (run[0][1] == "fetch") 
+                and not any(references_target(batched[2], target) for _, _, target, _ in run)):
+            run.append((line_number,) + batched)
+            continue
+        yield from compile_batched_run(run, file_path)
+        if batched is not None:
+            run = [(line_number,) + batched]
+            continue
+        run = []
+
+        # Compiles blocks, which consume lines up to their `end`. 
+        if strip_array[0] == "parallel":
+            yield compile_parallel_block(line_number, tokens, file_path)
+            continue
+        if strip_array[0] == "foreach":
+            yield compile_foreach_block(line_number, strip_array, tokens, file_path)
+            continue
+
+        # Translates the line. 
+        exec_line = parse_proc_components(strip_array, line)
+        if exec_line is None:
+            raise ValueError(f"{file_path}:{line_number}: Unable to compile line: {line.strip()}")
+
+        yield compile_proc_stage(line_number, strip_array[0], exec_line, file_path)
+
+    yield from compile_batched_run(run, file_path)
+    return None
+
+
+def compile_block(tokens, file_path, terminators, line_number):
+
+    # Compiles the body of a block up to one of its terminating commands. 
+    #
+    # Parameters:
+    #    tokens (iterator): The tokenised lines of the procedure.
+    #    file_path (str): The name of the procedure.
+    #    terminators (tuple): The commands which end the body.
+    #    line_number (int): The line the block starts on, used in error messages.
+    #
+    # Returns:
+    #    tuple: (stages, terminator), where terminator is the (line_number, strip_array) 
+    #       of the terminating line. Raises a ValueError if the input ends first.
+
+    stages = []
+    body = iter_block_stages(tokens, file_path, terminators)
+    while True:
+        try:
+            stages.append(next(body))
+        except StopIteration as stop:
+            terminator = stop.value
+            break
+
+    if terminator is None:
+        raise ValueError(f"{file_path}:{line_number}: Block is missing its end")
+    return tuple(stages), terminator
+
+
+def compile_parallel_block(line_number, tokens, file_path):
+
+    # Compiles a `parallel` block, whose branches run at the same time. 
+    #
+    # The block is written as:
+    #   parallel
+    #   branch <name>
+    #       ...
+    #   branch <name>
+    #       ...
+    #   end
+    #
+    # Parameters:
+    #    line_number (int): The line of the `parallel` command.
+    #    tokens (iterator): The tokenised lines of the procedure.
+    #    file_path (str): The name of the procedure.
+    #
+    # Returns:
+    #    tuple: The block stage as (line_number, "parallel", exec_line, branches), where 
+    #       branches is a tuple of (name, stages) pairs.
+
+    stages, terminator = compile_block(tokens, file_path, ("branch", "end"), line_number)
+    if stages:
+        raise ValueError(f"{file_path}:{stages[0][0]}: Commands in a parallel block must be inside a branch")
+
+    branches = []
+    while terminator[1][0] == "branch":
+        branch_line, strip_array = terminator
+        name = strip_array[1] if len(strip_array) > 1 else f"branch_{len(branches) + 1}"
+        if name in (branch[0] for branch in branches):
+            raise ValueError(f"{file_path}:{branch_line}: Duplicate branch name: {name}")
+        stages, terminator = compile_block(tokens, file_path, ("branch", "end"), branch_line)
+        branches.append((name, stages))
+
+    exec_line = f"parallel({', '.join(branch[0] for branch in branches)})"
+    return (line_number, "parallel", exec_line, tuple(branches))
+
+
+def compile_foreach_block(line_number, strip_array, tokens, file_path):
+
+    # Compiles a `foreach` block, whose body runs once per row of an input file. 
+    #
+    # The block is written as:
+    #   foreach <name> in <source> [results=<path>]
+    #       ...
+    #   end
+    #
+    # The source and results paths may be quoted strings or [var] references.
+    #
+    # Parameters:
+    #    line_number (int): The line of the `foreach` command.
+    #    strip_array (list): The components of the `foreach` line.
+    #    tokens (iterator): The tokenised lines of the procedure.
+    #    file_path (str): The name of the procedure.
+    #
+    # Returns:
+    #    tuple: The block stage as (line_number, "foreach", exec_line, loop), where loop is 
+    #       (name, source_code, results_code, stages) and results_code is None when no 
+    #       results file is given.
+
+    if len(strip_array) not in (4, 5) or strip_array[2] != "in" or not strip_array[1].isidentifier():
+        raise ValueError(f"{file_path}:{line_number}: Expected foreach <name> in <source> [results=<path>]")
+
+    results_code = None
+    if len(strip_array) == 5:
+        option, _, value = strip_array[4].partition("=")
+        if option != "results" or not value:
+            raise ValueError(f"{file_path}:{line_number}: Unrecognised foreach option: {strip_array[4]}")
+        results_code = compile(proc_var(value), file_path, "eval")
+
+    source_code = compile(proc_var(strip_array[3]), file_path, "eval")
+    stages, _ = compile_block(tokens, file_path, ("end",), line_number)
+
+    exec_line = f"foreach({strip_array[1]} in {proc_var(strip_array[3])})"
+    return (line_number, "foreach", exec_line, (strip_array[1], source_code, results_code, stages))
+
+
+def compile_proc_stage(line_number, command, exec_line, file_path):
+
+    # Compiles a translated line into a stage. 
+    #
+    # The code object is moved to the line of the procedure file, so tracebacks 
+    # point at the .proc line.
+    #
+    # Parameters:
+    #    line_number (int): The line of the procedure file the stage came from.
+    #    command (str): The procedure command the stage runs.
+    #    exec_line (str): The translated Python statement.
+    #    file_path (str): The name of the procedure.
+    #
+    # Returns:
+    #    tuple: The stage as (line_number, command, exec_line, code).
+
+    code = compile(exec_line, file_path, "exec")
+    return (line_number, command, exec_line, code.replace(co_firstlineno=line_number))
+
+
+def parse_lookup(strip_array):
+
+    # Splits an element lookup line into its parts. 
+    #
+    # Parameters:
+    #    strip_array (list): The components of a line of a procedure file.
+    #
+    # Returns:
+    #    tuple or None: (command, target, value) as Python expressions, or None if 
+    #       the line is not an element lookup.
+
+    if strip_array[0] not in LOOKUP_COMMANDS or len(strip_array) < 3:
+        return None
+    return strip_array[0], proc_var(strip_array[1]), proc_var(strip_array[2])
+
+
+def references_target(expression, target):
+
+    # Checks whether an expression refers to the target of an earlier lookup, 
+    # in which case the lookups cannot be resolved in the same batch.
+    #
+    # Parameters:
+    #    expression (str): The Python expression of a lookup value.
+    #    target (str): The Python expression of an earlier lookup target.
+    #
+    # Returns:
+    #    bool: True if the expression refers to the target.
+
+    return re.search(r"(?<![\w'])" + re.escape(target) + r"(?![\w'])", expression) is not None
+
+
+def compile_lookup_run(lookups, file_path):
+
+    # Compiles a run of consecutive element lookups. 
+    #
+    # A single lookup is compiled as written. Two or more are combined into one 
+    # "lookup" stage which resolves every element with `get_elements_batch` and assigns 
+    # each result to its own target. The stage takes the line of the first lookup.
+    #
+    # Parameters:
+    #    lookups (list): (line_number, command, target, value) tuples.
+    #    file_path (str): The name of the procedure.
+    #
+    # Returns:
+    #    list: The compiled stages.
+
+    if len(lookups) == 0:
+        return []
+    if len(lookups) == 1:
+        line_number, command, target, value = lookups[0]
+        return [compile_proc_stage(line_number, command, f"{target} = {LOOKUP_COMMANDS[command][1]}(browser, {value})", file_path)]
+
+    targets = ", ".join(target for _, _, target, _ in lookups)
+    locators = ", ".join(f"({command!r}, {value})" for _, command, _, value in lookups)
+    return [compile_proc_stage(lookups[0][0], "lookup", f"{targets} = get_elements_batch(browser, ({locators},))", file_path)]
+
+
+def compile_batched_run(run, file_path):
+
+    # Compiles a run of element lookups with `compile_lookup_run`, or a run of fetches 
+    # with `compile_fetch_run`. 
+    #
+    # Parameters:
+    #    run (list): (line_number, command, target, value) tuples, all lookups or all fetches.
+    #    file_path (str): The name of the procedure.
+    #
+    # Returns:
+    #    list: The compiled stages.
+
+    if run and run[0][1] == "fetch":
+        return compile_fetch_run(run, file_path)
+    return compile_lookup_run(run, file_path)
+
+
+def compile_fetch_run(fetches, file_path):
+
+    # Compiles a run of consecutive fetches. 
+    #
+    # A single fetch is compiled as written. Two or more are combined into one "fetch" 
+    # stage which sends every request at the same time with `fetch_urls`, and assigns 
+    # each response to its own target. The stage takes the line of the first fetch.
+    #
+    # Parameters:
+    #    fetches (list): (line_number, "fetch", target, request) tuples.
+    #    file_path (str): The name of the procedure.
+    #
+    # Returns:
+    #    list: The compiled stages.
+
+    if len(fetches) == 0:
+        return []
+    if len(fetches) == 1:
+        line_number, _, target, request = fetches[0]
+        return [compile_proc_stage(line_number, "fetch", f"{target} = fetch_url(browser, *{request})", file_path)]
+
+    targets = ", ".join(target for _, _, target, _ in fetches)
+    requests = ", ".join(request for _, _, _, request in fetches)
+    return [compile_proc_stage(fetches[0][0], "fetch", f"{targets} = fetch_urls(browser, ({requests},))", file_path)]
+
+
+def get_engine_fingerprint():
+
+    # Returns the engine version together with a hash of the engine source, so that 
+    # compiled procedures and checkpoints are never reused by a changed engine, even 
+    # when ENGINE_VERSION has not been bumped. The source is hashed once per process.
+    #
+    # Parameters:
+    #    None: The function does not take a parameter. 
+    #
+    # Returns:
+    #    str: The fingerprint, e.g. "1.9.0-3f2a9c1e7b00".
+
+    if "value" not in engine_fingerprint:
+        try:
+            with open(__file__, "rb") as file:
+                source_digest = hashlib.sha256(file.read()).hexdigest()[:12]
+        except OSError:
+            source_digest = "unknown"
+        engine_fingerprint["value"] = f"{ENGINE_VERSION}-{source_digest}"
+    return engine_fingerprint["value"]
+
+
+def get_proc_cache_path(digest):
+
+    # Returns the location of a compiled procedure in the on-disk cache. 
+    #
+    # The cache key combines the hash of the procedure content, the engine fingerprint 
+    # and the interpreter cache tag, as code objects are specific to a Python version.
+    #
+    # Parameters:
+    #    digest (str): The SHA-256 hex digest of the procedure content.
+    #
+    # Returns:
+    #    str: The path of the compiled procedure file.
+
+    return os.path.join(proc_cache_directory, f"{digest}-{get_engine_fingerprint()}-{sys.implementation.cache_tag}.procc")
+
+
+def get_proc_check_path(digest, variables):
+
+    # Returns the location of a preflight check result in the on-disk cache, next to 
+    # the compiled procedure. 
+    #
+    # The cache key combines the hash of the procedure content, the engine fingerprint 
+    # and a hash of the sorted names of the variables defined before the procedure starts.
+    #
+    # Parameters:
+    #    digest (str): The SHA-256 hex digest of the procedure content.
+    #    variables (iterable): The names of the variables defined before the procedure starts.
+    #
+    # Returns:
+    #    str: The path of the check result file.
+
+    names_digest = hashlib.sha256("\n".join(sorted(variables)).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(proc_cache_directory, f"{digest}-{get_engine_fingerprint()}-{names_digest}.check")
+
+
+def load_compiled_proc(cache_path):
+
+    # Loads a compiled procedure, or a preflight check result, from the on-disk cache. 
+    #
+    # Parameters:
+    #    cache_path (str): The path of the compiled procedure or check result file.
+    #
+    # Returns:
+    #    tuple, list or None: The compiled stages or the problems found, or None if the 
+    #       file is missing or unreadable.
+
+    try:
+        with open(cache_path, "rb") as file:
+            return marshal.loads(file.read())
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        log_entry("warning", f"Compiled procedure cache read error: {e}")
+        return None
+
+
+def store_compiled_proc(cache_path, program):
+
+    # Writes a compiled procedure, or a preflight check result, to the on-disk cache. 
+    #
+    # The file is written under a temporary name and moved into place, so 
+    # concurrent runs never read a partially written file. A failure to write 
+    # the cache is logged and otherwise ignored.
+    #
+    # Parameters:
+    #    cache_path (str): The path of the compiled procedure or check result file.
+    #    program (tuple or list): The compiled stages, or the problems found, to store.
+    #
+    # Returns:
+    #    This function does not return a value. 
+
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(temp_path, "wb") as file:
+            marshal.dump(program, file)
+        os.replace(temp_path, cache_path)
+    except Exception as e:
+        log_entry("warning", f"Compiled procedure cache write error: {e}")
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+
+def compile_proc_file(file_path, use_cache=True):
+
+    # This function returns the compiled program for a procedure file, reusing 
+    # a previous compilation whenever the file content has not changed. 
+
+    # The function works as follows:
+    # 1. It reads the file and hashes its content.
+    # 2. It returns the program from memory if this process has already compiled it.
+    # 3. Otherwise it loads the program from the on-disk cache.
+    # 4. If neither is available, it compiles the file using `compile_proc_source` 
+    #    and stores the result in both caches.
+
+    # Parameters:
+    # file_path (str): The path to the procedure file to be compiled.
+    # use_cache (bool): If False, the file is always compiled and the caches are bypassed.
+
+    # Returns:
+    # tuple: The compiled stages of the procedure file.
+
+    with open(file_path, "rb") as file:
+        content = file.read()
+
+    if not use_cache:
+        return compile_proc_source(content.decode("utf-8"), file_path)
+    return compile_proc_content(content, hashlib.sha256(content).hexdigest(), file_path)
+
+
+def compile_proc_content(content, digest, file_path):
+
+    # Returns the compiled program for the content of a procedure file, from the 
+    # in-memory or on-disk cache where possible. See `compile_proc_file`.
+    #
+    # Parameters:
+    #    content (bytes): The content of the procedure file.
+    #    digest (str): The SHA-256 hex digest of the content.
+    #    file_path (str): The path to the procedure file, used in error messages and tracebacks.
+    #
+    # Returns:
+    #    tuple: The compiled stages of the procedure file.
+
+    # Checks the in-memory cache. 
+    program = compiled_programs.get((digest, file_path))
+    if program is not None:
+        return program
+
+    # Checks the on-disk cache, compiling on a miss. The on-disk cache is shared by 
+    # files with the same content, so the code is moved to this file where needed. 
+    cache_path = get_proc_cache_path(digest)
+    program = load_compiled_proc(cache_path)
+    if program is None:
+        program = compile_proc_source(content.decode("utf-8"), file_path)
+        store_compiled_proc(cache_path, program)
+    else:
+        program = rename_proc_code(program, file_path)
+
+    compiled_programs[(digest, file_path)] = program
+    return program
+
+
+def rename_proc_code(value, file_path):
+
+    # Returns a compiled program, or part of one, with every code object in it given 
+    # a new file name, so tracebacks, traces and logs name the file being run. 
+    #
+    # Parameters:
+    #    value (tuple, code or other): The compiled stages, a stage, or a part of a stage.
+    #    file_path (str): The path of the procedure file.
+    #
+    # Returns:
+    #    The value with its code objects renamed. Other values are returned unchanged.
+
+    if isinstance(value, types.CodeType):
+        if value.co_filename == file_path:
+            return value
+        return value.replace(co_filename=file_path, co_consts=tuple(rename_proc_code(const, file_path) for const in value.co_consts))
+    if isinstance(value, tuple):
+        return tuple(rename_proc_code(item, file_path) for item in value)
+    return value
+
+
+def format_proc_program(program, depth=0):
+
+    # Returns the generated Python of a compiled program as text, one stage per line, 
+    # with the stages of `parallel` branches and `foreach` loops indented beneath them. 
+    #
+    # Parameters:
+    #    program (tuple): The compiled stages, see `compile_proc_file`.
+    #    depth (int): The indentation level of the stages.
+    #
+    # Returns:
+    #    str: The line number and generated code of each stage.
+
+    indent = "    " * depth
+    lines = []
+    for line_number, command, exec_line, code in program:
+        lines.append(f"{indent}{line_number}: {exec_line}")
+        if command == "parallel":
+            for name, stages in code:
+                lines.append(f"{indent}    branch {name}")
+                lines.append(format_proc_program(stages, depth + 2))
+        elif command == "foreach":
+            lines.append(format_proc_program(code[-1], depth + 1))
+    return "\n".join(line for line in lines if line)
+
+
+def check_proc_source(lines, file_path="<proc>", variables=()):
+
+    # This function checks a whole procedure for problems before it is run, so a broken 
+    # procedure fails in milliseconds rather than after a browser has been started. 
+
+    # The function works as follows:
+    # 1. Each line is tokenised and checked for an unknown command or the wrong number 
+    #    of arguments, and `parallel`, `branch`, `foreach` and `end` are matched up.
+    # 2. Each line is translated as it would be compiled, reporting lines which cannot be.
+    # 3. The translated line is walked in order, tracking the variables and element names 
+    #    assigned so far. A [var] reference to a variable, or a use of an element name, 
+    #    before it is assigned is reported, as is a command which needs a browser before 
+    #    `start` or after `quit`.
+    # 4. Every problem is collected, rather than stopping at the first.
+
+    # Parameters:
+    # lines (iterable): The lines of the procedure.
+    # file_path (str): The name of the procedure, used in error messages.
+    # variables (iterable): The names of variables defined before the procedure starts, 
+    #   including "browser" if a browser has already been started.
+
+    # Returns:
+    # list: (line_number, message) tuples, in line order. Empty if no problems were found.
+
+    # A browser left by an earlier procedure, e.g. one run with `exec_proc_from_file` in 
+    # the same process, can be used from the start. 
+    problems = []
+    state = {"defined": set(variables), "prefixes": set(), "browser": "browser" in variables, "analysed": {}}
+    tokens = iter_checked_tokens(lines, file_path, problems)
+    check_block(tokens, state, problems, ())
+    return sorted(problems)
+
+
+def iter_checked_tokens(lines, file_path, problems):
+
+    # Splits each command line into its components, as `iter_proc_tokens`, reporting 
+    # lines which cannot be tokenised rather than raising. 
+    #
+    # Parameters:
+    #    lines (iterable): The lines of the procedure.
+    #    file_path (str): The name of the procedure.
+    #    problems (list): The list problems are added to.
+    #
+    # Returns:
+    #    generator: Yields (line_number, line, strip_array) tuples.
+
+    for line_number, line in iter_proc_lines(lines):
+        try:
+            yield line_number, line, [token[0] for token in tokenise_proc_line(line, line_number, file_path)]
+        except SyntaxError as e:
+            problems.append((line_number, f"{e.msg} at column {e.offset}"))
+
+
+def check_block(tokens, state, problems, terminators, outside_branch=False):
+
+    # Checks tokenised lines until one of the terminating commands, or the end of the input. 
+    # See `check_proc_source`.
+    #
+    # Parameters:
+    #    tokens (iterator): The tokenised lines of the procedure.
+    #    state (dict): The names defined so far and whether a browser has been started.
+    #    problems (list): The list problems are added to.
+    #    terminators (tuple): The commands which end the current block.
+    #    outside_branch (bool): True at the start of a parallel block, before its first branch.
+    #
+    # Returns:
+    #    tuple or None: The (line_number, strip_array) of the terminating line, or None 
+    #       at the end of the input.
+
+    for line_number, line, strip_array in tokens:
+        command, arguments = strip_array[0], strip_array[1:]
+
+        if command in terminators:
+            return line_number, strip_array
+        if command in ("branch", "end"):
+            problems.append((line_number, f"{command} outside a {'parallel ' if command == 'branch' else ''}block"))
+            continue
+        if outside_branch:
+            problems.append((line_number, "Commands in a parallel block must be inside a branch"))
+
+        limits = COMMAND_ARGUMENTS.get(command)
+        if limits is None:
+            problems.append((line_number, f"Unknown command: {command}"))
+            continue
+        minimum, maximum = limits
+        if len(arguments) < minimum or (maximum is not None and len(arguments) > maximum):
+            expected = str(minimum) if minimum == maximum else f"at least {minimum}" if maximum is None else f"{minimum} to {maximum}"
+            problems.append((line_number, f"{command} takes {expected} argument{'' if expected in ('1', 'at least 1') else 's'}, got {len(arguments)}"))
+            if command not in ("parallel", "foreach"):
+                continue
+
+        if command == "parallel":
+            check_parallel_block(line_number, tokens, state, problems)
+        elif command == "foreach":
+            check_foreach_block(line_number, strip_array, tokens, state, problems)
+        else:
+            try:
+                exec_line = translate_proc_components(strip_array)
+            except ValueError as e:
+                problems.append((line_number, str(e)))
+                continue
+            except IndexError:
+                exec_line = None
+            if exec_line is None:
+                problems.append((line_number, f"Invalid {command} line: {line.strip()}"))
+                continue
+            check_names(line_number, command, exec_line, state, problems)
+
+            # A browser cannot be used once it has been closed. 
+            if command in ("quit", "stop"):
+                state["browser"] = False
+
+    return None
+
+
+def check_parallel_block(line_number, tokens, state, problems):
+
+    # Checks a `parallel` block. Each branch is checked from the names defined before the 
+    # block, without a browser, and the names set by a branch are available after the block 
+    # as "<branch>.<name>". 
+    #
+    # Parameters:
+    #    line_number (int): The line of the `parallel` command.
+    #    tokens (iterator): The tokenised lines of the procedure.
+    #    state (dict): The names defined so far.
+    #    problems (list): The list problems are added to.
+    #
+    # Returns:
+    #    This function does not return a value. 
+
+    terminator = check_block(tokens, copy_check_state(state), problems, ("branch", "end"), outside_branch=True)
+    names = []
+    while terminator is not None and terminator[1][0] == "branch":
+        branch_line, strip_array = terminator
+        name = strip_array[1] if len(strip_array) > 1 else f"branch_{len(names) + 1}"
+        if name in names:
+            problems.append((branch_line, f"Duplicate branch name: {name}"))
+        names.append(name)
+        terminator = check_block(tokens, copy_check_state(state), problems, ("branch", "end"))
+
+    if terminator is None:
+        problems.append((line_number, "Block is missing its end"))
+    state["prefixes"].update(f"{name}." for name in names)
+
+
+def check_foreach_block(line_number, strip_array, tokens, state, problems):
+
+    # Checks a `foreach` block. The row name, and the row's columns, are defined in its body. 
+    #
+    # Parameters:
+    #    line_number (int): The line of the `foreach` command.
+    #    strip_array (list): The components of the `foreach` line.
+    #    tokens (iterator): The tokenised lines of the procedure.
+    #    state (dict): The names defined so far.
+    #    problems (list): The list problems are added to.
+    #
+    # Returns:
+    #    This function does not return a value. 
+
+    if len(strip_array) in (4, 5):
+        if strip_array[2] != "in" or not strip_array[1].isidentifier():
+            problems.append((line_number, "Expected foreach <name> in <source> [results=<path>]"))
+        else:
+            check_names(line_number, "foreach", proc_var(strip_array[3]), state, problems)
+            state["defined"].add(strip_array[1])
+            state["prefixes"].add(f"{strip_array[1]}.")
+        if len(strip_array) == 5:
+            option, _, value = strip_array[4].partition("=")
+            if option != "results" or not value:
+                problems.append((line_number, f"Unrecognised foreach option: {strip_array[4]}"))
+            else:
+                check_names(line_number, "foreach", proc_var(value), state, problems)
+
+    terminator = check_block(tokens, state, problems, ("end",))
+    if terminator is None:
+        problems.append((line_number, "Block is missing its end"))
+
+
+def copy_check_state(state):
+
+    # Returns the check state for a parallel branch, which starts without a browser. 
+    return {"defined": set(state["defined"]) - {"browser"}, "prefixes": set(state["prefixes"]), 
+            "browser": False, "analysed": state["analysed"]}
+
+
+def check_names(line_number, command, exec_line, state, problems):
+
+    # Checks the names a translated line reads, and records the names it assigns. 
+    #
+    # Parameters:
+    #    line_number (int): The line of the procedure file.
+    #    command (str): The procedure command of the line.
+    #    exec_line (str): The translated Python code of the line.
+    #    state (dict): The names defined so far and whether a browser has been started.
+    #    problems (list): The list problems are added to.
+    #
+    # Returns:
+    #    This function does not return a value. 
+
+    # Finds the names read and assigned, reusing the result for repeated lines. 
+    analysis = state["analysed"].get(exec_line)
+    if analysis is None:
+        try:
+            tree = ast.parse(exec_line)
+        except SyntaxError as e:
+            problems.append((line_number, f"Invalid expression in {command} line: {e.msg}"))
+            return
+        loads, stores = [], []
+        for node in ast.walk(tree):
+            if (isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) 
+                    and node.value.id == "variable_dictionary" and isinstance(node.slice, ast.Constant)):
+                (stores if isinstance(node.ctx, ast.Store) else loads).append((True, node.slice.value))
+            elif isinstance(node, ast.Name) and node.id != "variable_dictionary":
+                (stores if isinstance(node.ctx, ast.Store) else loads).append((False, node.id))
+            elif isinstance(node, ast.Attribute) and node.attr.startswith("__"):
+                loads.append((False, node.attr))
+        analysis = state["analysed"][exec_line] = (loads, stores)
+    loads, stores = analysis
+
+    def is_defined(name):
+        return name in state["defined"] or any(name.startswith(prefix) for prefix in state["prefixes"])
+
+    for is_variable, name in loads:
+        if not is_variable and is_unsafe_name(name):
+            problems.append((line_number, f"{command} line uses {name}, which procedures may not use"))
+        elif name == "browser" and not is_variable:
+            if not state["browser"]:
+                problems.append((line_number, f"{command} needs a browser, but no browser has been started"))
+        elif is_variable:
+            if not is_defined(name):
+                problems.append((line_number, f"Undefined variable: [var]{name}"))
+        elif name not in globals() and not hasattr(builtins, name) and not is_defined(name):
+            if command in ("type", "click"):
+                problems.append((line_number, f"{command} on {name}, which has not been assigned"))
+            else:
+                problems.append((line_number, f"Undefined name: {name}"))
+
+    for is_variable, name in stores:
+        if not is_variable and is_unsafe_name(name):
+            problems.append((line_number, f"{command} line assigns {name}, which procedures may not use"))
+            continue
+        if name == "browser" and not is_variable:
+            state["browser"] = True
+        state["defined"].add(name)
+
+
+def is_unsafe_name(name):
+
+    # Returns whether a procedure line may not use a name: a dunder name, a module, or one 
+    # of UNSAFE_BUILTINS. 
+    return name.startswith("__") or name in UNSAFE_BUILTINS or isinstance(globals().get(name), types.ModuleType)
+
+
+def preflight_proc_file(file_path, variables=()):
+
+    # Checks a procedure file with `check_proc_source` before it is run, raising an error 
+    # which lists every problem found. Results are kept in memory and in the on-disk cache 
+    # next to the compiled procedure, so an unchanged file is only checked once for each 
+    # set of variables. 
+    #
+    # Parameters:
+    #    file_path (str): The path to the procedure file.
+    #    variables (iterable): The names of variables defined before the procedure starts.
+    #
+    # Returns:
+    #    This function does not return a value. 
+    #       Raises a ValueError if any problems are found.
+
+    with open(file_path, "r") as file:
+        preflight_proc_source(file.read(), file_path, variables)
+
+
+def preflight_proc_source(source, file_path="<proc>", variables=(), digest=None):
+
+    # Checks the text of a procedure before it is run. See `preflight_proc_file`.
+    #
+    # Parameters:
+    #    source (str): The full text of the procedure.
+    #    file_path (str): The name of the procedure, used in error messages.
+    #    variables (iterable): The names of variables defined before the procedure starts.
+    #    digest (str): The SHA-256 hex digest of the procedure, if already known.
+    #
+    # Returns:
+    #    This function does not return a value. 
+    #       Raises a ValueError if any problems are found.
+
+    key = (digest or hashlib.sha256(source.encode("utf-8")).hexdigest(), frozenset(variables))
+    problems = checked_programs.get(key)
+    if problems is None:
+        check_path = get_proc_check_path(*key)
+        problems = load_compiled_proc(check_path)
+        if problems is None:
+            problems = check_proc_source(source.splitlines(), file_path, key[1])
+            store_compiled_proc(check_path, problems)
+        if len(checked_programs) >= CHECK_CACHE_SIZE:
+            checked_programs.clear()
+        checked_programs[key] = problems
+
+    if problems:
+        details = "\n".join(f"{file_path}:{line_number}: {message}" for line_number, message in problems)
+        raise ValueError(f"{file_path} failed preflight checks with {len(problems)} problem{'s' if len(problems) != 1 else ''}:\n{details}")
+
+
+def exec_proc_stages(execution_stages, variables=None, scope=None, namespace=None):
+
+    # This function executes compiled stages sequentially. 
+
+    # The function works as follows:
+    # 1. It loads the provided variables into the variable scope, `variable_dictionary` by default.
+    # 2. It executes the precompiled code of each stage using the `exec` function 
+    #    with the provided global and variable context, see `exec_proc_stage`. Block stages, 
+    #    `parallel` and `foreach`, carry their compiled body in place of a code object and 
+    #    are run by their own function.
+    # 3. Unless stage records are switched off, it then parses the variables in the stage 
+    #    using `parse_var` and logs the stage with its file, line, command, duration and status.
+
+    # Parameters:
+    # execution_stages (iterable): The compiled stages, e.g. from `compile_proc_file` 
+    # or `iter_proc_stages`. Stages are executed as they are produced.
+    # variables (dict): Optional variables loaded into the scope before 
+    # the first stage, available to the procedure as [var] references.
+    # scope (dict): The variables the stages run against. Defaults to `variable_dictionary`.
+    # namespace (dict): The globals the stages run with, when already built for the scope.
+
+    # Returns:
+    # None: This function does not return anything but executes code dynamically 
+    # as it processes each stage.
+
+    # Determines the variable scope, and the globals which resolve [var] references to it. 
+    if scope is None or scope is variable_dictionary:
+        scope = variable_dictionary
+        namespace = globals()
+    elif namespace is None:
+        namespace = dict(globals(), variable_dictionary=scope)
+
+    # Loads the provided variables. 
+    if variables:
+        scope.update(variables)
+
+    # Iterates over each stage. When stage records are switched off, or below the log 
+    # level, the stage runs with no logging work at all. 
+    for line_number, command, stage, code in execution_stages:
+        if not log_settings["stages"] or log_settings["threshold"] > LOG_LEVELS["info"]:
+            exec_proc_stage(line_number, command, code, namespace, scope)
+            continue
+
+        start_time = time.perf_counter()
+        status = "error"
+        try:
+            exec_proc_stage(line_number, command, code, namespace, scope)
+            status = "ok"
+        finally:
+
+            # Performs variable parse, and records the stage. 
+            duration = time.perf_counter() - start_time
+            parse_stage = parse_var(stage, scope)
+            file_path = getattr(code, "co_filename", None)
+            log_entry("info" if status == "ok" else "error", f"Executed {file_path or '<block>'}:{line_number} in {duration * 1000:.1f} ms: {parse_stage}", 
+                      file=file_path, line=line_number, command=command, duration=round(duration, 6), status=status, stage=parse_stage)
+
+
+def exec_proc_stage(line_number, command, code, namespace, scope):
+
+    # Executes a single compiled stage. Block stages are run by their own function, and 
+    # a stage is timed when a trace is being recorded. 
+    #
+    # Parameters:
+    #    line_number (int): The line of the procedure file the stage came from.
+    #    command (str): The procedure command the stage runs.
+    #    code (code or tuple): The compiled stage, or the body of a block stage.
+    #    namespace (dict): The globals the stage runs with.
+    #    scope (dict): The variable scope the stage runs against.
+    #
+    # Returns:
+    #    This function does not return a value. 
+
+    if command == "parallel":
+        exec_parallel_block(code, scope)
+    elif command == "foreach":
+        exec_foreach_block(code, scope, namespace, line_number)
+    elif trace_settings["output"] is None:
+        exec(code, namespace, scope)
+    else:
+        exec_traced_stage(line_number, command, code, namespace, scope)
+
+
+def exec_parallel_block(branches, scope):
+
+    # This function runs the branches of a `parallel` block at the same time, one 
+    # thread per branch, and waits for all of them to finish. 
+
+    # The function works as follows:
+    # 1. Each branch gets its own copy of the variable scope, without the current browser, 
+    #    so it starts and drives its own browser session.
+    # 2. The branches are executed in a thread pool. WebDriver calls block on I/O, 
+    #    so the branches wait on their pages concurrently.
+    # 3. Once every branch has finished, each variable a branch set is copied back into 
+    #    the scope under "<branch>.<variable>", e.g. [var]shop_a.browser for its session.
+    # 4. If any branch failed, an error naming every failed branch is raised.
+
+    # Parameters:
+    # branches (tuple): (name, stages) pairs, as compiled by `compile_parallel_block`.
+    # scope (dict): The variable scope the block runs in.
+
+    # Returns:
+    # None: This function does not return a value. 
+
+    def run_branch(stages):
+        branch_scope = {key: value for key, value in scope.items() if key != "browser"}
+        try:
+            exec_proc_stages(stages, scope=branch_scope)
+            return branch_scope, None
+        except Exception as e:
+            return branch_scope, e
+
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=max(1, len(branches))) as executor:
+        futures = [(name, executor.submit(run_branch, stages)) for name, stages in branches]
+
+    # Joins the branch scopes back into the block scope. 
+    errors = []
+    for name, future in futures:
+        branch_scope, error = future.result()
+        for key, value in branch_scope.items():
+            if key not in scope or scope[key] is not value:
+                scope[f"{name}.{key}"] = value
+        if error is not None:
+            log_entry("error", f"Parallel branch {name} failed: {error}")
+            errors.append(f"{name}: {type(error).__name__}: {error}")
+
+    if errors:
+        raise RuntimeError(f"Parallel branches failed - {'; '.join(errors)}")
+
+
+def iter_input_rows(file_path):
+
+    # Reads the rows of a CSV or JSON lines file one at a time, so that files of 
+    # any size are read in constant memory. 
+    #
+    # Files ending in .jsonl, .ndjson or .json are read as JSON lines, one object per line. 
+    # Any other file is read as CSV, with the column names taken from the first row.
+    #
+    # Parameters:
+    #    file_path (str): The path to the input file.
+    #
+    # Returns:
+    #    generator: Yields each row as a dictionary.
+
+    with open(file_path, "r", newline="") as file:
+        if file_path.lower().endswith((".jsonl", ".ndjson", ".json")):
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(file)
+
+
+def exec_foreach_block(loop, scope, namespace, line_number=None):
+
+    # This function runs the body of a `foreach` block once per input row, in the same 
+    # variable scope and therefore the same browser session. 
+
+    # The function works as follows:
+    # 1. Rows are read lazily from the source file with `iter_input_rows`.
+    # 2. For each row, the row is bound as [var]<name>, and each column as [var]<name>.<column>.
+    # 3. The compiled body is executed. A row which fails is logged and the loop carries on.
+    # 4. If a results file is given, one JSON line is written per row, with the row index, 
+    #    its input, its status and error, and the plain values the row set.
+    # 5. If any row failed and no results file was given, an error is raised after the last row.
+    # 6. When a checkpoint is being recorded, the progress of the loop is saved after every row. 
+    #    On resume, rows which already succeeded are skipped, and the results file is appended to.
+
+    # Parameters:
+    # loop (tuple): (name, source_code, results_code, stages), as compiled by `compile_foreach_block`.
+    # scope (dict): The variable scope the block runs in.
+    # namespace (dict): The globals the block runs with.
+    # line_number (int): The line of the `foreach` command, which identifies the loop in a checkpoint.
+
+    # Returns:
+    # None: This function does not return a value. 
+
+    name, source_code, results_code, stages = loop
+    source = eval(source_code, namespace, scope)
+
+    # Finds the progress of this loop in the checkpoint. Loops nested in another loop 
+    # are keyed by the row of the enclosing loop they run in. 
+    progress = None
+    if checkpoint_settings["path"] is not None and scope is variable_dictionary and line_number is not None:
+        row_prefix = checkpoint_settings["row_prefix"]
+        loop_key = f"{row_prefix}{line_number}"
+        progress = checkpoint_settings["state"]["rows"].setdefault(loop_key, {"next": 0, "failed": []})
+    resumed = progress is not None and progress["next"] > 0
+
+    results = None
+    if results_code is not None:
+        results = open(eval(results_code, namespace, scope), "a" if resumed else "w")
+    failures = 0
+
+    try:
+        for index, row in enumerate(iter_input_rows(source)):
+
+            # Skips rows completed before the checkpoint was resumed. 
+            if progress is not None and index < progress["next"] and index not in progress["failed"]:
+                continue
+
+            # Binds the row and its columns. 
+            scope[name] = row
+            for column, value in row.items():
+                scope[f"{name}.{column}"] = value
+            before = dict(scope)
+
+            result = {"row": index, "input": row, "status": "ok", "error": None}
+            try:
+                if progress is not None:
+                    checkpoint_settings["row_prefix"] = f"{loop_key}[{index}]/"
+                exec_proc_stages(stages, scope=scope, namespace=namespace)
+            except Exception as e:
+                failures += 1
+                result.update({"status": "error", "error": f"{type(e).__name__}: {e}"})
+                log_entry("error", f"foreach {name} row {index} failed: {e}")
+            finally:
+                if progress is not None:
+                    checkpoint_settings["row_prefix"] = row_prefix
+
+            if results is not None:
+                result["variables"] = {key: value for key, value in scope.items() 
+                                       if (key not in before or before[key] is not value) and isinstance(value, (str, int, float, bool, type(None)))}
+                results.write(json.dumps(result) + "\n")
+                results.flush()
+
+            # Records the row in the checkpoint. 
+            if progress is not None:
+                progress["next"] = max(progress["next"], index + 1)
+                if result["status"] == "ok" and index in progress["failed"]:
+                    progress["failed"].remove(index)
+                elif result["status"] == "error" and index not in progress["failed"]:
+                    progress["failed"].append(index)
+                write_checkpoint(scope, force=True)
+    finally:
+        if results is not None:
+            results.close()
+
+    if failures and results is None:
+        raise RuntimeError(f"foreach {name} failed on {failures} rows")
+
+    # Forgets the progress of a finished loop, and of the loops nested in it. 
+    if progress is not None:
+        rows = checkpoint_settings["state"]["rows"]
+        for row_key in [row_key for row_key in rows if row_key == loop_key or row_key.startswith(f"{loop_key}[")]:
+            del rows[row_key]
+
+
+def exec_proc_from_file(file_path, variables=None):
+
+    # This function executes a procedure file by compiling it, or fetching it from 
+    # the compiled procedure cache, and executing each stage sequentially. 
+
+    # Parameters:
+    # file_path (str): The path to the procedure file that contains the instructions 
+    # to be executed.
+    # variables (dict): Optional variables loaded into `variable_dictionary` before 
+    # the first stage, available to the procedure as [var] references.
+
+    # Returns:
+    # None: This function does not return anything but executes code dynamically 
+    # as it processes each stage in the procedure file. 
+    #   Raises a ValueError listing every problem if the file fails `preflight_proc_file`, 
+    #   before any stage runs.
+
+    program, _ = load_proc_file(file_path, set(variable_dictionary) | set(variables or ()))
+    exec_proc_stages(program, variables)
+
+
+def load_proc_file(file_path, variables=()):
+
+    # Checks a procedure file with `preflight_proc_source` and compiles it with 
+    # `compile_proc_content`, reading and hashing the file once for both. 
+    #
+    # Parameters:
+    #    file_path (str): The path to the procedure file.
+    #    variables (iterable): The names of variables defined before the procedure starts.
+    #
+    # Returns:
+    #    tuple: The compiled stages and the SHA-256 hex digest of the file. 
+    #       Raises a ValueError if any problems are found.
+
+    with open(file_path, "rb") as file:
+        content = file.read()
+    digest = hashlib.sha256(content).hexdigest()
+    preflight_proc_source(content.decode("utf-8"), file_path, variables, digest)
+    return compile_proc_content(content, digest, file_path), digest
+
+
+def exec_proc_from_source(source, variables=None, file_path="<inline>"):
+
+    # This function executes the text of a procedure, e.g. one submitted to the daemon 
+    # rather than saved to a file, after checking it with `preflight_proc_source`. 
+
+    # Parameters:
+    # source (str): The full text of the procedure.
+    # variables (dict): Optional variables loaded into `variable_dictionary` before 
+    # the first stage.
+    # file_path (str): The name of the procedure, used in error messages and tracebacks.
+
+    # Returns:
+    # None: This function does not return anything but executes each stage of the procedure.
+
+    preflight_proc_source(source, file_path, set(variable_dictionary) | set(variables or ()))
+    exec_proc_stages(compile_proc_source(source, file_path), variables)
+
+
+def exec_proc_stream(lines, file_path="<stream>", variables=None):
+
+    # This function executes a procedure from any iterable of lines, running each 
+    # command as soon as it has been read rather than after the whole input is parsed. 
+    # Memory use does not grow with the length of the procedure. 
+
+    # Parameters:
+    # lines (iterable): The lines of the procedure, e.g. an open file, sys.stdin, 
+    # or a generator producing commands.
+    # file_path (str): The name of the procedure, used in error messages and tracebacks.
+    # variables (dict): Optional variables loaded into `variable_dictionary` before 
+    # the first stage.
+
+    # Returns:
+    # None: This function does not return anything but executes each line as it arrives.
+
+    exec_proc_stages(iter_proc_stages(lines, file_path), variables)
+
+
+def exec_proc_from_stream_file(file_path, variables=None):
+
+    # This function executes a procedure file line by line as it is read, without 
+    # compiling the whole file first. This suits very large generated procedures, 
+    # which are not worth storing in the compiled procedure cache. 
+
+    # Parameters:
+    # file_path (str): The path to the procedure file, or "-" to read from stdin.
+    # variables (dict): Optional variables loaded into `variable_dictionary` before 
+    # the first stage.
+
+    # Returns:
+    # None: This function does not return anything but executes each line as it is read.
+
+    if file_path == "-":
+        exec_proc_stream(sys.stdin, "<stdin>", variables)
+        return
+
+    with open(file_path, "r") as file:
+        exec_proc_stream(file, file_path, variables)
+
+
+def exec_proc_with_checkpoint(file_path, checkpoint_path, variables=None, interval=CHECKPOINT_INTERVAL):
+
+    # This function executes a procedure file while recording checkpoints, so that a run 
+    # which fails part way through can be resumed from the last good checkpoint rather 
+    # than from line 1. 
+
+    # The function works as follows:
+    # 1. If the checkpoint file exists and was recorded for the same procedure content 
+    #    and engine version, the run is resumed from it with `restore_checkpoint`. 
+    #    Otherwise the procedure starts from the beginning.
+    # 2. Each top-level stage is executed in turn. After a stage completes, the checkpoint 
+    #    is written if `interval` seconds have passed since the last one, see `write_checkpoint`.
+    # 3. If a stage fails, the checkpoint is written as it stood after the last completed 
+    #    stage, and the error is raised.
+    # 4. When the procedure completes, the checkpoint file is removed.
+
+    # Parameters:
+    # file_path (str): The path to the procedure file.
+    # checkpoint_path (str): The path of the checkpoint file, a small JSON file.
+    # variables (dict): Optional variables loaded into `variable_dictionary` before 
+    # the first stage.
+    # interval (int or float): The minimum number of seconds between checkpoints. Rows of a 
+    # `foreach` block are always checkpointed as they complete.
+
+    # Returns:
+    # None: This function does not return anything but executes each stage of the procedure.
+
+    program, digest = load_proc_file(file_path, set(variable_dictionary) | set(variables or ()))
+
+    # Loads the checkpoint, if it belongs to this procedure. 
+    state = load_checkpoint(checkpoint_path)
+    if state is not None and (state.get("digest") != digest or state.get("engine") != get_engine_fingerprint()):
+        log_entry("warning", f"Checkpoint {checkpoint_path} was recorded for a different procedure, starting from the beginning")
+        state = None
+    if state is None:
+        state = {"engine": get_engine_fingerprint(), "procedure": file_path, "digest": digest, "stage": 0, 
+                 "rows": {}, "variables": {}, "url": None, "cookies": []}
+
+    checkpoint_settings.update({"path": checkpoint_path, "interval": interval, "written": time.perf_counter(), 
+                                "state": state, "row_prefix": ""})
+    try:
+        if variables:
+            variable_dictionary.update(variables)
+        if state["stage"] or state["rows"]:
+            log_entry("info", f"Resuming {file_path} from checkpoint at stage {state['stage']} of {len(program)}")
+            restore_checkpoint(program, variable_dictionary)
+
+        for index in range(state["stage"], len(program)):
+            try:
+                exec_proc_stages(program[index:index + 1])
+            except Exception:
+                write_checkpoint(variable_dictionary, force=True)
+                raise
+            state["stage"] = index + 1
+            write_checkpoint(variable_dictionary)
+
+        try:
+            os.remove(checkpoint_path)
+        except FileNotFoundError:
+            pass
+    finally:
+        checkpoint_settings.update({"path": None, "state": None, "row_prefix": ""})
+
+
+def load_checkpoint(checkpoint_path):
+
+    # Reads a checkpoint file. 
+    #
+    # Parameters:
+    #    checkpoint_path (str): The path of the checkpoint file.
+    #
+    # Returns:
+    #    dict or None: The checkpoint state, or None if the file is missing or unreadable.
+
+    try:
+        with open(checkpoint_path, "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        log_entry("warning", f"Checkpoint read error: {e}")
+        return None
+
+
+def write_checkpoint(scope, force=False):
+
+    # Records the current checkpoint state and writes it to the checkpoint file. 
+    #
+    # The state holds the number of completed stages, the progress of any `foreach` 
+    # loops, the plain values in the variable scope, and the current URL and cookies 
+    # of the browser session. Values which cannot be saved, such as elements, are left out. 
+    # The file is written under a temporary name and moved into place, so a crash never 
+    # leaves a partially written checkpoint.
+    #
+    # Parameters:
+    #    scope (dict): The variable scope of the procedure.
+    #    force (bool): If True, the checkpoint is written even if the interval has not passed.
+    #
+    # Returns:
+    #    This function does not return a value. 
+
+    checkpoint_path = checkpoint_settings["path"]
+    if checkpoint_path is None:
+        return
+    now = time.perf_counter()
+    if not force and now - checkpoint_settings["written"] < checkpoint_settings["interval"]:
+        return
+
+    state = checkpoint_settings["state"]
+    state["variables"] = {key: value for key, value in scope.items() if isinstance(value, (str, int, float, bool, type(None)))}
+
+    # Reads the browser session. If the browser is no longer responding, the session 
+    # from the previous checkpoint is kept. 
+    browser = scope.get("browser")
+    if browser is None:
+        state["url"], state["cookies"] = None, []
+    else:
+        try:
+            state["url"], state["cookies"] = browser.current_url, browser.get_cookies()
+        except Exception as e:
+            log_entry("warning", f"Unable to read the browser session for the checkpoint: {e}")
+
+    temp_path = f"{checkpoint_path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "w") as file:
+            json.dump(state, file)
+        os.replace(temp_path, checkpoint_path)
+    except Exception as e:
+        log_entry("warning", f"Checkpoint write error: {e}")
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+    checkpoint_settings["written"] = now
+
+
+def restore_checkpoint(program, scope):
+
+    # Restores the state of a procedure from its checkpoint, before it resumes. 
+
+    # The function works as follows:
+    # 1. The saved variables are loaded into the scope.
+    # 2. If a browser session was open at the checkpoint, the last `start` stage before it 
+    #    is run again, and the saved cookies and URL are loaded into the new browser.
+    # 3. Element lookups made since the last navigation are run again, as elements cannot 
+    #    be saved. A lookup which no longer matches is logged and skipped.
+
+    # Parameters:
+    # program (tuple): The compiled stages of the procedure.
+    # scope (dict): The variable scope of the procedure.
+
+    # Returns:
+    # None: This function does not return a value. 
+
+    state = checkpoint_settings["state"]
+    scope.update(state["variables"])
+
+    # Finds the browser session and element lookups in use at the checkpoint. 
+    start_stage = None
+    lookup_stages = []
+    for stage in program[:state["stage"]]:
+        command = stage[1]
+        if command == "start":
+            start_stage, lookup_stages = stage, []
+        elif command == "quit":
+            start_stage, lookup_stages = None, []
+        elif command == "goto":
+            lookup_stages = []
+        elif command in LOOKUP_COMMANDS or command == "lookup":
+            lookup_stages.append(stage)
+
+    if start_stage is None:
+        return
+
+    # Restarts the browser session. 
+    exec_proc_stages([start_stage], scope=scope)
+    browser = scope["browser"]
+    if state["url"] is None:
+        return
+    browser_load(browser, state["url"])
+    if state["cookies"]:
+        for cookie in state["cookies"]:
+            try:
+                browser.add_cookie(cookie)
+            except Exception as e:
+                log_entry("warning", f"Unable to restore cookie {cookie.get('name')}: {e}")
+        browser_load(browser, state["url"])
+
+    # Looks up the elements again. 
+    for stage in lookup_stages:
+        try:
+            exec_proc_stages([stage], scope=scope)
+        except Exception as e:
+            log_entry("warning", f"Unable to restore the element lookup on line {stage[0]}: {e}")
+
+
+def start_trace(file_path, trace_format=None):
+
+    # The start_trace function starts recording a timing trace of every stage executed, 
+    # and of every WebDriver command sent within each stage. 
+    #
+    # Each event records its name, start time, duration, the .proc file and line number, 
+    # and whether it succeeded. Events are written as they happen, either as JSON lines 
+    # or in the Chrome trace event format, which can be opened in Perfetto or chrome://tracing.
+    #
+    # Parameters:
+    # file_path (str): The file to write the trace to.
+    # trace_format (str): "jsonl" or "chrome". Defaults to "chrome" for .json files, 
+    #   otherwise "jsonl".
+    #
+    # Returns:
+    # None: The function doesn't return a value. 
+
+    from selenium.webdriver.remote.webdriver import WebDriver
+
+    stop_trace()
+    if trace_format is None:
+        trace_format = "chrome" if file_path.endswith(".json") else "jsonl"
+    if trace_format not in ("jsonl", "chrome"):
+        raise ValueError(f"Unknown trace format: {trace_format}")
+
+    output = open(file_path, "w")
+    if trace_format == "chrome":
+        output.write("[\n")
+
+    trace_settings.update({"output": output, "format": trace_format, "events": 0, 
+                           "clock_offset": time.time() - time.perf_counter(), "original_execute": WebDriver.execute})
+
+    # Times every WebDriver command, for drivers started before or after this point. 
+    original_execute = WebDriver.execute
+
+    def traced_execute(driver, driver_command, params=None):
+        start_time = time.perf_counter()
+        try:
+            response = original_execute(driver, driver_command, params)
+        except Exception as e:
+            record_trace_event("webdriver", driver_command, start_time, False, {"error": str(e).strip()})
+            raise
+        record_trace_event("webdriver", driver_command, start_time, True)
+        return response
+
+    WebDriver.execute = traced_execute
+
+
+def stop_trace():
+
+    # Stops recording the timing trace and closes the trace file. 
+    #
+    # Parameters:
+    #    None: The function does not take a parameter. 
+    #
+    # Returns:
+    #    This function does not return a value. 
+
+    output = trace_settings["output"]
+    if output is None:
+        return
+
+    from selenium.webdriver.remote.webdriver import WebDriver
+    WebDriver.execute = trace_settings["original_execute"]
+
+    if trace_settings["format"] == "chrome":
+        output.write("\n]\n")
+    output.close()
+    trace_settings.update({"output": None, "format": None, "original_execute": None})
+
+
+def record_trace_event(category, name, start_time, success, args=None):
+
+    # Writes a completed event to the trace file. 
+    #
+    # The event is attached to the stage currently executing in this thread, if any.
+    #
+    # Parameters:
+    #    category (str): "stage" or "webdriver".
+    #    name (str): The command name.
+    #    start_time (float): The `time.perf_counter` value when the event started.
+    #    success (bool): Whether the event succeeded.
+    #    args (dict): Optional extra details, e.g. the error message.
+    #
+    # Returns:
+    #    This function does not return a value. 
+
+    duration = time.perf_counter() - start_time
+    output = trace_settings["output"]
+    if output is None:
+        return
+
+    details = {"file": getattr(trace_context, "file", None), "line": getattr(trace_context, "line", None), "success": success}
+    details.update(args or {})
+
+    if trace_settings["format"] == "chrome":
+        event = {"name": name, "cat": category, "ph": "X", "ts": start_time * 1e6, "dur": duration * 1e6, 
+                 "pid": os.getpid(), "tid": threading.get_ident(), "args": details}
+        separator = ",\n" if trace_settings["events"] else ""
+    else:
+        event = {"type": category, "name": name, "start": start_time + trace_settings["clock_offset"], "duration": duration, 
+                 "pid": os.getpid(), "thread": threading.get_ident()}
+        event.update(details)
+        separator = ""
+
+    with trace_lock:
+        output.write(separator + json.dumps(event, default=str) + ("\n" if trace_settings["format"] == "jsonl" else ""))
+        trace_settings["events"] += 1
+
+
+def exec_traced_stage(line_number, command, code, namespace, scope):
+
+    # Executes a compiled stage while recording it in the trace. 
+    #
+    # Parameters:
+    #    line_number (int): The line of the procedure file the stage came from.
+    #    command (str): The procedure command the stage runs.
+    #    code (code): The compiled stage.
+    #    namespace (dict): The globals the stage runs with.
+    #    scope (dict): The variable scope the stage runs against.
+    #
+    # Returns:
+    #    This function does not return a value. 
+
+    trace_context.file = code.co_filename
+    trace_context.line = line_number
+    start_time = time.perf_counter()
+    try:
+        exec(code, namespace, scope)
+    except BaseException as e:
+        record_trace_event("stage", command, start_time, False, {"error": f"{type(e).__name__}: {e}"})
+        raise
+    else:
+        record_trace_event("stage", command, start_time, True)
+    finally:
+        trace_context.file = None
+        trace_context.line = None
+
+
+def configure_metrics(enabled=True, port=None, output=None):
+
+    # The configure_metrics function turns on the metrics registry, which keeps aggregate 
+    # counters, gauges and latency histograms for capacity planning, rather than a record 
+    # of every run. 
+
+    # The function works as follows:
+    # 1. Each of METERED_FUNCTIONS is replaced by a wrapper, see `meter_function`, which 
+    #    times its calls into a histogram and counts its errors. Element lookups are also 
+    #    counted by whether the element was found, and stages by their command.
+    # 2. The number of live browsers and the element cache counters are read when the 
+    #    metrics are exported.
+    # 3. With a port, the metrics are served in the Prometheus text format at 
+    #    http://127.0.0.1:<port>/metrics. With an output file, they are written to it 
+    #    when the process exits.
+    # 4. Batch and daemon workers keep their own metrics and send them with each result, 
+    #    where they are added to the metrics of the parent with a "worker" label.
+
+    # Parameters:
+    # enabled (bool): Whether the metrics are on. Switching them off restores the engine 
+    #   functions and stops the server.
+    # port (int): The localhost port to serve the metrics on, or None.
+    # output (str): The file to write the metrics to at exit, or None.
+
+    # Returns:
+    # None: The function doesn't return a value. 
+
+    module = globals()
+
+    if not enabled:
+        module.update(metrics_settings["originals"])
+        metrics_settings["originals"].clear()
+        if metrics_settings["server"] is not None:
+            metrics_settings["server"].shutdown()
+            metrics_settings["server"].server_close()
+        metrics_settings.update({"enabled": False, "server": None, "output": None})
+        return
+
+    if not metrics_settings["enabled"]:
+        for name in METERED_FUNCTIONS:
+            metrics_settings["originals"][name] = module[name]
+            module[name] = meter_function(name, module[name])
+        metrics_settings["enabled"] = True
+
+    if port is not None and metrics_settings["server"] is None:
+        from http.server import ThreadingHTTPServer
+        server = ThreadingHTTPServer(("127.0.0.1", port), get_metrics_request_handler())
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="procbot-metrics", daemon=True).start()
+        metrics_settings["server"] = server
+        log_entry("info", f"Metrics served at http://127.0.0.1:{server.server_address[1]}/metrics")
+
+    if output is not None:
+        if metrics_settings["output"] is None:
+            atexit.register(write_metrics_at_exit)
+        metrics_settings["output"] = output
+
+
+def meter_function(name, function):
+
+    # Returns an engine function wrapped to record its calls in the metrics registry. 
+    #
+    # The metric keys are built once here, so that each call only takes two clock 
+    # readings and one histogram update.
+    #
+    # Parameters:
+    #    name (str): The name of the function, one of METERED_FUNCTIONS.
+    #    function (callable): The function to wrap.
+    #
+    # Returns:
+    #    callable: The wrapped function.
+
+    if name == "exec_proc_stage":
+        def metered_stage(line_number, command, code, namespace, scope):
+            start_time = time.perf_counter()
+            try:
+                function(line_number, command, code, namespace, scope)
+            except BaseException:
+                increment_metric(("procbot_stage_errors_total", (("command", command),)))
+                raise
+            finally:
+                observe_metric(("procbot_stage_duration_seconds", (("command", command),)), time.perf_counter() - start_time)
+        metered_stage.__wrapped__ = function
+        return metered_stage
+
+    labels = (("function", name),)
+    duration_key = ("procbot_call_duration_seconds", labels)
+    error_key = ("procbot_call_errors_total", labels)
+    found_key = ("procbot_element_lookups_total", labels + (("result", "found"),))
+    missing_key = ("procbot_element_lookups_total", labels + (("result", "missing"),))
+    lookup = name.startswith("get_element")
+
+    def metered(*args, **kwargs):
+        start_time = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        except BaseException:
+            increment_metric(error_key)
+            raise
+        finally:
+            observe_metric(duration_key, time.perf_counter() - start_time)
+
+        if lookup:
+            elements = result if name == "get_elements_batch" else (result,)
+            missing = sum(element is None for element in elements)
+            increment_metric(missing_key, missing)
+            increment_metric(found_key, len(elements) - missing)
+        elif result is None and name == "get_web_driver":
+            increment_metric(error_key)
+        return result
+
+    metered.__wrapped__ = function
+    return metered
+
+
+def increment_metric(key, value=1):
+
+    # Adds to a counter, given its (name, labels) key. 
+    with metrics_lock:
+        metric_counters[key] = metric_counters.get(key, 0) + value
+
+
+def observe_metric(key, value):
+
+    # Records a value, in seconds, in a histogram, given its (name, labels) key. 
+    index = bisect.bisect_left(METRIC_BUCKETS, value)
+    with metrics_lock:
+        histogram = metric_histograms.get(key)
+        if histogram is None:
+            histogram = metric_histograms[key] = [0] * (len(METRIC_BUCKETS) + 3)
+        histogram[index] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+
+def collect_metrics(reset=False):
+
+    # Returns a copy of the metrics, with the gauges and engine counters read now. 
+    #
+    # Parameters:
+    #    reset (bool): Whether to clear the counters and histograms once copied, so that 
+    #       a worker sends each increment to its parent once.
+    #
+    # Returns:
+    #    dict: The "counters", "gauges" and "histograms", each keyed by (name, labels).
+
+    with metrics_lock:
+        snapshot = {"counters": dict(metric_counters), "gauges": dict(metric_gauges), 
+                    "histograms": {key: list(histogram) for key, histogram in metric_histograms.items()}}
+        if reset:
+            metric_counters.clear()
+            metric_histograms.clear()
+
+    snapshot["gauges"][("procbot_browsers_live", ())] = len(active_browsers)
+    for event, count in element_cache_stats.items():
+        key = ("procbot_element_cache_total", (("event", event),))
+        snapshot["counters"][key] = snapshot["counters"].get(key, 0) + count
+    return snapshot
+
+
+def merge_worker_metrics(result, worker):
+
+    # Adds the metrics a batch or daemon worker sent with a job result to the metrics of 
+    # this process, labelled with the worker's process id. 
+    #
+    # Parameters:
+    #    result (dict): The job result, whose "metrics" are removed.
+    #    worker (dict): The worker state, see `start_proc_worker`.
+    #
+    # Returns:
+    #    This function does not return a value. 
+
+    snapshot = result.pop("metrics", None)
+    if snapshot is None:
+        return
+
+    label = (("worker", str(worker["process"].pid)),)
+    with metrics_lock:
+        for key, value in snapshot["counters"].items():
+            key = (key[0], key[1] + label)
+            if key[0] == "procbot_element_cache_total":
+                metric_counters[key] = value
+            else:
+                metric_counters[key] = metric_counters.get(key, 0) + value
+        for key, value in snapshot["gauges"].items():
+            metric_gauges[(key[0], key[1] + label)] = value
+        for key, counts in snapshot["histograms"].items():
+            histogram = metric_histograms.setdefault((key[0], key[1] + label), [0] * len(counts))
+            for index, count in enumerate(counts):
+                histogram[index] += count
+
+
+def format_metrics():
+
+    # Returns the metrics in the Prometheus text exposition format. 
+    #
+    # Parameters:
+    #    None: The function does not take a parameter. 
+    #
+    # Returns:
+    #    str: The metrics, grouped by name.
+
+    def format_labels(labels, extra=()):
+        pairs = labels + extra
+        if not pairs:
+            return ""
+        escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+    snapshot = collect_metrics()
+    series = {}
+    for kind in ("counters", "gauges", "histograms"):
+        for (name, labels), value in snapshot[kind].items():
+            series.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name in sorted(series):
+        metric_type, description = METRIC_DESCRIPTIONS.get(name, ("untyped", name))
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for labels, value in sorted(series[name]):
+            if metric_type != "histogram":
+                lines.append(f"{name}{format_labels(labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(METRIC_BUCKETS + ("+Inf",), value[:-2]):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels(labels, (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {value[-2]:.6f}")
+            lines.append(f"{name}_count{format_labels(labels)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics_at_exit():
+
+    # Writes the metrics to the output file given to `configure_metrics`, when the process exits. 
+    output = metrics_settings["output"]
+    if output is None:
+        return
+    try:
+        temporary_path = f"{output}.tmp"
+        with open(temporary_path, "w") as file:
+            file.write(format_metrics())
+        os.replace(temporary_path, output)
+    except OSError as e:
+        log_entry("error", f"Unable to write metrics to {output}: {e}")
+
+
+def get_metrics_request_handler():
+
+    # Returns the request handler class serving the metrics, see `configure_metrics`. 
+    #
+    # The class is defined on first use, so that the HTTP server modules are only imported 
+    # when the metrics are served.
+
+    if "metrics" in server_classes:
+        return server_classes["metrics"]
+
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsRequestHandler(BaseHTTPRequestHandler):
+
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            if self.path.split("?", 1)[0].rstrip("/") not in ("", "/metrics"):
+                return self.send_error(404)
+            body = format_metrics().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            log_entry("debug", f"Metrics request: {format % args}")
+
+    server_classes["metrics"] = MetricsRequestHandler
+    return MetricsRequestHandler
+
+
+def normalise_proc_job(job):
+
+    # Converts a batch job into its dictionary form. 
+    #
+    # A job can be given as a path, a (path, variables) tuple, or a dictionary 
+    # with "path" and optional "variables" keys. A dictionary can instead give the 
+    # text of the procedure as "source", with "path" as its optional name.
+    #
+    # Parameters:
+    #    job (str, tuple or dict): The job to be normalised.
+    #
+    # Returns:
+    #    dict: The job as {"path": str, "variables": dict}, with "source": str for 
+    #       a procedure given as text.
+
+    if isinstance(job, dict) and job.get("source") is not None:
+        return {"path": os.fspath(job.get("path") or "<inline>"), "variables": dict(job.get("variables") or {}), "source": str(job["source"])}
+    if isinstance(job, dict):
+        return {"path": os.fspath(job["path"]), "variables": dict(job.get("variables") or {})}
+    if isinstance(job, (tuple, list)):
+        path, variables = job
+        return {"path": os.fspath(path), "variables": dict(variables or {})}
+    return {"path": os.fspath(job), "variables": {}}
+
+
+def run_proc_job(index, job):
+
+    # The run_proc_job function executes a single batch job in the current process 
+    # and reports its outcome, so that a failing job never stops a batch. 
+    #
+    # The variable dictionary is reset before the job runs, and any browser left 
+    # running by the job is stopped afterwards.
+    #
+    # Parameters:
+    # index (int): The position of the job in the batch.
+    # job (dict): The normalised job, see `normalise_proc_job`.
+    #
+    # Returns:
+    # dict: The job result, with the keys "job", "path", "status" ("ok" or "error"), 
+    #   "error", "duration" and "variables" (the plain values left in the variable dictionary).
+
+    result = {"job": index, "path": job["path"], "status": "ok", "error": None}
+    start_time = time.perf_counter()
+
+    variable_dictionary.clear()
+    log_context.job = index
+    try:
+        if job.get("source") is not None:
+            exec_proc_from_source(job["source"], job["variables"], job["path"])
+        else:
+            exec_proc_from_file(job["path"], job["variables"])
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+        log_entry("error", f"Job {index} failed: {result['error']}", file=job["path"])
+    finally:
+        release_active_browsers()
+        log_context.job = None
+
+    result["duration"] = time.perf_counter() - start_time
+    result["variables"] = {key: value for key, value in variable_dictionary.items() if isinstance(value, (str, int, float, bool, type(None)))}
+    return result
+
+
+def preflight_proc_job(job):
+
+    # Checks the procedure of a normalised batch job, see `preflight_proc_file`. 
+    if job.get("source") is not None:
+        preflight_proc_source(job["source"], job["path"], job["variables"])
+    else:
+        preflight_proc_file(job["path"], job["variables"])
+
+
+def raise_system_exit(signal_number, frame):
+
+    # Signal handler which unwinds a worker, so browsers are stopped when it is terminated. 
+    raise SystemExit(128 + signal_number)
+
+
+def watch_parent_process(parent_pid):
+
+    # The main loop of a worker's parent watcher. Once the parent process has gone, 
+    # the worker terminates itself, so its browsers are stopped rather than orphaned 
+    # when the parent is killed without stopping its workers. 
+    #
+    # Parameters:
+    #    parent_pid (int): The process ID of the batch runner or daemon.
+    #
+    # Returns:
+    #    This function does not return a value. 
+
+    while os.getppid() == parent_pid:
+        time.sleep(PARENT_POLL_INTERVAL)
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def proc_worker_main(connection, browser_pool=None, log_config=None, metrics=False, parent_connection=None, parent_pid=None):
+
+    # The proc_worker_main function is the main loop of a batch worker process. 
+    #
+    # The worker receives (index, job) tasks over its connection, runs them with 
+    # `run_proc_job` and sends back each result. It exits when it receives None 
+    # or the connection is closed.
+    #
+    # Parameters:
+    # connection (Connection): The worker end of the pipe to the batch runner.
+    # browser_pool (dict): Optional keyword arguments for `configure_browser_pool`, 
+    #   so the worker keeps its browsers warm between jobs.
+    # log_config (dict): Optional keyword arguments for `configure_logging`, so the 
+    #   worker logs in the same way as the batch runner.
+    # metrics (bool): Whether to keep metrics, which are sent with each result, see 
+    #   `configure_metrics`.
+    # parent_connection (Connection): The parent end of the pipe, inherited when the worker 
+    #   is forked. It is closed at once, so the worker sees the connection close if its 
+    #   parent dies.
+    # parent_pid (int): The process ID of the parent, which is watched so the worker exits 
+    #   once the parent has gone, even while a job is running.
+    #
+    # Returns:
+    # None: The function doesn't return a value. 
+
+    if parent_connection is not None:
+        parent_connection.close()
+
+    # Terminating a worker stops its browsers rather than orphaning them. Ctrl-C is left to 
+    # the parent, which stops its workers in turn. 
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, raise_system_exit)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    if parent_pid is not None:
+        threading.Thread(target=watch_parent_process, args=(parent_pid,), name="procbot-parent", daemon=True).start()
+
+    if log_config is not None:
+        configure_logging(**log_config)
+
+    # Starts the worker's metrics from zero, rather than from those of its parent. 
+    if metrics:
+        configure_metrics()
+        with metrics_lock:
+            metric_counters.clear()
+            metric_gauges.clear()
+            metric_histograms.clear()
+
+    try:
+        if browser_pool is not None:
+            configure_browser_pool(**browser_pool)
+
+        while True:
+            try:
+                task = connection.recv()
+            except (EOFError, OSError):
+                break
+            if task is None:
+                break
+
+            index, job = task
+            result = run_proc_job(index, job)
+            if metrics:
+                result["metrics"] = collect_metrics(reset=True)
+            try:
+                connection.send(result)
+            except OSError:
+                break
+    finally:
+        close_browser_pool()
+        for driver in list(active_browsers):
+            browser_stop(driver)
+        stop_log_writer()
+
+
+def start_proc_worker(context, browser_pool=None):
+
+    # Starts a batch worker process. 
+    #
+    # Parameters:
+    #    context (multiprocessing context): The context used to create the process.
+    #    browser_pool (dict): Optional browser pool settings for the worker.
+    #
+    # Returns:
+    #    dict: The worker state, holding its process, connection and current task.
+
+    parent_connection, child_connection = context.Pipe()
+    process = context.Process(target=proc_worker_main, args=(child_connection, browser_pool, get_logging_config(), metrics_settings["enabled"], 
+                                                             parent_connection, os.getpid()), daemon=True)
+    process.start()
+    child_connection.close()
+    return {"process": process, "connection": parent_connection, "task": None, "deadline": None}
+
+
+def stop_proc_worker(worker, grace=5):
+
+    # Stops a batch worker process, killing it if it does not exit in time. 
+    #
+    # Parameters:
+    #    worker (dict): The worker state returned by `start_proc_worker`.
+    #    grace (int or float): The number of seconds to wait for the worker to exit.
+    #
+    # Returns:
+    #    This function does not return a value. 
+
+    process = worker["process"]
+    if process.is_alive():
+        process.terminate()
+        process.join(grace)
+    if process.is_alive():
+        process.kill()
+        process.join()
+    worker["connection"].close()
+
+
+def run_many(jobs, workers=None, timeout=None, browser_pool=None, checkpoint=None):
+
+    # The run_many function runs a batch of procedure jobs across a pool of worker 
+    # processes, each of which starts its own browsers with `get_web_driver`. 
+
+    # The function works as follows:
+    # 1. It starts up to `workers` processes and hands each one a job.
+    # 2. As each worker reports a result, it is given the next job in the batch.
+    # 3. A worker which runs past the timeout, or exits unexpectedly, is stopped and 
+    #    replaced, and its job is recorded as failed. The rest of the batch carries on.
+    # 4. Once every job has a result, the workers are shut down.
+    # 5. If a checkpoint file is given, each result is appended to it as it arrives. Jobs 
+    #    which succeeded in a previous run with the same checkpoint are not run again, and 
+    #    their earlier results are returned. The file is removed once every job has succeeded.
+
+    # Parameters:
+    # jobs (iterable): The jobs to run. Each job is a path, a (path, variables) tuple, 
+    #   or a dictionary with "path" and optional "variables" keys.
+    # workers (int): The number of worker processes. Defaults to the number of CPUs.
+    # timeout (int or float): The maximum number of seconds a single job may run for.
+    # browser_pool (dict): Optional keyword arguments for `configure_browser_pool`, applied 
+    #   in every worker so that browsers are reused across the jobs a worker runs.
+    # checkpoint (str): Optional path of a JSON lines file recording the results of the batch.
+
+    # Returns:
+    # list: One result dictionary per job, in the order the jobs were given. 
+    #   See `run_proc_job` for the keys. Timed out jobs have the status "timeout".
+
+    jobs = [normalise_proc_job(job) for job in jobs]
+    results = [None] * len(jobs)
+    if not jobs:
+        return results
+
+    # Reuses the results of jobs which succeeded before the checkpoint. 
+    checkpoint_file = None
+    if checkpoint is not None:
+        for result in load_batch_checkpoint(checkpoint, jobs):
+            results[result["job"]] = result
+        checkpoint_file = open(checkpoint, "a+")
+
+        # Ends a line left unfinished by a batch which stopped while writing it. 
+        if checkpoint_file.tell() > 0:
+            checkpoint_file.seek(checkpoint_file.tell() - 1)
+            if checkpoint_file.read(1) != "\n":
+                checkpoint_file.write("\n")
+
+    def record(result):
+        results[result["job"]] = result
+        if checkpoint_file is not None:
+            checkpoint_file.write(json.dumps(dict(result, variables_in=jobs[result["job"]]["variables"]), default=str) + "\n")
+            checkpoint_file.flush()
+
+    # Fails jobs whose procedure does not pass its preflight checks, without sending 
+    # them to a worker. 
+    for index, job in enumerate(jobs):
+        if results[index] is None:
+            try:
+                preflight_proc_job(job)
+            except Exception as e:
+                record({"job": index, "path": job["path"], "status": "error", "error": f"{type(e).__name__}: {e}", 
+                        "duration": 0.0, "variables": {}})
+
+    import multiprocessing
+    from multiprocessing.connection import wait as wait_for_connections
+
+    remaining = [(index, job) for index, job in enumerate(jobs) if results[index] is None]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(remaining) or 1))
+    context = multiprocessing.get_context()
+    pending = iter(remaining)
+    pool = []
+
+    def assign(worker):
+        task = next(pending, None)
+        worker["task"] = task
+        worker["started"] = time.perf_counter()
+        if task is None:
+            worker["deadline"] = None
+            return
+        worker["deadline"] = worker["started"] + timeout if timeout else None
+        worker["connection"].send(task)
+
+    def fail(worker, status, error):
+        index, job = worker["task"]
+        record({"job": index, "path": job["path"], "status": status, "error": error, 
+                "duration": time.perf_counter() - worker["started"], "variables": {}})
+
+    try:
+        for _ in range(workers if remaining else 0):
+            worker = start_proc_worker(context, browser_pool)
+            pool.append(worker)
+            assign(worker)
+
+        while any(worker["task"] is not None for worker in pool):
+
+            # Waits for a result, or until the earliest deadline. 
+            busy = [worker for worker in pool if worker["task"] is not None]
+            deadlines = [worker["deadline"] for worker in busy if worker["deadline"] is not None]
+            wait_time = max(0, min(deadlines) - time.perf_counter()) if deadlines else None
+            ready = wait_for_connections([worker["connection"] for worker in busy], wait_time)
+
+            for index, worker in enumerate(pool):
+                if worker["task"] is None:
+                    continue
+
+                if worker["connection"] in ready:
+                    try:
+                        result = worker["connection"].recv()
+                    except (EOFError, OSError):
+                        fail(worker, "error", f"Worker exited with code {worker['process'].exitcode}")
+                    else:
+                        merge_worker_metrics(result, worker)
+                        record(result)
+                        assign(worker)
+                        continue
+
+                elif worker["deadline"] is not None and time.perf_counter() >= worker["deadline"]:
+                    fail(worker, "timeout", f"Job exceeded the {timeout} second timeout")
+
+                else:
+                    continue
+
+                # Replaces a worker which timed out or died. 
+                stop_proc_worker(worker)
+                pool[index] = start_proc_worker(context, browser_pool)
+                assign(pool[index])
+
+    finally:
+        for worker in pool:
+            if worker["task"] is None and worker["process"].is_alive():
+                try:
+                    worker["connection"].send(None)
+                except OSError:
+                    pass
+                worker["process"].join(5)
+            stop_proc_worker(worker)
+        if checkpoint_file is not None:
+            checkpoint_file.close()
+
+    if checkpoint is not None and all(result["status"] == "ok" for result in results):
+        os.remove(checkpoint)
+    return results
+
+
+def load_batch_checkpoint(checkpoint, jobs):
+
+    # Reads the results of a previous run of a batch from its checkpoint file. 
+    #
+    # A result is only reused if it succeeded and the job at its position has the same 
+    # path and variables, so a checkpoint left by a different batch is ignored. Lines 
+    # which cannot be read, e.g. one cut short when a batch was killed, are skipped.
+    #
+    # Parameters:
+    #    checkpoint (str): The path of the batch checkpoint file.
+    #    jobs (list): The normalised jobs of the batch.
+    #
+    # Returns:
+    #    list: The results of the jobs which have already succeeded.
+
+    completed = {}
+    try:
+        with open(checkpoint, "r") as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    log_entry("warning", f"Skipping unreadable line in batch checkpoint {checkpoint}")
+                    continue
+                if not isinstance(result, dict):
+                    continue
+                index = result.get("job")
+                if not isinstance(index, int) or not 0 <= index < len(jobs):
+                    continue
+                if result.get("path") != jobs[index]["path"] or result.pop("variables_in", None) != jobs[index]["variables"]:
+                    continue
+                if result.get("status") == "ok":
+                    completed[index] = result
+                else:
+                    completed.pop(index, None)
+    except FileNotFoundError:
+        pass
+
+    if completed:
+        log_entry("info", f"Resuming batch from checkpoint, skipping {len(completed)} completed jobs of {len(jobs)}")
+    return list(completed.values())
+
+
+def start_proc_daemon(workers=None, browser_pool=None, max_queue=DAEMON_MAX_QUEUE, timeout=None, allow_source=False):
+
+    # The start_proc_daemon function starts a resident job runner, which keeps its worker 
+    # processes, and their browsers, running between jobs so that each job starts straight away. 
+
+    # The function works as follows:
+    # 1. It starts a dispatcher thread, which starts the worker processes with `start_proc_worker`. 
+    # 2. Jobs are queued with `submit_daemon_job` and handed to idle workers in order of 
+    #    priority, then of submission.
+    # 3. A job which runs past its timeout is stopped with its worker, which is replaced, 
+    #    as in `run_many`.
+    # 4. Results are kept for `get_daemon_job`, for the last DAEMON_MAX_FINISHED jobs.
+
+    # Parameters:
+    # workers (int): The number of worker processes. Defaults to the number of CPUs.
+    # browser_pool (dict): Optional keyword arguments for `configure_browser_pool`, applied 
+    #   in every worker, e.g. {"warm": {"Chrome": 1}}.
+    # max_queue (int): The number of queued jobs above which new jobs are refused.
+    # timeout (int or float): The default maximum number of seconds a job may run for.
+    # allow_source (bool): Whether jobs may give the text of a procedure as "source". 
+    #   Otherwise only procedure files already on disk can be run.
+
+    # Returns:
+    # dict: The daemon state, used by the other daemon functions.
+
+    import multiprocessing
+
+    wake_reader, wake_writer = multiprocessing.Pipe(duplex=False)
+    daemon = {"workers": max(1, workers or os.cpu_count() or 1), "browser_pool": browser_pool, 
+              "max_queue": max_queue, "timeout": timeout, "allow_source": allow_source, "lock": threading.Lock(), 
+              "queue": [], "jobs": {}, "finished": [], "sequence": 0, "stopping": False, 
+              "wake_reader": wake_reader, "wake_writer": wake_writer, "pool": [], "started": time.time(), 
+              "counts": {"submitted": 0, "refused": 0, "ok": 0, "error": 0, "timeout": 0, "cancelled": 0}}
+    daemon["changed"] = threading.Condition(daemon["lock"])
+    daemon["thread"] = threading.Thread(target=run_daemon_dispatcher, args=(daemon,), name="procbot-daemon", daemon=True)
+    daemon["thread"].start()
+    return daemon
+
+
+def submit_daemon_job(daemon, job, priority=0, timeout=None):
+
+    # Queues a job on the daemon. 
+    #
+    # The procedure is checked with its preflight checks before it is queued, so a broken 
+    # job is refused at once. When the queue is full the job is refused, so that callers 
+    # slow down rather than the queue growing without limit.
+    #
+    # Parameters:
+    #    daemon (dict): The daemon state returned by `start_proc_daemon`.
+    #    job (str, tuple or dict): The job, see `normalise_proc_job`.
+    #    priority (int): Jobs with a higher priority run first.
+    #    timeout (int or float): The maximum number of seconds the job may run for. 
+    #       Defaults to the daemon timeout.
+    #
+    # Returns:
+    #    dict: The queued job record, with its "id". 
+    #       Raises a PermissionError for a "source" job the daemon does not allow, a ValueError 
+    #       if the job fails its preflight checks, or an OverflowError if the queue is full.
+
+    job = normalise_proc_job(job)
+    if job.get("source") is not None and not daemon["allow_source"]:
+        raise PermissionError("The daemon does not accept procedure source, start it with --allow-source")
+    preflight_proc_job(job)
+
+    with daemon["lock"]:
+        if daemon["stopping"]:
+            raise RuntimeError("The daemon is stopping")
+        if len(daemon["queue"]) >= daemon["max_queue"]:
+            daemon["counts"]["refused"] += 1
+            raise OverflowError(f"The job queue is full ({daemon['max_queue']} jobs)")
+
+        daemon["sequence"] += 1
+        record = {"id": os.urandom(8).hex(), "path": job["path"], "priority": int(priority), 
+                  "timeout": timeout if timeout is not None else daemon["timeout"], "status": "queued", 
+                  "submitted": time.time(), "started": None, "finished": None, "result": None, "job": job}
+        daemon["jobs"][record["id"]] = record
+        heapq.heappush(daemon["queue"], (-record["priority"], daemon["sequence"], record["id"]))
+        daemon["counts"]["submitted"] += 1
+        daemon["wake_writer"].send(None)
+
+    return describe_daemon_job(record)
+
+
+def get_daemon_job(daemon, job_id, wait=None):
+
+    # Returns the status of a daemon job, and its result once it has finished. 
+    #
+    # Parameters:
+    #    daemon (dict): The daemon state returned by `start_proc_daemon`.
+    #    job_id (str): The id returned by `submit_daemon_job`.
+    #    wait (int or float): The number of seconds to wait for the job to finish, or None 
+    #       to return straight away.
+    #
+    # Returns:
+    #    dict or None: The job record, or None if the job is not known.
+
+    with daemon["changed"]:
+        record = daemon["jobs"].get(job_id)
+        if record is not None and wait:
+            daemon["changed"].wait_for(lambda: record["status"] not in ("queued", "running"), float(wait))
+        return describe_daemon_job(record) if record is not None else None
+
+
+def cancel_daemon_job(daemon, job_id):
+
+    # Cancels a daemon job which has not started yet. 
+    #
+    # Parameters:
+    #    daemon (dict): The daemon state returned by `start_proc_daemon`.
+    #    job_id (str): The id returned by `submit_daemon_job`.
+    #
+    # Returns:
+    #    dict or None: The job record, or None if the job is not known. A job which has 
+    #       already started is left to finish.
+
+    with daemon["changed"]:
+        record = daemon["jobs"].get(job_id)
+        if record is not None and record["status"] == "queued":
+            daemon["queue"] = [entry for entry in daemon["queue"] if entry[2] != job_id]
+            heapq.heapify(daemon["queue"])
+            finish_daemon_job(daemon, record, {"job": job_id, "path": record["path"], "status": "cancelled", 
+                                               "error": None, "duration": 0.0, "variables": {}})
+        return describe_daemon_job(record) if record is not None else None
+
+
+def get_daemon_status(daemon):
+
+    # Returns the queue length, the number of busy workers and the job counts of the daemon. 
+    with daemon["lock"]:
+        return {"queued": len(daemon["queue"]), "running": sum(worker["task"] is not None for worker in daemon["pool"]), 
+                "workers": daemon["workers"], "max_queue": daemon["max_queue"], 
+                "uptime": time.time() - daemon["started"], "jobs": dict(daemon["counts"])}
+
+
+def describe_daemon_job(record):
+
+    # Returns the public fields of a daemon job record. 
+    return {key: record[key] for key in ("id", "path", "priority", "status", "submitted", "started", "finished", "result")}
+
+
+def finish_daemon_job(daemon, record, result):
+
+    # Records the result of a daemon job, forgetting the oldest finished jobs beyond 
+    # DAEMON_MAX_FINISHED. Called with the daemon lock held. 
+    record.update({"status": result["status"], "result": result, "finished": time.time(), "job": None})
+    daemon["counts"][result["status"]] = daemon["counts"].get(result["status"], 0) + 1
+    daemon["finished"].append(record["id"])
+    if len(daemon["finished"]) > DAEMON_MAX_FINISHED:
+        for job_id in daemon["finished"][:-DAEMON_MAX_FINISHED]:
+            daemon["jobs"].pop(job_id, None)
+        del daemon["finished"][:-DAEMON_MAX_FINISHED]
+    daemon["changed"].notify_all()
+
+
+def run_daemon_dispatcher(daemon):
+
+    # The main loop of the daemon, which hands queued jobs to idle workers and collects 
+    # their results. See `start_proc_daemon`.
+    #
+    # Parameters:
+    #    daemon (dict): The daemon state returned by `start_proc_daemon`.
+    #
+    # Returns:
+    #    This function does not return a value. 
+
+    import multiprocessing
+    from multiprocessing.connection import wait as wait_for_connections
+
+    context = multiprocessing.get_context()
+    pool = daemon["pool"]
+
+    def assign(worker):
+        with daemon["lock"]:
+            worker["task"] = worker["deadline"] = None
+            while daemon["queue"] and not daemon["stopping"]:
+                _, _, job_id = heapq.heappop(daemon["queue"])
+                record = daemon["jobs"].get(job_id)
+                if record is None or record["status"] != "queued":
+                    continue
+                record.update({"status": "running", "started": time.time()})
+                worker["task"] = (job_id, record["job"])
+                worker["started"] = time.perf_counter()
+                if record["timeout"]:
+                    worker["deadline"] = worker["started"] + record["timeout"]
+                worker["connection"].send(worker["task"])
+                return
+
+    def complete(worker, result):
+        with daemon["lock"]:
+            record = daemon["jobs"].get(worker["task"][0])
+            if record is not None:
+                finish_daemon_job(daemon, record, result)
+        worker["task"] = None
+
+    try:
+        with daemon["lock"]:
+            pool.extend(start_proc_worker(context, daemon["browser_pool"]) for _ in range(daemon["workers"]))
+
+        while not daemon["stopping"]:
+            for worker in pool:
+                if worker["task"] is None:
+                    assign(worker)
+
+            # Waits for a result, a new job, or until the earliest deadline. 
+            busy = [worker for worker in pool if worker["task"] is not None]
+            deadlines = [worker["deadline"] for worker in busy if worker["deadline"] is not None]
+            wait_time = max(0, min(deadlines) - time.perf_counter()) if deadlines else None
+            ready = wait_for_connections([worker["connection"] for worker in busy] + [daemon["wake_reader"]], wait_time)
+
+            if daemon["wake_reader"] in ready:
+                while daemon["wake_reader"].poll():
+                    daemon["wake_reader"].recv()
+
+            for index, worker in enumerate(pool):
+                if worker["task"] is None:
+                    continue
+
+                if worker["connection"] in ready:
+                    try:
+                        result = worker["connection"].recv()
+                    except (EOFError, OSError):
+                        error = f"Worker exited with code {worker['process'].exitcode}"
+                        complete(worker, {"job": worker["task"][0], "path": worker["task"][1]["path"], "status": "error", 
+                                          "error": error, "duration": time.perf_counter() - worker["started"], "variables": {}})
+                    else:
+                        merge_worker_metrics(result, worker)
+                        complete(worker, result)
+                        continue
+
+                elif worker["deadline"] is not None and time.perf_counter() >= worker["deadline"]:
+                    error = f"Job exceeded its {worker['deadline'] - worker['started']:g} second timeout"
+                    complete(worker, {"job": worker["task"][0], "path": worker["task"][1]["path"], "status": "timeout", 
+                                      "error": error, "duration": time.perf_counter() - worker["started"], "variables": {}})
+
+                else:
+                    continue
+
+                # Replaces a worker which timed out or died. 
+                stop_proc_worker(worker)
+                with daemon["lock"]:
+                    pool[index] = start_proc_worker(context, daemon["browser_pool"])
+
+    except Exception as e:
+        log_entry("error", f"Daemon dispatcher error: {e}")
+    finally:
+        for worker in pool:
+            if worker["process"].is_alive():
+                try:
+                    worker["connection"].send(None)
+                except OSError:
+                    pass
+                worker["process"].join(5)
+
+            # Records the result of a job the worker finished while stopping, or fails it. 
+            if worker["task"] is not None:
+                try:
+                    result = worker["connection"].recv() if worker["connection"].poll() else None
+                except (EOFError, OSError):
+                    result = None
+                if result is not None:
+                    merge_worker_metrics(result, worker)
+                complete(worker, result or {"job": worker["task"][0], "path": worker["task"][1]["path"], "status": "error", 
+                                            "error": "The daemon stopped", "duration": time.perf_counter() - worker["started"], "variables": {}})
+            stop_proc_worker(worker)
+
+
+def stop_proc_daemon(daemon):
+
+    # Stops the daemon. Queued jobs are cancelled, running jobs are left to finish for up to 
+    # 5 seconds, and the worker processes and their browsers are stopped. 
+    #
+    # Parameters:
+    #    daemon (dict): The daemon state returned by `start_proc_daemon`.
+    #
+    # Returns:
+    #    This function does not return a value. 
+
+    with daemon["changed"]:
+        daemon["stopping"] = True
+        for _, _, job_id in daemon["queue"]:
+            record = daemon["jobs"].get(job_id)
+            if record is not None and record["status"] == "queued":
+                finish_daemon_job(daemon, record, {"job": job_id, "path": record["path"], "status": "cancelled", 
+                                                   "error": "The daemon stopped", "duration": 0.0, "variables": {}})
+        daemon["queue"] = []
+        daemon["wake_writer"].send(None)
+    daemon["thread"].join()
+
+
+def get_daemon_request_handler():
+
+    # Returns the request handler class serving the daemon's HTTP API, see `serve_proc_daemon`. 
+    #
+    # The class is defined on first use, so that the HTTP server modules are only imported 
+    # by the daemon.
+
+    if "daemon" in server_classes:
+        return server_classes["daemon"]
+
+    import socket
+    from http.server import BaseHTTPRequestHandler
+
+    class DaemonRequestHandler(BaseHTTPRequestHandler):
+
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            # Sends each response straight away over TCP, which Unix sockets do not need. 
+            self.disable_nagle_algorithm = self.request.family != socket.AF_UNIX
+            super().setup()
+
+        def do_POST(self):
+            if not self.check_request():
+                return
+            if self.path.rstrip("/") != "/jobs":
+                return self.send_json(404, {"error": "Not found"})
+            if self.headers.get_content_type() != "application/json":
+                return self.send_json(415, {"error": "Jobs must be sent as application/json"})
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                if not isinstance(body, dict) or (body.get("path") is None and body.get("source") is None):
+                    raise ValueError("A job needs a path or a source")
+                job = {key: body[key] for key in ("path", "source", "variables") if body.get(key) is not None}
+                record = submit_daemon_job(self.server.daemon, job, body.get("priority", 0), body.get("timeout"))
+            except OverflowError as e:
+                return self.send_json(503, {"error": str(e)}, {"Retry-After": "1"})
+            except PermissionError as e:
+                return self.send_json(403, {"error": str(e)})
+            except (ValueError, TypeError, OSError) as e:
+                return self.send_json(422, {"error": str(e)})
+            except RuntimeError as e:
+                return self.send_json(503, {"error": str(e)})
+
+            if body.get("wait"):
+                record = get_daemon_job(self.server.daemon, record["id"], body["wait"])
+            self.send_json(202 if record["status"] in ("queued", "running") else 200, record)
+
+        def do_GET(self):
+            if not self.check_request():
+                return
+            parts = urllib.parse.urlsplit(self.path)
+            if parts.path.rstrip("/") == "/status":
+                return self.send_json(200, get_daemon_status(self.server.daemon))
+            if parts.path.rstrip("/") == "/metrics":
+                return self.send_body(200, format_metrics().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+
+            match = re.fullmatch(r"/jobs/(\w+)", parts.path)
+            if match is None:
+                return self.send_json(404, {"error": "Not found"})
+            wait = urllib.parse.parse_qs(parts.query).get("wait", [None])[0]
+            try:
+                record = get_daemon_job(self.server.daemon, match.group(1), float(wait) if wait else None)
+            except ValueError:
+                return self.send_json(400, {"error": f"Invalid wait: {wait}"})
+            if record is None:
+                return self.send_json(404, {"error": "Unknown job"})
+            self.send_json(200, record)
+
+        def do_DELETE(self):
+            if not self.check_request():
+                return
+            match = re.fullmatch(r"/jobs/(\w+)", self.path)
+            record = cancel_daemon_job(self.server.daemon, match.group(1)) if match else None
+            if record is None:
+                return self.send_json(404, {"error": "Unknown job"})
+            self.send_json(200, record)
+
+        def check_request(self):
+            # Refuses requests made by web pages: browsers send an Origin header with 
+            # cross-site requests, and the name the page was loaded from as the Host. 
+            host = self.headers.get("Host")
+            if self.headers.get("Origin") is not None:
+                self.send_json(403, {"error": "Cross-origin requests are not accepted"})
+            elif host is not None and re.sub(r":\d+$", "", host.strip().lower()) not in DAEMON_HOSTS:
+                self.send_json(403, {"error": f"Unknown host: {host}"})
+            else:
+                return True
+            return False
+
+        def send_json(self, status, content, headers=None):
+            self.send_body(status, (json.dumps(content, default=str) + "\n").encode("utf-8"), "application/json", headers)
+
+        def send_body(self, status, body, content_type, headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def address_string(self):
+            return self.client_address[0] if self.client_address else "unix"
+
+        def log_message(self, format, *args):
+            log_entry("debug", f"Daemon request: {format % args}")
+
+    server_classes["daemon"] = DaemonRequestHandler
+    return DaemonRequestHandler
+
+
+def serve_proc_daemon(daemon, port=DAEMON_PORT, socket_path=None):
+
+    # The serve_proc_daemon function serves the daemon's HTTP API on localhost, or on a Unix 
+    # socket, until it is interrupted. 
+    #
+    # The API is:
+    #   POST /jobs         Queues a job, given as application/json with "path" or "source", 
+    #                      and optional "variables", "priority", "timeout" and "wait" (seconds 
+    #                      to wait for the result). Answers 422 if the job fails its preflight 
+    #                      checks, 403 for "source" unless the daemon allows it, and 503 with 
+    #                      Retry-After when the queue is full.
+    #   GET /jobs/<id>     Returns the status of a job, and its result once finished. 
+    #                      Add ?wait=<seconds> to wait for the job to finish.
+    #   DELETE /jobs/<id>  Cancels a job which has not started.
+    #   GET /status        Returns the queue length, busy workers and job counts.
+    #   GET /metrics       Returns the metrics in the Prometheus text format, when they 
+    #                      are on, see `configure_metrics`.
+    #
+    # Requests with an Origin header, or a Host other than the loopback address, are 
+    # refused with 403, so web pages open in a browser on the same machine cannot use it.
+    #
+    # Parameters:
+    # daemon (dict): The daemon state returned by `start_proc_daemon`.
+    # port (int): The localhost port to listen on.
+    # socket_path (str): The path of a Unix socket to listen on instead of a port.
+    #
+    # Returns:
+    # None: The function doesn't return a value. 
+
+    import socketserver
+    from http.server import ThreadingHTTPServer
+
+    class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, get_daemon_request_handler())
+        address = f"unix:{socket_path}"
+    else:
+        server = ThreadingHTTPServer(("127.0.0.1", port), get_daemon_request_handler())
+        server.daemon_threads = True
+        address = f"http://127.0.0.1:{server.server_address[1]}"
+    server.daemon = daemon
+
+    log_entry("info", f"ProcBot daemon listening on {address} with {daemon['workers']} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path is not None and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def load_variable_sets(file_path):
+
+    # Reads variable sets from a JSON lines file, one JSON object per line. 
+    #
+    # Parameters:
+    #    file_path (str): The path to the JSON lines file.
+    #
+    # Returns:
+    #    list: A list of variable dictionaries.
+
+    with open(file_path, "r") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def check_proc_files(file_paths, variable_sets):
+
+    # Checks procedure files for the `check` command, printing every problem found. 
+    #
+    # Parameters:
+    #    file_paths (list): The procedure files to check.
+    #    variable_sets (list): The variable sets the files will be run with. Each file is 
+    #       checked once for each distinct set of variable names.
+    #
+    # Returns:
+    #    int: The process exit code, 1 if any file has a problem, otherwise 0.
+
+    name_sets = {frozenset(variables) for variables in variable_sets}
+    failed = 0
+    for file_path in file_paths:
+        try:
+            with open(file_path, "r") as file:
+                lines = file.read().splitlines()
+        except OSError as e:
+            print(f"{file_path}: {e}")
+            failed += 1
+            continue
+
+        problems = sorted({problem for names in name_sets for problem in check_proc_source(lines, file_path, names)})
+        for line_number, message in problems:
+            print(f"{file_path}:{line_number}: {message}")
+        if problems:
+            failed += 1
+        else:
+            print(f"{file_path}: OK")
+
+    return 1 if failed else 0
+
+
+def compile_proc_files(file_paths, show=False, use_cache=True):
+
+    # Compiles procedure files for the `compile` command, storing them in the compiled 
+    # procedure cache so that later runs start straight away. 
+    #
+    # Parameters:
+    #    file_paths (list): The procedure files to compile.
+    #    show (bool): Whether to print the generated code of each file.
+    #    use_cache (bool): If False, the files are compiled without reading or writing the cache.
+    #
+    # Returns:
+    #    int: The process exit code, 1 if any file could not be compiled, otherwise 0.
+
+    failed = 0
+    for file_path in file_paths:
+        try:
+            program = compile_proc_file(file_path, use_cache)
+        except Exception as e:
+            print(f"{file_path}: {type(e).__name__}: {e}")
+            failed += 1
+            continue
+
+        if show:
+            print(f"# {file_path}")
+            print(format_proc_program(program))
+        else:
+            print(f"{file_path}: {len(program)} stage{'s' if len(program) != 1 else ''}")
+
+    return 1 if failed else 0
+
+
+def main(argv=None):
+
+    # The main function provides the command line interface to the engine. 
+    #
+    # Commands:
+    #   run <file>      Executes a procedure file, or stdin when the file is "-".
+    #   check <files>   Checks procedure files for problems without running them.
+    #   compile <files> Compiles procedure files into the cache, or prints their generated code.
+    #   batch <files>   Runs procedure files across a pool of worker processes, 
+    #                   writing one JSON result per line.
+    #   daemon          Keeps worker processes running and accepts jobs over a local HTTP API.
+    #
+    # Parameters:
+    # argv (list): The command line arguments. Defaults to sys.argv.
+    #
+    # Returns:
+    # int: The process exit code.
+
+    parser = argparse.ArgumentParser(prog="procbot", description="Runs ProcBot procedure files.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    log_options = argparse.ArgumentParser(add_help=False)
+    log_options.add_argument("--log-level", choices=list(LOG_LEVELS), default="info", help="lowest level of log record written (default: info)")
+    log_options.add_argument("--log-format", choices=["text", "json"], default="text", help="write log records as text or JSON lines (default: text)")
+    log_options.add_argument("--log-file", default=None, help="file to append log records to (default: stdout)")
+    log_options.add_argument("--no-stage-log", dest="stage_log", action="store_false", help="switch off the record of each executed stage")
+
+    archive_options = argparse.ArgumentParser(add_help=False)
+    archive_group = archive_options.add_mutually_exclusive_group()
+    archive_group.add_argument("--record", default=None, metavar="ARCHIVE", help="record every response the browsers and fetches receive to this network archive directory")
+    archive_group.add_argument("--replay", default=None, metavar="ARCHIVE", help="serve every response from this network archive directory, with no network access")
+
+    metrics_options = argparse.ArgumentParser(add_help=False)
+    metrics_options.add_argument("--metrics-port", type=int, default=None, help="serve Prometheus metrics on this localhost port")
+    metrics_options.add_argument("--metrics-file", default=None, help="write Prometheus metrics to this file at exit")
+
+    run_parser = commands.add_parser("run", parents=[log_options, archive_options, metrics_options], help="execute a procedure file")
+    run_parser.add_argument("file", help="the .proc file to execute, or - to read from stdin")
+    run_parser.add_argument("--stream", action="store_true", help="execute each line as it is read instead of compiling the file first")
+    run_parser.add_argument("--element-cache", action="store_true", help="reuse element lookups on the same page and report the cache counters")
+    run_parser.add_argument("--trace", default=None, help="record a timing trace, in Chrome trace format for .json files, otherwise JSON lines")
+    run_parser.add_argument("--checkpoint", default=None, help="record progress to this file, and resume from it if it exists")
+    run_parser.add_argument("--checkpoint-interval", type=float, default=CHECKPOINT_INTERVAL, help=f"minimum seconds between checkpoints (default: {CHECKPOINT_INTERVAL:g})")
+
+    check_parser = commands.add_parser("check", help="check procedure files for problems without running them")
+    check_parser.add_argument("files", nargs="+", help="the .proc files to check")
+    check_parser.add_argument("--vars", dest="variables", default=None, help="JSON lines file of variable sets the files will be run with")
+
+    compile_parser = commands.add_parser("compile", help="compile procedure files into the cache without running them")
+    compile_parser.add_argument("files", nargs="+", help="the .proc files to compile")
+    compile_parser.add_argument("--show", action="store_true", help="print the generated code of each file")
+    compile_parser.add_argument("--no-cache", dest="use_cache", action="store_false", help="compile without reading or writing the cache")
+
+    batch_parser = commands.add_parser("batch", parents=[log_options, archive_options, metrics_options], help="run procedure files across worker processes")
+    batch_parser.add_argument("files", nargs="+", help="the .proc files to execute")
+    batch_parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes (default: CPU count)")
+    batch_parser.add_argument("-t", "--timeout", type=float, default=None, help="maximum seconds per job")
+    batch_parser.add_argument("--vars", dest="variables", default=None, help="JSON lines file of variable sets, each file is run once per set")
+    batch_parser.add_argument("--pool", action="store_true", help="reuse browsers between the jobs each worker runs")
+    batch_parser.add_argument("--warm", action="append", default=[], metavar="BROWSER=COUNT", help="keep COUNT idle browsers warm in each worker, e.g. Chrome=1")
+    batch_parser.add_argument("--max-jobs", type=int, default=50, help="jobs a pooled browser runs before it is recycled")
+    batch_parser.add_argument("--max-memory", type=float, default=None, help="memory in MB above which a pooled browser is recycled")
+    batch_parser.add_argument("-o", "--output", default=None, help="file to write JSON line results to (default: stdout)")
+    batch_parser.add_argument("--checkpoint", default=None, help="record results to this file, and skip jobs it shows have succeeded")
+
+    daemon_parser = commands.add_parser("daemon", parents=[log_options, archive_options, metrics_options], help="keep workers running and accept jobs over a local HTTP API")
+    daemon_parser.add_argument("--port", type=int, default=DAEMON_PORT, help=f"localhost port to listen on (default: {DAEMON_PORT})")
+    daemon_parser.add_argument("--socket", default=None, help="Unix socket to listen on instead of a port")
+    daemon_parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes (default: CPU count)")
+    daemon_parser.add_argument("-t", "--timeout", type=float, default=None, help="default maximum seconds per job")
+    daemon_parser.add_argument("--allow-source", action="store_true", help="accept the text of a procedure as a job's source, not only files on disk")
+    daemon_parser.add_argument("--max-queue", type=int, default=DAEMON_MAX_QUEUE, help=f"queued jobs above which new jobs are refused (default: {DAEMON_MAX_QUEUE})")
+    daemon_parser.add_argument("--pool", action="store_true", help="reuse browsers between the jobs each worker runs")
+    daemon_parser.add_argument("--warm", action="append", default=[], metavar="BROWSER=COUNT", help="keep COUNT idle browsers warm in each worker, e.g. Chrome=1")
+    daemon_parser.add_argument("--max-jobs", type=int, default=50, help="jobs a pooled browser runs before it is recycled")
+    daemon_parser.add_argument("--max-memory", type=float, default=None, help="memory in MB above which a pooled browser is recycled")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "check":
+        return check_proc_files(args.files, load_variable_sets(args.variables) if args.variables else [{}])
+    if args.command == "compile":
+        return compile_proc_files(args.files, args.show, args.use_cache)
+
+    configure_logging(args.log_level, args.log_format, args.log_file, args.stage_log)
+
+    if args.record or args.replay:
+        start_network_archive(args.record or args.replay, "record" if args.record else "replay")
+        atexit.register(stop_network_archive)
+
+    if args.metrics_port is not None or args.metrics_file:
+        configure_metrics(port=args.metrics_port, output=args.metrics_file)
+
+    if args.command == "run":
+        if args.checkpoint and (args.stream or args.file == "-"):
+            parser.error("--checkpoint cannot be used with --stream or stdin")
+        if args.trace:
+            start_trace(args.trace)
+        if args.element_cache:
+            configure_element_cache()
+        try:
+            if args.stream or args.file == "-":
+                exec_proc_from_stream_file(args.file)
+            elif args.checkpoint:
+                exec_proc_with_checkpoint(args.file, args.checkpoint, interval=args.checkpoint_interval)
+            else:
+                exec_proc_from_file(args.file)
+        finally:
+            stop_trace()
+            if args.element_cache:
+                log_entry("info", f"Element cache: {element_cache_stats}")
+        return 0
+
+    browser_pool = None
+    if args.pool or args.warm:
+        warm = {browser: int(count) for browser, count in (option.split("=", 1) for option in args.warm)}
+        browser_pool = {"warm": warm, "max_jobs": args.max_jobs, "max_memory": args.max_memory}
+
+    if args.command == "daemon":
+        daemon = start_proc_daemon(args.workers, browser_pool, args.max_queue, args.timeout, args.allow_source)
+        try:
+            serve_proc_daemon(daemon, args.port, args.socket)
+        finally:
+            stop_proc_daemon(daemon)
+        return 0
+
+    # Builds the batch, one job per file and variable set. 
+    variable_sets = load_variable_sets(args.variables) if args.variables else [{}]
+    jobs = [{"path": path, "variables": variables} for path in args.files for variables in variable_sets]
+    results = run_many(jobs, workers=args.workers, timeout=args.timeout, browser_pool=browser_pool, checkpoint=args.checkpoint)
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for result in results:
+            output.write(json.dumps(result, default=str) + "\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
 
-    # Iterates over each stage. 
-    for stage in execution_stages:
+    return 0 if all(result["status"] == "ok" for result in results) else 1
 
-        # Performs variable parse. 
-        parse_stage = parse_var(stage, variable_dictionary)
-        print(f"Executing: {parse_stage}")
 
-        # Executes stage as code. 
-        exec(stage, globals(), variable_dictionary)
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+# Shared fixtures for the browser engine tests.
+#
+# The engine is a single module in src/, and the fake WebDriver used by the 
+# benchmarks lives in benchmarks/, so both directories are put on the import path.
+
+import os
+import sys
+
+import pytest
+
+ROOT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT_DIRECTORY, "src"))
+sys.path.insert(0, os.path.join(ROOT_DIRECTORY, "benchmarks"))
+
+import browser_engine  # noqa: E402
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+
+    # Returns the engine module with its compiled procedure cache moved to a 
+    # temporary directory, and its in-memory caches and variables emptied.
+    monkeypatch.setattr(browser_engine, "proc_cache_directory", str(tmp_path / "cache"))
+    monkeypatch.setattr(browser_engine, "compiled_programs", {})
+    monkeypatch.setattr(browser_engine, "checked_programs", {})
+    monkeypatch.setattr(browser_engine, "variable_dictionary", {})
+    return browser_engine
+
+
+@pytest.fixture
+def fixture_site():
+
+    # Serves the benchmark fixture site on a local port for the test, returning its base URL.
+    from fixture_site import start_fixture_server
+    server, base_url = start_fixture_server()
+    yield base_url
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def fake_browser(engine, monkeypatch):
+
+    # Makes `start Fake` launch the fake WebDriver, returning the list of drivers launched.
+    from fake_webdriver import FakeWebDriver
+    drivers = []
+
+    def launch():
+        drivers.append(FakeWebDriver())
+        return drivers[-1]
+
+    monkeypatch.setitem(engine.driver_factories, "Fake", launch)
+    monkeypatch.setattr(engine, "active_browsers", [])
+    return drivers
+
+
+@pytest.fixture
+def write_proc(tmp_path):
+
+    # Returns a function writing a procedure file from lines and returning its path.
+    def write(lines, name="test.proc"):
+        path = tmp_path / name
+        path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        return str(path)
+    return write
+
+
+@pytest.fixture(autouse=True)
+def stop_log_writer():
+
+    # Stops the background log writer after each test, as it keeps a reference to 
+    # the stdout that pytest captured for the test.
+    yield
+    if browser_engine.log_settings["thread"] is not None:
+        browser_engine.stop_log_writer()
@@ -0,0 +1,120 @@
+# Tests for the browser pool, see acquire_web_driver and release_web_driver.
+
+import time
+
+import pytest
+
+from fake_webdriver import FakeWebDriver
+
+
+class PagelessDriver(FakeWebDriver):
+
+    # A fake driver which records the pages it is sent to without fetching them. 
+
+    def get(self, url):
+        self.current_url = url
+
+
+class ChromiumDriver(PagelessDriver):
+
+    # A fake driver which records the DevTools commands it is sent, as Chrome and Edge take. 
+
+    def __init__(self):
+        super().__init__()
+        self.cdp_commands = []
+
+    def execute_cdp_cmd(self, command, parameters):
+        self.cdp_commands.append((command, parameters))
+        return {}
+
+
+@pytest.fixture
+def pool(engine, monkeypatch):
+
+    # Enables the pool with one warm browser of each fake kind, and closes it afterwards.
+    launch_delay = {"seconds": 0}
+
+    def launcher(driver_class):
+        def launch():
+            time.sleep(launch_delay["seconds"])
+            return driver_class()
+        return launch
+
+    monkeypatch.setitem(engine.driver_factories, "Chromium", launcher(ChromiumDriver))
+    monkeypatch.setitem(engine.driver_factories, "Pageless", launcher(PagelessDriver))
+    engine.configure_browser_pool(warm={"Chromium": 1, "Pageless": 1})
+    yield launch_delay
+    engine.close_browser_pool()
+    engine.browser_pool_idle.clear()
+    engine.browser_pool_entries.clear()
+
+
+def idle_drivers(engine, browser):
+    return engine.browser_pool_idle.get(engine.get_browser_pool_key(browser, None), [])
+
+
+def wait_for_idle(engine, browser, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not idle_drivers(engine, browser) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return idle_drivers(engine, browser)
+
+
+def test_chromium_reset_clears_every_origin(engine, pool):
+    driver = engine.acquire_web_driver("Chromium")
+    engine.browser_load(driver, "https://lorem.ipsum/a")
+    engine.browser_load(driver, "http://dolor.sit:8080/b")
+    engine.release_web_driver(driver)
+
+    assert idle_drivers(engine, "Chromium") == [driver]
+    assert ("Network.clearBrowserCookies", {}) in driver.cdp_commands
+    cleared = [parameters["origin"] for command, parameters in driver.cdp_commands if command == "Storage.clearDataForOrigin"]
+    assert cleared == ["http://dolor.sit:8080", "https://lorem.ipsum"]
+    assert driver.current_url == "about:blank"
+
+
+def test_single_origin_browser_is_reused(engine, pool):
+    driver = engine.acquire_web_driver("Pageless")
+    engine.browser_load(driver, "https://lorem.ipsum/a")
+    engine.browser_load(driver, "https://lorem.ipsum/b")
+    driver.cookies["session"] = "1"
+    engine.release_web_driver(driver)
+
+    assert idle_drivers(engine, "Pageless") == [driver]
+    assert driver.cookies == {}
+
+
+def test_multiple_origin_browser_is_recycled(engine, pool):
+    driver = engine.acquire_web_driver("Pageless")
+    engine.browser_load(driver, "https://lorem.ipsum/a")
+    engine.browser_load(driver, "https://dolor.sit/b")
+    engine.release_web_driver(driver)
+
+    replacement = wait_for_idle(engine, "Pageless")
+    assert len(replacement) == 1 and replacement[0] is not driver
+    assert driver not in engine.browser_origins
+
+
+def test_release_does_not_wait_for_refill(engine, pool):
+    driver = engine.acquire_web_driver("Pageless")
+    engine.browser_load(driver, "https://lorem.ipsum/a")
+    engine.browser_load(driver, "https://dolor.sit/b")
+    pool["seconds"] = 0.5
+
+    start_time = time.perf_counter()
+    engine.release_web_driver(driver)
+    assert time.perf_counter() - start_time < 0.25
+    assert idle_drivers(engine, "Pageless") == []
+    assert len(wait_for_idle(engine, "Pageless")) == 1
+
+
+def test_close_stops_browser_being_launched(engine, pool):
+    driver = engine.acquire_web_driver("Pageless")
+    engine.browser_load(driver, "https://lorem.ipsum/a")
+    engine.browser_load(driver, "https://dolor.sit/b")
+    pool["seconds"] = 0.2
+    engine.release_web_driver(driver)
+    engine.close_browser_pool()
+
+    assert idle_drivers(engine, "Pageless") == []
+    assert engine.browser_pool_fillers == []
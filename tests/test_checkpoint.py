@@ -0,0 +1,121 @@
+# Tests for resuming procedures from a checkpoint, see exec_proc_with_checkpoint.
+
+import json
+import os
+
+import pytest
+
+
+@pytest.fixture
+def waits(engine, monkeypatch):
+
+    # Replaces process_wait with a recorder, which fails once for each value in `fail`.
+    record = {"calls": [], "fail": set()}
+
+    def process_wait(seconds):
+        record["calls"].append(str(seconds))
+        if str(seconds) in record["fail"]:
+            record["fail"].discard(str(seconds))
+            raise RuntimeError(f"wait {seconds} failed")
+
+    monkeypatch.setattr(engine, "process_wait", process_wait)
+    monkeypatch.setattr(engine, "variable_dictionary", {})
+    return record
+
+
+def test_resumes_after_failed_stage(engine, waits, write_proc, tmp_path):
+    path = write_proc(['var lorem "ipsum"', "wait 1", "wait 2", 'var dolor "sit"', "wait 3"])
+    checkpoint = str(tmp_path / "test.checkpoint.json")
+    waits["fail"].add("2")
+
+    with pytest.raises(RuntimeError, match="wait 2 failed"):
+        engine.exec_proc_with_checkpoint(path, checkpoint, interval=0)
+    with open(checkpoint) as file:
+        state = json.load(file)
+    assert state["stage"] == 2
+    assert state["variables"] == {"lorem": "ipsum"}
+    assert state["engine"] == engine.get_engine_fingerprint()
+
+    engine.variable_dictionary.clear()
+    engine.exec_proc_with_checkpoint(path, checkpoint, interval=0)
+    assert waits["calls"] == ["1", "2", "2", "3"]
+    assert engine.variable_dictionary == {"lorem": "ipsum", "dolor": "sit"}
+    assert not os.path.exists(checkpoint)
+
+
+def test_changed_procedure_starts_again(engine, waits, write_proc, tmp_path):
+    path = write_proc(["wait 1", "wait 2"])
+    checkpoint = str(tmp_path / "test.checkpoint.json")
+    waits["fail"].add("2")
+    with pytest.raises(RuntimeError):
+        engine.exec_proc_with_checkpoint(path, checkpoint, interval=0)
+
+    path = write_proc(["wait 1", "wait 2", "wait 3"])
+    engine.exec_proc_with_checkpoint(path, checkpoint, interval=0)
+    assert waits["calls"] == ["1", "2", "1", "2", "3"]
+
+
+def test_changed_engine_starts_again(engine, waits, write_proc, tmp_path, monkeypatch):
+    path = write_proc(["wait 1", "wait 2"])
+    checkpoint = str(tmp_path / "test.checkpoint.json")
+    waits["fail"].add("2")
+    with pytest.raises(RuntimeError):
+        engine.exec_proc_with_checkpoint(path, checkpoint, interval=0)
+
+    monkeypatch.setitem(engine.engine_fingerprint, "value", f"{engine.ENGINE_VERSION}-000000000000")
+    engine.exec_proc_with_checkpoint(path, checkpoint, interval=0)
+    assert waits["calls"] == ["1", "2", "1", "2"]
+
+
+def test_foreach_skips_completed_rows(engine, waits, write_proc, tmp_path):
+    inputs = tmp_path / "inputs.csv"
+    inputs.write_text("n\n1\n2\n3\n", encoding="utf-8")
+    path = write_proc([f'foreach row in "{inputs}"', "    wait [var]row.n", "end", "wait 4"])
+    checkpoint = str(tmp_path / "test.checkpoint.json")
+    waits["fail"].add("2")
+
+    with pytest.raises(RuntimeError):
+        engine.exec_proc_with_checkpoint(path, checkpoint)
+    assert waits["calls"] == ["1", "2", "3"]
+
+    engine.exec_proc_with_checkpoint(path, checkpoint)
+    assert waits["calls"] == ["1", "2", "3", "2", "4"]
+    assert not os.path.exists(checkpoint)
+
+
+def test_batch_skips_completed_jobs(engine, tmp_path):
+    inputs = tmp_path / "inputs.csv"
+    jobs = [{"path": "first.proc", "source": 'var lorem "ipsum"\n'}, 
+            {"path": "second.proc", "source": f'foreach row in "{inputs}"\n    var dolor [var]row.n\nend\n'}]
+    checkpoint = str(tmp_path / "batch.checkpoint.jsonl")
+
+    first_run = engine.run_many(jobs, workers=1, checkpoint=checkpoint)
+    assert [result["status"] for result in first_run] == ["ok", "error"]
+
+    inputs.write_text("n\n1\n", encoding="utf-8")
+    second_run = engine.run_many(jobs, workers=1, checkpoint=checkpoint)
+    assert [result["status"] for result in second_run] == ["ok", "ok"]
+    assert second_run[0]["duration"] == first_run[0]["duration"]
+    assert not os.path.exists(checkpoint)
+
+
+def test_batch_resumes_after_truncated_line(engine, tmp_path):
+    jobs = [{"path": "first.proc", "source": 'var lorem "ipsum"\n'}, {"path": "second.proc", "source": 'var dolor "sit"\n'}]
+    checkpoint = tmp_path / "batch.checkpoint.jsonl"
+    completed = {"job": 0, "path": "first.proc", "status": "ok", "error": None, "duration": 12.5, "variables": {}, "variables_in": {}}
+    checkpoint.write_text(json.dumps(completed) + '\n{"job": 1, "path": "second.pr', encoding="utf-8")
+
+    results = engine.run_many(jobs, workers=1, checkpoint=str(checkpoint))
+    assert [result["status"] for result in results] == ["ok", "ok"]
+    assert results[0]["duration"] == 12.5
+    assert not checkpoint.exists()
+
+
+def test_batch_checkpoint_with_unserialisable_variables(engine, tmp_path):
+    inputs = tmp_path / "inputs.csv"
+    jobs = [{"path": "loop.proc", "source": f'foreach row in "{inputs}"\n    var dolor [var]row.n\nend\n', "variables": {"ids": {1, 2}}}]
+    checkpoint = tmp_path / "batch.checkpoint.jsonl"
+
+    results = engine.run_many(jobs, workers=1, checkpoint=str(checkpoint))
+    assert results[0]["status"] == "error"
+    assert json.loads(checkpoint.read_text().splitlines()[0])["variables_in"] == {"ids": "{1, 2}"}
@@ -0,0 +1,98 @@
+# Tests for the compiled procedure cache, see compile_proc_file.
+
+import os
+
+PROCEDURE = [
+    'var target_uri "https://lorem.ipsum/"',
+    "start Chrome",
+    "goto [var]target_uri",
+    "quit",
+]
+
+
+def cache_files(engine):
+    return sorted(os.listdir(engine.proc_cache_directory))
+
+
+def test_round_trip(engine, write_proc):
+    path = write_proc(PROCEDURE)
+    program = engine.compile_proc_file(path)
+    assert len(cache_files(engine)) == 1
+
+    engine.compiled_programs.clear()
+    cache_path = os.path.join(engine.proc_cache_directory, cache_files(engine)[0])
+    assert engine.load_compiled_proc(cache_path) == program
+    assert engine.compile_proc_file(path) == program
+    assert program == engine.compile_proc_file(path, use_cache=False)
+
+
+def test_changed_source_is_recompiled(engine, write_proc):
+    path = write_proc(PROCEDURE)
+    first = engine.compile_proc_file(path)
+    path = write_proc(PROCEDURE[:-1] + ['goto "https://dolor.sit/"', "quit"])
+    second = engine.compile_proc_file(path)
+    assert first != second
+    assert len(cache_files(engine)) == 2
+
+
+def test_changed_engine_is_recompiled(engine, write_proc, monkeypatch):
+    path = write_proc(PROCEDURE)
+    engine.compile_proc_file(path)
+    first_files = cache_files(engine)
+
+    # A changed engine source gives a new fingerprint, even with the same ENGINE_VERSION. 
+    monkeypatch.setitem(engine.engine_fingerprint, "value", f"{engine.ENGINE_VERSION}-000000000000")
+    engine.compiled_programs.clear()
+    engine.compile_proc_file(path)
+    assert len(cache_files(engine)) == 2
+    assert first_files[0] in cache_files(engine)
+
+
+def test_fingerprint_includes_version_and_source(engine):
+    fingerprint = engine.get_engine_fingerprint()
+    version, source_digest = fingerprint.rsplit("-", 1)
+    assert version == engine.ENGINE_VERSION
+    assert len(source_digest) == 12
+
+
+def test_unreadable_cache_is_ignored(engine, write_proc):
+    path = write_proc(PROCEDURE)
+    program = engine.compile_proc_file(path)
+    cache_path = os.path.join(engine.proc_cache_directory, cache_files(engine)[0])
+    with open(cache_path, "wb") as file:
+        file.write(b"\x00corrupt")
+
+    assert engine.load_compiled_proc(cache_path) is None
+    engine.compiled_programs.clear()
+    assert engine.compile_proc_file(path) == program
+
+
+def test_same_content_at_another_path(engine, write_proc):
+    first_path = write_proc(PROCEDURE, "first.proc")
+    second_path = write_proc(PROCEDURE, "second.proc")
+    first = engine.compile_proc_file(first_path)
+    engine.compiled_programs.clear()
+    second = engine.compile_proc_file(second_path)
+
+    assert len(cache_files(engine)) == 1
+    assert {stage[3].co_filename for stage in first} == {first_path}
+    assert {stage[3].co_filename for stage in second} == {second_path}
+    assert [stage[3].co_firstlineno for stage in second] == [stage[3].co_firstlineno for stage in first]
+    assert {stage[3].co_filename for stage in engine.compile_proc_file(first_path)} == {first_path}
+
+
+def test_foreach_and_parallel_code_renamed(engine, write_proc, tmp_path):
+    lines = [f'foreach row in "{tmp_path / "rows.csv"}"', '    var lorem [var]row.n', "end", 
+             "parallel", "branch one", '    var dolor "sit"', "end"]
+    engine.compile_proc_file(write_proc(lines, "first.proc"))
+    engine.compiled_programs.clear()
+    second_path = write_proc(lines, "second.proc")
+    program = engine.compile_proc_file(second_path)
+
+    def code_files(value):
+        if hasattr(value, "co_filename"):
+            return {value.co_filename}
+        if isinstance(value, tuple):
+            return set().union(*(code_files(item) for item in value))
+        return set()
+    assert code_files(program) == {second_path}
@@ -0,0 +1,180 @@
+# Tests for the daemon and its HTTP API, see start_proc_daemon and serve_proc_daemon.
+
+import http.client
+import json
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+
+@pytest.fixture
+def daemon(engine):
+
+    # Returns a function starting a daemon, which is stopped after the test.
+    daemons = []
+
+    def start(**options):
+        daemons.append(engine.start_proc_daemon(**dict({"workers": 1}, **options)))
+        return daemons[-1]
+
+    yield start
+    for started in daemons:
+        engine.stop_proc_daemon(started)
+
+
+@pytest.fixture
+def serve(engine):
+
+    # Returns a function serving a daemon's HTTP API on a free localhost port, and
+    # returning a function which sends a request and returns the status and JSON body.
+    servers = []
+
+    def start(started):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), engine.get_daemon_request_handler())
+        server.daemon = started
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+
+        def request(method, path, body=None, headers=None):
+            headers = dict({"Content-Type": "application/json"} if body is not None else {}, **(headers or {}))
+            connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=30)
+            connection.putrequest(method, path, skip_host="Host" in headers)
+            data = (body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")) if body is not None else b""
+            for name, value in dict(headers, **{"Content-Length": str(len(data))}).items():
+                connection.putheader(name, value)
+            connection.endheaders(data)
+            response = connection.getresponse()
+            content = json.loads(response.read())
+            connection.close()
+            return response.status, content
+        return request
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_job_runs_and_returns_its_result(daemon, serve, write_proc):
+    request = serve(daemon())
+    path = write_proc(['var lorem "ipsum"'])
+    status, record = request("POST", "/jobs", {"path": path, "wait": 30})
+    assert status == 200
+    assert record["status"] == "ok"
+    assert record["result"]["variables"] == {"lorem": "ipsum"}
+
+    status, fetched = request("GET", f"/jobs/{record['id']}")
+    assert status == 200 and fetched["status"] == "ok"
+    status, counts = request("GET", "/status")
+    assert status == 200 and counts["jobs"]["ok"] == 1
+
+
+def test_queued_job_is_accepted(daemon, serve, write_proc):
+    request = serve(daemon())
+    status, record = request("POST", "/jobs", {"path": write_proc(["wait 0.1"])})
+    assert status == 202
+    assert record["status"] in ("queued", "running")
+    status, record = request("GET", f"/jobs/{record['id']}?wait=30")
+    assert status == 200 and record["status"] == "ok"
+
+
+def test_unknown_job_and_path(daemon, serve):
+    request = serve(daemon())
+    assert request("GET", "/jobs/0123456789abcdef")[0] == 404
+    assert request("DELETE", "/jobs/0123456789abcdef")[0] == 404
+    assert request("GET", "/lorem")[0] == 404
+    assert request("POST", "/lorem", {"path": "lorem.proc"})[0] == 404
+
+
+def test_failing_preflight_is_refused(daemon, serve, write_proc):
+    request = serve(daemon())
+    status, content = request("POST", "/jobs", {"path": write_proc(["goto"])})
+    assert status == 422
+    assert "goto" in content["error"]
+    assert request("POST", "/jobs", {"variables": {}})[0] == 422
+
+
+def test_full_queue_is_refused(daemon, serve, write_proc):
+    started = daemon(max_queue=0)
+    request = serve(started)
+    status, content = request("POST", "/jobs", {"path": write_proc(['var lorem "ipsum"'])})
+    assert status == 503
+    assert "queue is full" in content["error"]
+    assert started["counts"]["refused"] == 1
+
+
+def test_higher_priority_runs_first(engine, daemon, write_proc):
+    started = daemon()
+    blocking = engine.submit_daemon_job(started, write_proc(["wait 0.5"], "blocking.proc"))
+    low = engine.submit_daemon_job(started, write_proc(['var lorem "low"'], "low.proc"), priority=0)
+    high = engine.submit_daemon_job(started, write_proc(['var lorem "high"'], "high.proc"), priority=5)
+    records = [engine.get_daemon_job(started, job["id"], 30) for job in (blocking, low, high)]
+    assert [record["status"] for record in records] == ["ok", "ok", "ok"]
+    assert records[2]["started"] < records[1]["started"]
+
+
+def test_queued_job_can_be_cancelled(engine, daemon, write_proc):
+    started = daemon()
+    blocking = engine.submit_daemon_job(started, write_proc(["wait 0.5"], "blocking.proc"))
+    queued = engine.submit_daemon_job(started, write_proc(['var lorem "ipsum"']))
+    assert engine.cancel_daemon_job(started, queued["id"])["status"] == "cancelled"
+    assert engine.get_daemon_job(started, blocking["id"], 30)["status"] == "ok"
+
+
+def test_plain_text_post_is_refused(daemon, serve, write_proc):
+    request = serve(daemon())
+    body = json.dumps({"path": write_proc(['var lorem "ipsum"'])}).encode("utf-8")
+    status, content = request("POST", "/jobs", body, {"Content-Type": "text/plain"})
+    assert status == 415
+    status, content = request("POST", "/jobs", body, {"Content-Type": "application/x-www-form-urlencoded"})
+    assert status == 415
+
+
+def test_cross_origin_request_is_refused(daemon, serve, write_proc):
+    started = daemon()
+    request = serve(started)
+    path = write_proc(['var lorem "ipsum"'])
+    assert request("POST", "/jobs", {"path": path}, {"Origin": "https://lorem.ipsum"})[0] == 403
+    assert request("GET", "/status", headers={"Origin": "null"})[0] == 403
+    assert started["counts"]["submitted"] == 0
+
+
+@pytest.mark.parametrize("host", ["lorem.ipsum", "lorem.ipsum:8765", "127.0.0.1.lorem.ipsum"])
+def test_foreign_host_is_refused(daemon, serve, host):
+    request = serve(daemon())
+    assert request("GET", "/status", headers={"Host": host})[0] == 403
+
+
+@pytest.mark.parametrize("host", ["localhost", "localhost:8765", "127.0.0.1:8765", "[::1]:8765"])
+def test_loopback_host_is_accepted(daemon, serve, host):
+    request = serve(daemon())
+    assert request("GET", "/status", headers={"Host": host})[0] == 200
+
+
+def test_source_needs_opt_in(engine, daemon, serve):
+    request = serve(daemon())
+    status, content = request("POST", "/jobs", {"source": 'var lorem "ipsum"\n'})
+    assert status == 403
+    assert "--allow-source" in content["error"]
+
+    request = serve(daemon(allow_source=True))
+    status, record = request("POST", "/jobs", {"source": 'var lorem "ipsum"\n', "wait": 30})
+    assert status == 200
+    assert record["result"]["variables"] == {"lorem": "ipsum"}
+
+
+@pytest.mark.parametrize("line", [
+    "var lorem __import__('os').system('true')",
+    "var lorem os.system('true')",
+    "var lorem eval('1')",
+    "var lorem open('/etc/passwd').read()",
+    "var lorem ().__class__.__bases__",
+])
+def test_unsafe_names_fail_preflight(daemon, serve, line):
+    started = daemon(allow_source=True)
+    request = serve(started)
+    status, content = request("POST", "/jobs", {"source": line + "\n"})
+    assert status == 422
+    assert "which procedures may not use" in content["error"]
+    assert started["counts"]["submitted"] == 0
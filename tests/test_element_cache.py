@@ -0,0 +1,54 @@
+# Tests for the element cache, see configure_element_cache.
+
+import pytest
+
+from fake_webdriver import FakeWebDriver
+from fixture_site import start_fixture_server
+
+
+@pytest.fixture
+def driver(engine, monkeypatch):
+
+    # Returns a fake driver on the first page of the fixture site, with the element cache enabled.
+    monkeypatch.setattr(engine, "element_cache_settings", {"enabled": True})
+    monkeypatch.setattr(engine, "element_cache_stats", {"hits": 0, "misses": 0, "stale": 0, "invalidations": 0})
+    monkeypatch.setattr(engine, "element_cache", {})
+    server, base_url = start_fixture_server()
+    driver = FakeWebDriver()
+    engine.browser_load(driver, f"{base_url}/page/1")
+    yield driver
+    server.shutdown()
+    server.server_close()
+
+
+def test_repeated_lookup_is_a_hit(engine, driver):
+    first = engine.get_element_by_id(driver, "search_form")
+    assert engine.get_element_by_id(driver, "search_form") is first
+    assert engine.element_cache_stats["hits"] == 1
+    assert engine.element_cache_stats["misses"] == 1
+
+
+def test_batch_counts_each_miss_once(engine, driver):
+    elements = engine.get_elements_batch(driver, (("gi", "search_form"), ("gc", "next"), ("gi", "missing")))
+    assert elements[0] is not None and elements[1] is not None and elements[2] is None
+    assert engine.element_cache_stats["misses"] == 3
+    assert engine.element_cache_stats["hits"] == 0
+
+    engine.get_elements_batch(driver, (("gi", "search_form"), ("gc", "next"), ("gi", "missing")))
+    assert engine.element_cache_stats["hits"] == 2
+    assert engine.element_cache_stats["misses"] == 4
+
+
+@pytest.mark.parametrize("wait", [
+    lambda engine, driver: engine.wait_for_url(driver, "/page/2", 1),
+    lambda engine, driver: engine.wait_for_title(driver, "", 1),
+    lambda engine, driver: engine.wait_for_page_ready(driver, 1),
+])
+def test_waitfor_clears_cache(engine, driver, wait):
+    engine.get_element_by_id(driver, "next").click()
+    engine.get_element_by_id(driver, "next")
+    assert driver in engine.element_cache
+
+    wait(engine, driver)
+    assert driver not in engine.element_cache
+    assert engine.get_element_by_id(driver, "search_form").attributes["action"] == "/page/3"
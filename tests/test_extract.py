@@ -0,0 +1,43 @@
+# Tests for the extract command, see extract_rows.
+
+import csv
+import json
+
+from fake_webdriver import FakeWebDriver
+
+
+def extract(engine, fixture_site, sink, options=""):
+    engine.exec_proc_from_source("\n".join([
+        "start Fake",
+        f'goto "{fixture_site}/page/1"',
+        f'extract ".row" "{sink}" name=".name" price=".price" link=".link@href" {options}',
+        "quit",
+    ]) + "\n")
+
+
+def test_csv_fields_and_attributes(engine, fake_browser, fixture_site, tmp_path):
+    sink = tmp_path / "items.csv"
+    extract(engine, fixture_site, sink)
+    with open(sink, newline="") as file:
+        rows = list(csv.DictReader(file))
+    assert len(rows) == 50
+    assert rows[0] == {"name": "Item 1-0", "price": "0.99", "link": "/page/0"}
+    assert rows[-1]["name"] == "Item 1-49"
+
+
+def test_jsonl_follows_next_pages(engine, fake_browser, fixture_site, tmp_path):
+    sink = tmp_path / "items.jsonl"
+    extract(engine, fixture_site, sink, 'next="#next" pages=3')
+    rows = [json.loads(line) for line in sink.read_text().splitlines()]
+    assert len(rows) == 150
+    assert [rows[index]["name"] for index in (0, 50, 100)] == ["Item 1-0", "Item 2-0", "Item 3-0"]
+    assert fake_browser[0].current_url == f"{fixture_site}/page/3"
+
+
+def test_one_script_call_per_page(engine, fake_browser, fixture_site, tmp_path, monkeypatch):
+    calls = []
+    execute_script = FakeWebDriver.execute_script
+    monkeypatch.setattr(FakeWebDriver, "execute_script", lambda self, script, *args: calls.append(script) or execute_script(self, script, *args))
+
+    extract(engine, fixture_site, tmp_path / "items.csv", 'next="#next" pages=2')
+    assert calls.count(engine.EXTRACT_SCRIPT) == 2
@@ -0,0 +1,87 @@
+# Tests for the fetch command, see fetch_urls.
+
+import json
+import time
+import urllib.parse
+
+import pytest
+
+from fake_webdriver import FakeWebDriver
+
+
+@pytest.fixture
+def fetch(engine, fixture_site):
+
+    # Returns the fixture site's base URL, closing the pooled fetch connections afterwards.
+    yield fixture_site
+    engine.close_fetch_connections()
+
+
+@pytest.mark.parametrize("cookie, url, matches", [
+    ({"name": "a", "value": "1"}, "http://lorem.ipsum/", True),
+    ({"name": "a", "value": "1", "domain": ".lorem.ipsum"}, "http://shop.lorem.ipsum/", True),
+    ({"name": "a", "value": "1", "domain": "lorem.ipsum"}, "http://notlorem.ipsum/", False),
+    ({"name": "a", "value": "1", "domain": "shop.lorem.ipsum"}, "http://lorem.ipsum/", False),
+    ({"name": "a", "value": "1", "path": "/basket"}, "http://lorem.ipsum/basket/items", True),
+    ({"name": "a", "value": "1", "path": "/basket"}, "http://lorem.ipsum/basketball", False),
+    ({"name": "a", "value": "1", "secure": True}, "http://lorem.ipsum/", False),
+    ({"name": "a", "value": "1", "secure": True}, "https://lorem.ipsum/", True),
+])
+def test_cookie_matching(engine, cookie, url, matches):
+    cookie = dict(cookie, domain=cookie.get("domain", "lorem.ipsum"))
+    assert engine.cookie_matches_url(cookie, urllib.parse.urlsplit(url)) is matches
+
+
+def test_sends_browser_cookies_and_user_agent(engine, fetch):
+    driver = FakeWebDriver()
+    driver.get_cookies = lambda: [{"name": "session", "value": "lorem", "domain": "127.0.0.1"}, 
+                                  {"name": "other", "value": "ipsum", "domain": "dolor.sit"}]
+    headers = json.loads(engine.fetch_url(driver, f"{fetch}/headers"))
+    assert headers["Cookie"] == "session=lorem"
+    assert headers["User-Agent"] == "FakeWebDriver/1.0"
+
+
+def test_follows_redirects(engine, fetch):
+    assert json.loads(engine.fetch_url(None, f"{fetch}/redirect?to=/data/3.json"))["id"] == 3
+
+    # A POST answered with a 302 or 303 is followed with a GET. 
+    body = engine.fetch_url(None, f"{fetch}/redirect?to=/data/4.json&status=303", "POST", "a=1")
+    assert json.loads(body)["id"] == 4
+
+
+def test_too_many_redirects(engine, fetch):
+    assert engine.fetch_url(None, f"{fetch}/loop") is None
+
+
+def test_decodes_gzip(engine, fetch):
+    assert engine.fetch_url(None, f"{fetch}/data/2.json?gzip=1") == engine.fetch_url(None, f"{fetch}/data/2.json")
+    assert json.loads(engine.fetch_url(None, f"{fetch}/data/2.json?gzip=1"))["id"] == 2
+
+
+def test_post_body(engine, fetch):
+    assert engine.fetch_url(None, f"{fetch}/echo", "POST", '{"lorem": 1}', "application/json") == '{"lorem": 1}'
+
+
+def test_concurrent_fetches(engine, fetch):
+    urls = [f"{fetch}/data/{number}.json?delay=0.3" for number in range(4)]
+    start_time = time.perf_counter()
+    bodies = engine.fetch_urls(None, tuple((url, "GET", None, None, 5) for url in urls))
+    assert time.perf_counter() - start_time < 0.9
+    assert [json.loads(body)["id"] for body in bodies] == [0, 1, 2, 3]
+
+
+def test_fetch_lines_in_procedure(engine, fetch, fake_browser):
+
+    # Consecutive fetches which do not depend on one another are sent together. 
+    start_time = time.perf_counter()
+    engine.exec_proc_from_source("\n".join([
+        "start Fake",
+        f'fetch [var]first "{fetch}/data/1.json?delay=0.3"',
+        f'fetch [var]second "{fetch}/data/2.json?delay=0.3"',
+        f'fetch [var]posted "{fetch}/echo" json=\'{{"n": 3}}\'',
+        "quit",
+    ]) + "\n")
+    assert time.perf_counter() - start_time < 0.55
+    assert json.loads(engine.variable_dictionary["first"])["id"] == 1
+    assert json.loads(engine.variable_dictionary["second"])["id"] == 2
+    assert engine.variable_dictionary["posted"] == '{"n": 3}'
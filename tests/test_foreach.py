@@ -0,0 +1,57 @@
+# Tests for foreach loops, see exec_foreach_block.
+
+import json
+
+import pytest
+
+
+@pytest.fixture
+def waits(engine, monkeypatch):
+
+    # Replaces process_wait with a recorder, which fails for the value "fail".
+    calls = []
+
+    def process_wait(seconds):
+        calls.append(seconds)
+        if seconds == "fail":
+            raise RuntimeError("row failed")
+
+    monkeypatch.setattr(engine, "process_wait", process_wait)
+    return calls
+
+
+def test_csv_rows_and_columns(engine, waits, tmp_path):
+    inputs = tmp_path / "inputs.csv"
+    inputs.write_text("query,page\nlorem,1\nipsum,2\n", encoding="utf-8")
+    engine.exec_proc_from_source(f'foreach row in "{inputs}"\n    wait [var]row.query\n    var last [var]row\nend\n')
+    assert waits == ["lorem", "ipsum"]
+    assert engine.variable_dictionary["last"] == {"query": "ipsum", "page": "2"}
+
+
+def test_jsonl_rows_with_results(engine, waits, tmp_path):
+    inputs = tmp_path / "inputs.jsonl"
+    inputs.write_text('{"n": 1}\n\n{"n": "fail"}\n{"n": 3}\n', encoding="utf-8")
+    results = tmp_path / "results.jsonl"
+    engine.exec_proc_from_source(f'foreach row in "{inputs}" results="{results}"\n    wait [var]row.n\n    var seen [var]row.n\nend\n')
+
+    assert waits == [1, "fail", 3]
+    records = [json.loads(line) for line in results.read_text().splitlines()]
+    assert [(record["row"], record["status"]) for record in records] == [(0, "ok"), (1, "error"), (2, "ok")]
+    assert records[1]["error"] == "RuntimeError: row failed"
+    assert records[2]["input"] == {"n": 3}
+    assert records[2]["variables"]["seen"] == 3
+
+
+def test_failed_rows_raise_without_results(engine, waits, tmp_path):
+    inputs = tmp_path / "inputs.csv"
+    inputs.write_text("n\nfail\n2\n", encoding="utf-8")
+    with pytest.raises(RuntimeError, match="foreach row failed on 1 rows"):
+        engine.exec_proc_from_source(f'foreach row in "{inputs}"\n    wait [var]row.n\nend\n')
+    assert waits == ["fail", "2"]
+
+
+def test_source_from_variable(engine, waits, tmp_path):
+    inputs = tmp_path / "inputs.csv"
+    inputs.write_text("n\n1\n", encoding="utf-8")
+    engine.exec_proc_from_source("foreach row in [var]inputs\n    wait [var]row.n\nend\n", {"inputs": str(inputs)})
+    assert waits == ["1"]
@@ -0,0 +1,119 @@
+# Tests for the metrics registry, see configure_metrics.
+
+import re
+import urllib.request
+
+import pytest
+
+
+@pytest.fixture
+def metrics(engine, fake_browser, fixture_site, monkeypatch):
+
+    # Turns the metrics on with empty counters, returning the fixture site's base URL, and
+    # turns them off afterwards, restoring the engine functions.
+    monkeypatch.setattr(engine, "metrics_settings", {"enabled": False, "server": None, "output": None, "originals": {}})
+    monkeypatch.setattr(engine, "metric_counters", {})
+    monkeypatch.setattr(engine, "metric_gauges", {})
+    monkeypatch.setattr(engine, "metric_histograms", {})
+    monkeypatch.setattr(engine, "element_cache_stats", {"hits": 0, "misses": 0, "stale": 0, "invalidations": 0})
+    engine.configure_metrics()
+    yield fixture_site
+    engine.configure_metrics(False)
+
+
+def run_procedure(engine, base_url):
+
+    # Runs a procedure which starts a browser, loads a page and looks up two elements,
+    # one of which is missing. The two lookups run as one batch.
+    engine.exec_proc_from_source("\n".join([
+        "start Fake",
+        f'goto "{base_url}/page/1"',
+        'gi [var]form "search_form"',
+        'gi [var]missing "lorem_ipsum"',
+    ]) + "\n")
+
+
+def parse_samples(text):
+
+    # Returns the samples of a Prometheus text exposition, keyed by name and labels.
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            series, value = line.rsplit(" ", 1)
+            samples[series] = float(value)
+    return samples
+
+
+def test_functions_are_restored_when_switched_off(engine, metrics):
+    assert engine.browser_load.__wrapped__ is engine.metrics_settings["originals"]["browser_load"]
+    engine.configure_metrics(False)
+    assert not hasattr(engine.browser_load, "__wrapped__")
+    assert engine.metrics_settings["originals"] == {}
+
+
+def test_help_and_type_lines(engine, metrics):
+    run_procedure(engine, metrics)
+    text = engine.format_metrics()
+    names = re.findall(r"^# TYPE (\S+) (\S+)$", text, re.MULTILINE)
+    assert ("procbot_call_duration_seconds", "histogram") in names
+    assert ("procbot_stage_duration_seconds", "histogram") in names
+    assert ("procbot_element_lookups_total", "counter") in names
+    assert ("procbot_browsers_live", "gauge") in names
+
+    # Every series follows the HELP and TYPE lines of its metric.
+    lines = text.splitlines()
+    for index, line in enumerate(lines):
+        if line.startswith("# TYPE "):
+            name = line.split()[2]
+            assert lines[index - 1].startswith(f"# HELP {name} ")
+            assert lines[index + 1].startswith(name)
+
+
+def test_histogram_buckets_sum_and_count(engine, metrics):
+    run_procedure(engine, metrics)
+    samples = parse_samples(engine.format_metrics())
+    labels = 'command="goto"'
+    buckets = [samples[f'procbot_stage_duration_seconds_bucket{{{labels},le="{bound}"}}']
+               for bound in engine.METRIC_BUCKETS + ("+Inf",)]
+    assert buckets == sorted(buckets)
+    assert buckets[-1] == samples[f"procbot_stage_duration_seconds_count{{{labels}}}"] == 1
+    assert samples[f"procbot_stage_duration_seconds_sum{{{labels}}}"] >= 0
+
+
+def test_counters_and_gauges(engine, metrics):
+    run_procedure(engine, metrics)
+    samples = parse_samples(engine.format_metrics())
+    assert samples['procbot_element_lookups_total{function="get_elements_batch",result="found"}'] == 1
+    assert samples['procbot_element_lookups_total{function="get_elements_batch",result="missing"}'] == 1
+    assert samples['procbot_call_duration_seconds_count{function="get_web_driver"}'] == 1
+    assert samples["procbot_browsers_live"] == 1
+
+
+def test_stage_errors_are_counted(engine, metrics):
+    with pytest.raises(ZeroDivisionError):
+        engine.exec_proc_from_source("var lorem 1/0\n")
+    samples = parse_samples(engine.format_metrics())
+    assert samples['procbot_stage_errors_total{command="var"}'] == 1
+    assert samples['procbot_stage_duration_seconds_count{command="var"}'] == 1
+
+
+def test_label_values_are_escaped(engine, metrics):
+    engine.increment_metric(("procbot_stage_errors_total", (("command", 'lorem "ipsum"\\\n'),)))
+    assert 'procbot_stage_errors_total{command="lorem \\"ipsum\\"\\\\\\n"} 1' in engine.format_metrics()
+
+
+def test_output_file(engine, metrics, tmp_path):
+    output = tmp_path / "metrics.prom"
+    engine.configure_metrics(output=str(output))
+    run_procedure(engine, metrics)
+    engine.write_metrics_at_exit()
+    assert output.read_text() == engine.format_metrics()
+
+
+def test_served_over_http(engine, metrics):
+    engine.configure_metrics(port=0)
+    run_procedure(engine, metrics)
+    port = engine.metrics_settings["server"].server_address[1]
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=10) as response:
+        assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+        assert "procbot_call_duration_seconds_bucket" in response.read().decode("utf-8")
@@ -0,0 +1,111 @@
+# Tests for the network archive, see start_network_archive.
+
+import json
+import os
+import urllib.error
+import urllib.request
+
+import pytest
+
+
+@pytest.fixture
+def archive(engine, tmp_path, monkeypatch):
+
+    # Returns the archive directory, with the archive counters emptied, stopping the
+    # archive and closing the pooled fetch connections afterwards.
+    monkeypatch.setattr(engine, "network_archive_stats", {"recorded": 0, "replayed": 0, "missed": 0, "tunnelled": 0})
+    yield str(tmp_path / "archive")
+    engine.stop_network_archive()
+    engine.close_fetch_connections()
+
+
+@pytest.fixture
+def site():
+
+    # Starts the fixture site, returning its base URL and a function stopping it.
+    from fixture_site import start_fixture_server
+    server, base_url = start_fixture_server()
+    stopped = []
+
+    def stop():
+        if not stopped:
+            server.shutdown()
+            server.server_close()
+            stopped.append(True)
+
+    yield base_url, stop
+    stop()
+
+
+def open_through_proxy(port, url):
+
+    # Requests a URL through the archive proxy, returning the status and body.
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({"http": f"http://127.0.0.1:{port}"}))
+    try:
+        with opener.open(url, timeout=10) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def test_fetch_is_replayed_after_the_site_stops(engine, archive, site):
+    base_url, stop = site
+    engine.start_network_archive(archive, "record")
+    recorded = [engine.fetch_url(None, f"{base_url}/data/{number}.json") for number in (1, 2)]
+    posted = engine.fetch_url(None, f"{base_url}/redirect?to=/data/3.json&status=303", "POST", "a=1")
+    assert engine.stop_network_archive()["recorded"] >= 3
+    engine.close_fetch_connections()
+    stop()
+
+    engine.start_network_archive(archive, "replay")
+    assert [engine.fetch_url(None, f"{base_url}/data/{number}.json") for number in (1, 2)] == recorded
+    assert engine.fetch_url(None, f"{base_url}/redirect?to=/data/3.json&status=303", "POST", "a=1") == posted
+    assert json.loads(recorded[0])["id"] == 1
+    assert engine.network_archive_stats["missed"] == 0
+
+
+def test_replay_miss_fails_without_the_network(engine, archive, site):
+    base_url, _ = site
+    engine.start_network_archive(archive, "record")
+    engine.fetch_url(None, f"{base_url}/data/1.json")
+    engine.stop_network_archive()
+
+    # The site is still running, but a request which was not recorded is not sent to it,
+    # nor is a recorded URL with a different request body.
+    engine.start_network_archive(archive, "replay")
+    assert engine.fetch_url(None, f"{base_url}/data/2.json") is None
+    assert engine.fetch_url(None, f"{base_url}/data/1.json", "POST", "a=1") is None
+    assert engine.network_archive_stats["missed"] == 2
+    assert engine.network_archive_stats["replayed"] == 0
+
+
+def test_identical_bodies_are_stored_once(engine, archive, site):
+    base_url, _ = site
+    engine.start_network_archive(archive, "record")
+    engine.fetch_url(None, f"{base_url}/data/1.json")
+    engine.fetch_url(None, f"{base_url}/data/1.json?lorem=ipsum")
+    engine.stop_network_archive()
+
+    with open(os.path.join(archive, "index.jsonl"), encoding="utf-8") as file:
+        entries = [json.loads(line) for line in file]
+    assert len(entries) == 2
+    assert entries[0]["body"] == entries[1]["body"]
+    assert sum(len(files) for _, _, files in os.walk(os.path.join(archive, "bodies"))) == 1
+
+
+def test_proxy_records_and_replays(engine, archive, site):
+    base_url, stop = site
+    port = engine.start_network_archive(archive, "record")
+    status, recorded = open_through_proxy(port, f"{base_url}/data/5.json")
+    assert status == 200
+    engine.stop_network_archive()
+    stop()
+
+    port = engine.start_network_archive(archive, "replay")
+    assert open_through_proxy(port, f"{base_url}/data/5.json") == (200, recorded)
+    assert open_through_proxy(port, f"{base_url}/data/6.json")[0] == 502
+
+
+def test_unknown_mode(engine, archive):
+    with pytest.raises(ValueError, match="Unknown network archive mode"):
+        engine.start_network_archive(archive, "lorem")
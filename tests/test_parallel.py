@@ -0,0 +1,51 @@
+# Tests for parallel blocks, see exec_parallel_block.
+
+import time
+
+import pytest
+
+
+def test_branches_copy_back_their_variables(engine, fake_browser, fixture_site):
+    engine.exec_proc_from_source("\n".join([
+        "parallel",
+        "branch first",
+        "    start Fake",
+        f'    goto "{fixture_site}/page/1"',
+        '    var title "one"',
+        "branch second",
+        "    start Fake",
+        f'    goto "{fixture_site}/page/2"',
+        '    var title "two"',
+        "end",
+        "session second",
+    ]) + "\n")
+
+    assert engine.variable_dictionary["first.title"] == "one"
+    assert engine.variable_dictionary["second.title"] == "two"
+    assert len(fake_browser) == 2
+    assert engine.variable_dictionary["first.browser"].current_url == f"{fixture_site}/page/1"
+    assert engine.variable_dictionary["browser"] is engine.variable_dictionary["second.browser"]
+    assert "title" not in engine.variable_dictionary
+
+
+def test_branches_run_at_the_same_time(engine, monkeypatch):
+    monkeypatch.setattr(engine, "process_wait", time.sleep)
+    start_time = time.perf_counter()
+    engine.exec_proc_from_source("parallel\nbranch first\n    wait 0.3\nbranch second\n    wait 0.3\nend\n")
+    assert time.perf_counter() - start_time < 0.55
+
+
+def test_failed_branch_does_not_stop_the_others(engine, tmp_path):
+    source = "\n".join([
+        "parallel",
+        "branch broken",
+        f'    foreach row in "{tmp_path / "missing.csv"}"',
+        '        var lorem "ipsum"',
+        "    end",
+        "branch working",
+        '    var dolor "sit"',
+        "end",
+    ]) + "\n"
+    with pytest.raises(RuntimeError, match="Parallel branches failed - broken: FileNotFoundError"):
+        engine.exec_proc_from_source(source)
+    assert engine.variable_dictionary["working.dolor"] == "sit"
@@ -0,0 +1,33 @@
+# Tests for the translation of procedure lines into Python, see parse_proc_components.
+
+import pytest
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("waitfor ready", "wait_for_page_ready(browser)"),
+    ("waitfor ready 5", "wait_for_page_ready(browser, 5)"),
+    ('waitfor url "/results"', "wait_for_url(browser, \"/results\")"),
+    ('waitfor title [var]title 3', "wait_for_title(browser, variable_dictionary['title'], 3)"),
+    ('waitfor visible css ".result"', "wait_for_element(browser, 'visible', 'css', \".result\")"),
+    ('waitfor clickable id "submit" 2', "wait_for_element(browser, 'clickable', 'id', \"submit\", 2)"),
+])
+def test_waitfor(engine, line, expected):
+    assert engine.parse_waitfor(engine.preserve_quote_string(line)) == expected
+
+
+@pytest.mark.parametrize("line", [
+    "waitfor",
+    "waitfor url",
+    "waitfor title",
+    "waitfor visible",
+    "waitfor present id",
+    "waitfor ready 5 6",
+    'waitfor url "/results" 5 6',
+    'waitfor present id "submit" 5 6',
+    'waitfor present tag "div"',
+    'waitfor hidden id "submit"',
+])
+def test_malformed_waitfor(engine, line):
+    assert engine.parse_waitfor(engine.preserve_quote_string(line)) is None
+    with pytest.raises(ValueError, match="test.proc:1: Unable to compile line"):
+        engine.compile_proc_source(line + "\n", "test.proc")
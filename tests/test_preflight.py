@@ -0,0 +1,137 @@
+# Tests for the preflight checker, see check_proc_source and preflight_proc_file.
+
+import os
+
+import pytest
+
+
+@pytest.fixture
+def logged(engine, monkeypatch):
+
+    # Records the log entries made instead of writing them.
+    entries = []
+    monkeypatch.setattr(engine, "log_entry", lambda type, message, **fields: entries.append((type, message)))
+    return entries
+
+
+def check(engine, lines, variables=()):
+    return engine.check_proc_source(lines, "test.proc", variables)
+
+
+def test_valid_procedure(engine, logged):
+    lines = [
+        'var target_uri "https://lorem.ipsum/"',
+        "start Chrome fast",
+        "goto [var]target_uri",
+        "waitfor ready",
+        'waitfor visible id "searchbox_input" 5',
+        'gi search_box "searchbox_input"',
+        'type search_box "Lorem ipsum"',
+        "quit",
+    ]
+    assert check(engine, lines) == []
+    assert logged == []
+
+
+@pytest.mark.parametrize("line, message", [
+    ("waitfor url", "Invalid waitfor line: waitfor url"),
+    ("waitfor title", "Invalid waitfor line: waitfor title"),
+    ("waitfor visible", "Invalid waitfor line: waitfor visible"),
+    ("waitfor present id", "Invalid waitfor line: waitfor present id"),
+    ('waitfor present tag "div"', 'Invalid waitfor line: waitfor present tag "div"'),
+    ("waitfor ready 5 6", "Invalid waitfor line: waitfor ready 5 6"),
+    ("start Chrome bogus", "Unrecognised start option: bogus"),
+    ("start Chrome window='wide'", "Unrecognised start option: window='wide'"),
+])
+def test_malformed_line(engine, logged, line, message):
+    problems = check(engine, ["start Chrome", line, "quit"] if not line.startswith("start") else [line, "quit"])
+    assert (2 if not line.startswith("start") else 1, message) in problems
+    assert logged == []
+
+
+@pytest.mark.parametrize("line, message", [
+    ("start", "start takes at least 1 argument, got 0"),
+    ("goto", "goto takes 1 argument, got 0"),
+    ("quit now", "quit takes 0 arguments, got 1"),
+    ('var lorem', "var takes 2 arguments, got 1"),
+    ("fetch page", "fetch takes at least 2 arguments, got 1"),
+    ("waitfor", "waitfor takes 1 to 4 arguments, got 0"),
+])
+def test_argument_counts(engine, line, message):
+    assert (1, message) in check(engine, [line])
+
+
+def test_names_and_blocks(engine):
+    problems = check(engine, [
+        "goto [var]target_uri",
+        "start Chrome",
+        "type search_box [var]query",
+        "lookup",
+        "parallel",
+        "end",
+        "foreach row in [var]inputs",
+        "    goto [var]row.url",
+        "quit",
+        "goto [var]target_uri",
+    ], variables=["query", "inputs"])
+    assert problems == [
+        (1, "Undefined variable: [var]target_uri"),
+        (1, "goto needs a browser, but no browser has been started"),
+        (3, "type on search_box, which has not been assigned"),
+        (4, "Unknown command: lookup"),
+        (7, "Block is missing its end"),
+        (10, "Undefined variable: [var]target_uri"),
+        (10, "goto needs a browser, but no browser has been started"),
+    ]
+
+
+def test_unterminated_quote(engine):
+    assert check(engine, ['goto "https://lorem.ipsum/']) == [(1, "Unterminated quoted string at column 6")]
+
+
+def test_preflight_raises_with_every_problem(engine, write_proc):
+    path = write_proc(["start Chrome", "waitfor url", "goto [var]target_uri", "quit"])
+    with pytest.raises(ValueError) as error:
+        engine.preflight_proc_file(path)
+    assert str(error.value).splitlines() == [
+        f"{path} failed preflight checks with 2 problems:",
+        f"{path}:2: Invalid waitfor line: waitfor url",
+        f"{path}:3: Undefined variable: [var]target_uri",
+    ]
+
+
+def test_preflight_result_is_cached_on_disk(engine, write_proc, monkeypatch):
+    path = write_proc(["start Chrome", "goto [var]target_uri", "quit"])
+    engine.preflight_proc_file(path, ["target_uri"])
+    assert any(name.endswith(".check") for name in os.listdir(engine.proc_cache_directory))
+
+    # A new process has an empty memory cache, so only the disk cache can avoid the check. 
+    monkeypatch.setattr(engine, "checked_programs", {})
+    monkeypatch.setattr(engine, "check_proc_source", lambda *args: pytest.fail("checked again"))
+    engine.preflight_proc_file(path, ["target_uri"])
+
+    # A different set of variables is a different check. 
+    monkeypatch.setattr(engine, "check_proc_source", lambda *args: [(2, "checked again")])
+    with pytest.raises(ValueError, match="checked again"):
+        engine.preflight_proc_file(path, ["target_uri", "query"])
+
+
+def test_load_proc_file_reads_once(engine, write_proc, monkeypatch):
+    path = write_proc(["start Chrome", "quit"])
+    opened = []
+    real_open = open
+    monkeypatch.setattr("builtins.open", lambda file, *args, **kwargs: opened.append(file) or real_open(file, *args, **kwargs))
+    program, digest = engine.load_proc_file(path)
+    assert [stage[1] for stage in program] == ["start", "quit"]
+    assert opened.count(path) == 1
+
+
+def test_browser_from_earlier_procedure(engine, fake_browser, fixture_site, write_proc):
+    first = write_proc(["start Fake"], "first.proc")
+    second = write_proc([f'goto "{fixture_site}/page/1"', 'gi link "next"', "quit"], "second.proc")
+    engine.exec_proc_from_file(first)
+    engine.exec_proc_from_file(second)
+
+    assert len(fake_browser) == 1
+    assert fake_browser[0].current_url == f"{fixture_site}/page/1"
+    assert check(engine, ["goto [var]target_uri"], ["target_uri", "browser"]) == []
@@ -0,0 +1,37 @@
+# Tests for the procedure line tokeniser, see tokenise_proc_line.
+
+import pytest
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("quit", [("quit", 1)]),
+    ('  type [var]search_box "lorem ipsum"  ', [("type", 3), ("[var]search_box", 8), ('"lorem ipsum"', 24)]),
+    ("goto\t'https://lorem.ipsum/'", [("goto", 1), ("'https://lorem.ipsum/'", 6)]),
+    ("""var text 'say "dolor" twice'""", [("var", 1), ("text", 5), ("""'say "dolor" twice'""", 10)]),
+    (r'var text "say \"dolor\" twice"', [("var", 1), ("text", 5), (r'"say \"dolor\" twice"', 10)]),
+    ('fetch page "https://lorem.ipsum/" post="a=1 b=2"', [("fetch", 1), ("page", 7), ('"https://lorem.ipsum/"', 12), ('post="a=1 b=2"', 35)]),
+    ('var empty ""', [("var", 1), ("empty", 5), ('""', 11)]),
+    ("   ", []),
+])
+def test_tokens_and_columns(engine, line, expected):
+    tokens = engine.tokenise_proc_line(line, 7)
+    assert [(text, column) for text, _, column in tokens] == expected
+    assert all(line_number == 7 for _, line_number, _ in tokens)
+    assert engine.preserve_quote_string(line) == [text for text, _ in expected]
+
+
+@pytest.mark.parametrize("line, column", [
+    ('type [var]search_box "lorem ipsum', 22),
+    ("goto 'https://lorem.ipsum/", 6),
+    (r'var text "escaped \"', 10),
+])
+def test_unterminated_quote(engine, line, column):
+    with pytest.raises(SyntaxError) as error:
+        engine.tokenise_proc_line(line, 4, "test.proc")
+    assert error.value.args == ("Unterminated quoted string", ("test.proc", 4, column, line))
+
+
+def test_unterminated_quote_in_procedure(engine):
+    with pytest.raises(SyntaxError) as error:
+        engine.compile_proc_source('start Chrome\ngoto "https://lorem.ipsum/\nquit\n', "test.proc")
+    assert (error.value.filename, error.value.lineno) == ("test.proc", 2)
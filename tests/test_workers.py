@@ -0,0 +1,73 @@
+# Tests for the batch and daemon worker processes, see run_many and start_proc_daemon.
+
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+# Starts a daemon with two workers, gives one a long job, prints the worker process IDs 
+# and then waits to be killed.
+DAEMON_SCRIPT = (
+    "import sys, time\n"
+    "sys.path.insert(0, sys.argv[1])\n"
+    "import browser_engine as be\n"
+    "be.PARENT_POLL_INTERVAL = 0.1\n"
+    "daemon = be.start_proc_daemon(workers=2, allow_source=True)\n"
+    "be.submit_daemon_job(daemon, {'source': 'wait 60\\n'})\n"
+    "while len(daemon['pool']) < 2 or daemon['pool'][0]['task'] is None:\n"
+    "    time.sleep(0.05)\n"
+    "print(' '.join(str(worker['process'].pid) for worker in daemon['pool']), flush=True)\n"
+    "time.sleep(60)\n"
+)
+
+
+def is_running(pid):
+
+    # Returns whether a process exists and is not a zombie left for its new parent to reap.
+    try:
+        with open(f"/proc/{pid}/stat") as file:
+            return file.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+def test_timeout_replaces_worker(engine):
+    results = engine.run_many([{"path": "slow.proc", "source": "wait 30\n"}, 
+                               {"path": "fast.proc", "source": 'var lorem "ipsum"\n'}], workers=1, timeout=1)
+    assert [result["status"] for result in results] == ["timeout", "ok"]
+    assert "1 second timeout" in results[0]["error"]
+    assert multiprocessing.active_children() == []
+
+
+def test_failing_preflight_is_not_sent_to_a_worker(engine):
+    results = engine.run_many([{"path": "bad.proc", "source": "goto\n"}], workers=1)
+    assert results[0]["status"] == "error"
+    assert multiprocessing.active_children() == []
+
+
+def test_workers_stop_after_batch(engine):
+    results = engine.run_many([{"source": 'var lorem "ipsum"\n'}] * 4, workers=2)
+    assert all(result["status"] == "ok" for result in results)
+    assert multiprocessing.active_children() == []
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc") or not hasattr(signal, "SIGKILL"), reason="needs /proc and SIGKILL")
+def test_workers_exit_when_parent_killed(engine):
+    source_directory = os.path.dirname(os.path.abspath(engine.__file__))
+    environment = dict(os.environ, PROCBOT_CACHE_DIR=engine.proc_cache_directory)
+    parent = subprocess.Popen([sys.executable, "-c", DAEMON_SCRIPT, source_directory], stdout=subprocess.PIPE, text=True, env=environment)
+    try:
+        worker_pids = [int(pid) for pid in parent.stdout.readline().split()]
+        assert len(worker_pids) == 2 and all(is_running(pid) for pid in worker_pids)
+    finally:
+        parent.kill()
+        parent.wait()
+
+    deadline = time.monotonic() + 10
+    while any(is_running(pid) for pid in worker_pids) and time.monotonic() < deadline:
+        time.sleep(0.1)
+    assert not any(is_running(pid) for pid in worker_pids)